@@ -0,0 +1,60 @@
+"""Cold start benchmark of the headless command line entry point.
+
+Times fresh interpreters running cli.py with nothing to download, and
+importing everything a real sync needs, and checks that Qt is never
+loaded. Results are printed as JSON.
+
+Usage: python benchmarks/bench_cli_startup.py [--runs 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                         os.pardir))
+
+CASES = {
+    "python": "pass",
+    "cli_empty": "import cli; cli.main(['--output', os.devnull])",
+    "cli_sync_imports": "import cli, metrics, pytube_code",
+}
+
+# Appended to every case so the run reports what it loaded
+REPORT = "; print(json.dumps(['PyQt5' in sys.modules, len(sys.modules)]))"
+
+
+def run_case(code):
+    """Run code in a new interpreter and return (seconds, qt, modules)"""
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", "import json, os, sys; " + code + REPORT],
+        cwd=REPO_PATH, capture_output=True, text=True, check=True).stdout
+    seconds = time.perf_counter() - start
+    qt_loaded, modules = json.loads(output.strip().splitlines()[-1])
+    return seconds, qt_loaded, modules
+
+
+def main(argv=None):
+    """Time each case and print the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, code in CASES.items():
+        runs = [run_case(code) for _ in range(args.runs)]
+        times = [seconds for seconds, _, _ in runs]
+        results[name] = {"min_seconds": min(times),
+                         "median_seconds": statistics.median(times),
+                         "qt_imported": any(qt for _, qt, _ in runs),
+                         "modules": runs[-1][2]}
+    print(json.dumps({"python": sys.version.split()[0], "runs": args.runs,
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
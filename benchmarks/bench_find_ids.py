@@ -0,0 +1,161 @@
+"""Micro-benchmark of the initial_data walker used for playlist discovery.
+
+Compares pytube_code._find_ids with the recursive version it replaced.
+Pass recorded initial_data JSON files to time them, otherwise a channel
+page shaped fixture is generated.
+
+Usage: python benchmarks/bench_find_ids.py [initial_data.json ...]
+"""
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import pytube_code  # noqa: E402
+
+
+def find_ids_recursive(key, var):
+    """The recursive walker pytube_code used before"""
+    if hasattr(var, 'items'):
+        for k, v in var.items():
+            if k == key:
+                yield v
+            if isinstance(v, dict):
+                for result in find_ids_recursive(key, v):
+                    yield result
+            elif isinstance(v, list):
+                for d in v:
+                    for playlist_id in find_ids_recursive(key, d):
+                        yield playlist_id
+
+
+def channel_fixture(videos=600, playlists=60, seed=350):
+    """Build a tree shaped like a channel page's initial_data"""
+    rng = random.Random(seed)
+
+    def renderer(video_id, playlist_id=None):
+        item = {"gridVideoRenderer": {
+            "videoId": video_id,
+            "thumbnail": {"thumbnails": [
+                {"url": f"https://i.ytimg.com/vi/{video_id}/{size}.jpg",
+                 "width": size, "height": size} for size in (120, 320)]},
+            "title": {"runs": [{"text": f"Video {video_id}"}],
+                      "accessibility": {"accessibilityData": {
+                          "label": f"Video {video_id} 3 minutes"}}},
+            "publishedTimeText": {"simpleText": "2 days ago"},
+            "viewCountText": {"simpleText": "1,000 views"},
+            "badges": [{"metadataBadgeRenderer": {
+                "style": "BADGE_STYLE_TYPE_SIMPLE", "label": "New"}}],
+            "menu": {"menuRenderer": {"items": [
+                {"menuServiceItemRenderer": {
+                    "text": {"runs": [{"text": text}]},
+                    "icon": {"iconType": text.upper()},
+                    "serviceEndpoint": {"signalServiceEndpoint": {
+                        "signal": "CLIENT_SIGNAL", "actions": [
+                            {"addToPlaylistCommand": {
+                                "videoId": video_id,
+                                "videoIds": [video_id]}}]}}}}
+                for text in ("Add to queue", "Save", "Share")]}},
+            "thumbnailOverlays": [
+                {"thumbnailOverlayTimeStatusRenderer": {
+                    "text": {"simpleText": "3:00"}, "style": "DEFAULT"}},
+                {"thumbnailOverlayNowPlayingRenderer": {
+                    "text": {"runs": [{"text": "Now playing"}]}}}],
+            "navigationEndpoint": {"commandMetadata": {
+                "webCommandMetadata": {"url": f"/watch?v={video_id}"}},
+                "watchEndpoint": {"videoId": video_id}},
+            "trackingParams": "x" * 40}}
+        if playlist_id:
+            item["gridVideoRenderer"]["navigationEndpoint"][
+                "watchEndpoint"]["playlistId"] = playlist_id
+        return {"richItemRenderer": {"content": item}}
+
+    items = [renderer(f"v{i:05d}", f"PL{rng.randrange(playlists):04d}"
+                      if rng.random() < 0.3 else None)
+             for i in range(videos)]
+    return {
+        "responseContext": {"serviceTrackingParams": [
+            {"service": "GFEEDBACK", "params": [
+                {"key": str(i), "value": "y" * 20} for i in range(200)]}]},
+        "topbar": {"desktopTopbarRenderer": {"logo": {"icon": "YOUTUBE"}}},
+        "contents": {"twoColumnBrowseResultsRenderer": {"tabs": [
+            {"tabRenderer": {"content": {"sectionListRenderer": {
+                "contents": [{"itemSectionRenderer": {"contents": [
+                    {"gridRenderer": {"items": items}}]}}]}}}}]}},
+        "frameworkUpdates": {"entityBatchUpdate": {"mutations": [
+            {"entityKey": str(i), "payload": {"x": [{"y": i}] * 5}}
+            for i in range(500)]}}}
+
+
+def deep_fixture(depth=5000):
+    """Build a tree nested deeper than the default recursion limit"""
+    data = {"playlistId": "PLdeep"}
+    for _ in range(depth):
+        data = {"contents": [data]}
+    return data
+
+
+def best_time(func, number=10, repeat=7):
+    """Return the fastest run of func in milliseconds"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / \
+        number * 1000
+
+
+def bench(name, data):
+    """Time the old and new walkers on one tree and print the speedup"""
+    skip = pytube_code.CHANNEL_SKIP_KEYS
+    expected = list(find_ids_recursive("playlistId", data))
+    found = list(pytube_code._find_ids("playlistId", data))
+    assert found == expected, "walkers disagree on " + name
+    pruned_found = set(pytube_code._find_ids("playlistId", data, skip))
+    assert pruned_found <= set(expected), "pruning added ids on " + name
+
+    old = best_time(lambda: list(find_ids_recursive("playlistId", data)))
+    new = best_time(lambda: list(pytube_code._find_ids("playlistId",
+                                                       data)))
+    pruned = best_time(lambda: list(pytube_code._find_ids(
+        "playlistId", data, skip)))
+    old_both = best_time(lambda: (
+        list(find_ids_recursive("playlistId", data)),
+        list(find_ids_recursive("videoId", data))))
+    new_both = best_time(lambda: list(pytube_code._walk_keys(
+        ("playlistId", "videoId"), data, skip)))
+
+    print(name)
+    print(f"  playlistId, recursive:        {old:8.2f} ms")
+    print(f"  playlistId, iterative:        {new:8.2f} ms "
+          f"({old / new:.2f}x)")
+    print(f"  playlistId, iterative pruned: {pruned:8.2f} ms "
+          f"({old / pruned:.2f}x)")
+    print(f"  playlistId+videoId, recursive two passes: {old_both:8.2f} ms")
+    print(f"  playlistId+videoId, iterative one pass:   {new_both:8.2f} ms "
+          f"({old_both / new_both:.2f}x)")
+
+
+def bench_deep():
+    """Show the iterative walker handles trees recursion cannot"""
+    data = deep_fixture()
+    try:
+        list(find_ids_recursive("playlistId", data))
+        recursive = "ok"
+    except RecursionError:
+        recursive = "RecursionError"
+    found = list(pytube_code._find_ids("playlistId", data))
+    print(f"depth {5000}: recursive {recursive}, iterative found {found}")
+
+
+def main(paths):
+    """Run the benchmark on the given fixtures or a generated one"""
+    if not paths:
+        bench("generated channel page", channel_fixture())
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as fixture:
+            bench(os.path.basename(path), json.load(fixture))
+    bench_deep()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,69 @@
+"""Time to first paint of the main window, measured in fresh processes.
+
+Each run starts a new interpreter on Qt's offscreen platform in an
+empty folder, builds the window and waits for its first paint. The
+download modules should not be loaded by then. Results are printed as
+JSON.
+
+Usage: python benchmarks/bench_gui_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                         os.pardir))
+
+# Modules that should only load after the window is on screen
+DEFERRED_MODULES = ("pytube", "requests", "pytube_code", "transfer")
+
+RUN = """
+import json, sys
+import main
+from PyQt5 import QtWidgets
+app = QtWidgets.QApplication(sys.argv)
+window = main.Window()
+window.show()
+while window.first_paint_seconds is None:
+    app.processEvents()
+print(json.dumps({"first_paint_seconds": window.first_paint_seconds,
+                  "loaded": [name for name in %r if name in sys.modules]}))
+""" % (DEFERRED_MODULES,)
+
+
+def run_once():
+    """Start the window in a new process and return what it reported"""
+    with tempfile.TemporaryDirectory() as folder:
+        work = os.path.join(folder, "work")
+        os.makedirs(work)
+        env = dict(os.environ, PYTHONPATH=REPO_PATH,
+                   QT_QPA_PLATFORM="offscreen")
+        output = subprocess.run([sys.executable, "-c", RUN], cwd=work,
+                                env=env, capture_output=True, text=True,
+                                check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    """Time several starts and print the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    runs = [run_once() for _ in range(args.runs)]
+    times = [run["first_paint_seconds"] for run in runs]
+    report = {
+        "python": sys.version.split()[0], "runs": args.runs,
+        "first_paint_min_seconds": min(times),
+        "first_paint_median_seconds": statistics.median(times),
+        "loaded_before_paint": sorted({name for run in runs
+                                       for name in run["loaded"]})}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Sharded sync benchmark run against benchmarks/fake_youtube.py.
+
+Syncs a channel cold with 1, 2, 4... processes sharing one job queue, as
+"cli.py --subscriptions --processes N" does, and reports how the videos
+per second grow with the processes. One process starts the sync and
+writes out the playlists at the end, the others join it as
+"cli.py --join" would. Results are printed (or written) as JSON.
+
+Usage: python benchmarks/bench_sharded.py [--processes 1 2 4] [--size 60]
+    [--workers 2] [--latency 0.02] [--bandwidth 262144]
+    [--video-size BYTES] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import bench_sync  # noqa: E402
+import fake_youtube  # noqa: E402
+
+
+def run_worker(role, size, server_url, workers, max_res):
+    """Work through the queue in the current folder's YouTube-Downloads
+    and return the timings. Runs inside the child process."""
+    import pytube_code  # noqa: F401 pylint: disable=unused-import
+    import sync
+
+    fake_youtube.route_pytube_to(server_url)
+    urls, _, _ = bench_sync.workload("channel", size)
+    start = time.perf_counter()
+    if role == "start":
+        sync.sync_links(urls, max_res, workers)
+    else:
+        sync.join_sync(workers)
+    return {"role": role, "seconds": time.perf_counter() - start}
+
+
+def measure(site, processes, size, workers, max_res, folder):
+    """Run one cold sync of the channel workload in folder with the
+    given number of processes"""
+    import jobs
+    import sync
+
+    work = os.path.join(folder, "work")
+    os.makedirs(work, exist_ok=True)
+    urls, expected, _ = bench_sync.workload("channel", size)
+    # Queued before any process starts, so none finds it empty and exits
+    queue = jobs.JobQueue(os.path.join(folder, "YouTube-Downloads",
+                                       "jobs.db"))
+    for url in urls:
+        queue.add(sync.link_key(url), "link", url)
+    queue.set_settings({"max_res": max_res, "incremental": True})
+    queue.close()
+
+    before = site.stats()
+    start = time.perf_counter()
+    children = [subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__),
+         "--run-worker", "start" if number == 0 else "join",
+         "--size", str(size), "--server", site.base_url,
+         "--workers", str(workers), "--max-res", str(max_res)],
+        cwd=work, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        env=dict(os.environ, PYTHONPATH=bench_sync.REPO_PATH))
+        for number in range(processes)]
+    outputs = [child.communicate() for child in children]
+    seconds = time.perf_counter() - start
+    after = site.stats()
+    served = {key: after[key] - before[key] for key in after}
+
+    videos, disk_bytes = bench_sync._downloaded_videos(
+        os.path.join(folder, "YouTube-Downloads"))
+    record = {"processes": processes, "workers": workers, "size": size,
+              "expected_videos": expected, "videos": videos,
+              "disk_bytes": disk_bytes, "seconds": seconds,
+              "videos_per_second": videos / seconds,
+              "requests": served["requests"],
+              "stream_requests": served["stream_requests"],
+              "bytes": served["stream_bytes"]}
+    errors = [stderr.strip().splitlines()[-1:]
+              for child, (_, stderr) in zip(children, outputs)
+              if child.returncode]
+    if errors:
+        record["errors"] = errors
+    return record
+
+
+def main(argv=None):
+    """Parse the options, run each process count and report the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, nargs="+",
+                        default=[1, 2, 4])
+    parser.add_argument("--size", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-res", type=int, default=720)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="seconds before each response")
+    parser.add_argument("--bandwidth", type=int, default=256 * 1024,
+                        help="bytes per second per stream connection")
+    parser.add_argument("--video-size", type=int, default=256 * 1024,
+                        help="bytes in each video's largest stream")
+    parser.add_argument("--output", help="file to write the JSON to")
+    parser.add_argument("--run-worker", choices=("start", "join"),
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--server", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_worker:
+        print(json.dumps(run_worker(args.run_worker, args.size, args.server,
+                                    args.workers, args.max_res)))
+        return
+
+    site = fake_youtube.FakeYouTube(args.latency, args.bandwidth, 0.0,
+                                    args.video_size)
+    _, _, catalog = bench_sync.workload("channel", args.size)
+    for playlist_id, ids in catalog["playlists"].items():
+        site.add_playlist(playlist_id, playlist_id, ids)
+    for name, (ids, playlist_ids) in catalog["channels"].items():
+        site.add_channel(name, ids, playlist_ids)
+    site.start()
+
+    results = []
+    try:
+        for processes in args.processes:
+            with tempfile.TemporaryDirectory() as folder:
+                results.append(measure(site, processes, args.size,
+                                       args.workers, args.max_res, folder))
+    finally:
+        site.stop()
+
+    report = {
+        "commit": bench_sync._commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"latency": args.latency, "bandwidth": args.bandwidth,
+                   "video_size": args.video_size, "workers": args.workers,
+                   "size": args.size, "max_res": args.max_res},
+        "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f_hand:
+            f_hand.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""End to end sync benchmark run against benchmarks/fake_youtube.py.
+
+Times download_link on video, playlist and channel workloads of several
+sizes. Each workload is synced twice in a fresh folder: a cold pass
+that downloads everything and a warm pass that finds it all already
+downloaded. Every pass runs in its own process so its peak RSS is
+measured alone. Results are printed (or written) as JSON so they can be
+compared between commits.
+
+Usage: python benchmarks/bench_sync.py [--sizes 10 50 200]
+    [--workloads video playlist channel] [--workers 4] [--latency 0.02]
+    [--bandwidth BYTES_PER_SECOND] [--error-rate 0.0]
+    [--video-size BYTES] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import fake_youtube  # noqa: E402
+
+REPO_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                         os.pardir))
+
+WORKLOADS = ("video", "playlist", "channel")
+
+DEFAULT_SIZES = (10, 50, 200)
+
+
+def workload(kind, size):
+    """Describe one workload as the urls to sync and the catalog the
+    server needs to answer them"""
+    ids = fake_youtube.video_ids(f"{kind[0]}{size}v", size)
+    catalog = {"playlists": {}, "channels": {}}
+    if kind == "video":
+        urls = [f"https://www.youtube.com/watch?v={video_id}"
+                for video_id in ids]
+    elif kind == "playlist":
+        playlist_id = f"PLbench{size}"
+        catalog["playlists"][playlist_id] = ids
+        urls = [f"https://www.youtube.com/playlist?list={playlist_id}"]
+    else:
+        # Two playlists share a quarter of the channel's uploads each
+        quarter = max(1, size // 4)
+        playlists = {f"PLchannel{size}a": ids[:quarter],
+                     f"PLchannel{size}b": ids[-quarter:]}
+        catalog["playlists"].update(playlists)
+        catalog["channels"][f"bench{size}"] = (ids, list(playlists))
+        urls = [f"https://www.youtube.com/c/bench{size}"]
+    return urls, len(ids), catalog
+
+
+def _peak_rss_kb():
+    """Return this process's peak resident set size in KiB, or None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _downloaded_videos(folder):
+    """Return the number and total size of finished videos in folder,
+    counting a file linked into several folders once"""
+    seen = {}
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.endswith(".mp4"):
+                info = os.stat(os.path.join(root, name))
+                seen[info.st_dev, info.st_ino] = info.st_size
+    return len(seen), sum(seen.values())
+
+
+def run_pass(kind, size, server_url, workers, max_res):
+    """Sync one workload against the server from the current folder and
+    return its timings. Runs inside the child process."""
+    import pytube_code
+
+    fake_youtube.route_pytube_to(server_url)
+    urls, _, _ = workload(kind, size)
+    downloads = os.path.join(os.pardir, "YouTube-Downloads")
+
+    start = time.perf_counter()
+    for url in urls:
+        pytube_code.download_link(url, max_res, workers)
+    seconds = time.perf_counter() - start
+
+    videos, disk_bytes = _downloaded_videos(downloads)
+    return {"videos": videos, "disk_bytes": disk_bytes,
+            "seconds": seconds, "peak_rss_kb": _peak_rss_kb()}
+
+
+def _child(args):
+    """Run one pass and print its result as the only line of JSON"""
+    result = run_pass(args.run_pass, args.size, args.server, args.workers,
+                      args.max_res)
+    print(json.dumps(result))
+
+
+def measure(site, kind, size, workers, max_res, folder):
+    """Run a cold and a warm pass of a workload in folder"""
+    work = os.path.join(folder, "work")
+    os.makedirs(work, exist_ok=True)
+    _, expected, _ = workload(kind, size)
+    results = []
+    for sync_pass in ("cold", "warm"):
+        before = site.stats()
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__),
+             "--run-pass", kind, "--size", str(size),
+             "--server", site.base_url, "--workers", str(workers),
+             "--max-res", str(max_res)],
+            cwd=work, capture_output=True, text=True,
+            env=dict(os.environ, PYTHONPATH=REPO_PATH), check=False)
+        after = site.stats()
+        served = {key: after[key] - before[key] for key in after}
+
+        record = {"workload": kind, "size": size, "pass": sync_pass,
+                  "workers": workers, "expected_videos": expected,
+                  "requests": served["requests"],
+                  "stream_requests": served["stream_requests"],
+                  "errors_injected": served["errors"],
+                  "bytes": served["stream_bytes"]}
+        if process.returncode:
+            record["error"] = process.stderr.strip().splitlines()[-1:]
+        else:
+            timing = json.loads(process.stdout.strip().splitlines()[-1])
+            seconds = timing["seconds"]
+            record.update(timing)
+            record["videos_per_second"] = timing["videos"] / seconds
+            record["bytes_per_second"] = served["stream_bytes"] / seconds
+        results.append(record)
+    return results
+
+
+def _commit():
+    """Return the commit being measured, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_PATH,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    """Parse the options, run each workload and report the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=list(DEFAULT_SIZES))
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS,
+                        default=list(WORKLOADS))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-res", type=int, default=720)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="seconds before each response")
+    parser.add_argument("--bandwidth", type=int, default=None,
+                        help="bytes per second per stream connection")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="chance of a stream response being cut off")
+    parser.add_argument("--video-size", type=int, default=256 * 1024,
+                        help="bytes in each video's largest stream")
+    parser.add_argument("--output", help="file to write the JSON to")
+    parser.add_argument("--run-pass", choices=WORKLOADS,
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--server", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_pass:
+        _child(args)
+        return
+
+    site = fake_youtube.FakeYouTube(args.latency, args.bandwidth,
+                                    args.error_rate, args.video_size)
+    for kind in args.workloads:
+        for size in args.sizes:
+            _, _, catalog = workload(kind, size)
+            for playlist_id, ids in catalog["playlists"].items():
+                site.add_playlist(playlist_id, playlist_id, ids)
+            for name, (ids, playlist_ids) in catalog["channels"].items():
+                site.add_channel(name, ids, playlist_ids)
+    site.start()
+
+    results = []
+    try:
+        for kind in args.workloads:
+            for size in args.sizes:
+                with tempfile.TemporaryDirectory() as folder:
+                    results.extend(measure(site, kind, size, args.workers,
+                                           args.max_res, folder))
+    finally:
+        site.stop()
+
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"latency": args.latency, "bandwidth": args.bandwidth,
+                   "error_rate": args.error_rate,
+                   "video_size": args.video_size, "workers": args.workers,
+                   "max_res": args.max_res},
+        "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f_hand:
+            f_hand.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""A local stand-in for the parts of YouTube the downloader talks to.
+
+Serves synthetic watch pages, the innertube player and browse API,
+playlist and channel pages with their initial_data, a base.js pytube
+can read, and stream bytes with Range support. Latency, bandwidth and
+an error rate can be set so sync can be timed without the live site.
+
+Usage: python benchmarks/fake_youtube.py [--port 8765] [--latency 0.02]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+from pytube import request as pytube_request
+
+# Videos listed per page before a continuation is needed, as on YouTube
+PAGE_SIZE = 100
+
+# Bytes written to the socket at a time when sending a stream
+SEND_SIZE = 64 * 1024
+
+# Hosts whose requests are sent to the local server instead
+YOUTUBE_HOSTS = frozenset({"www.youtube.com", "youtube.com",
+                           "m.youtube.com"})
+
+JS_PATH = "/s/player/bench0001/player_ias.vflset/en_US/base.js"
+
+# The smallest base.js pytube's signature and throttling parsers accept
+BASE_JS = """var Xy={AJ:function(a){a.reverse()}};
+Zz=function(a){a=a.split("");Xy.AJ(a,1);return a.join("")};
+var Bpa=[iha];
+g=function(a){a.C&&(b=a.get("n"))&&(b=Bpa[0](b),a.set("n",b))};
+iha=function(a){var b=a.split(""),c=[1,function(d){d.reverse()},null];\
+try{c[1](c[0])}catch(e){return"x"+a}return b.join("")};
+"""
+
+# Progressive mp4 streams offered for every video, as (itag, share of
+# the full video size)
+STREAM_FORMATS = ((18, 0.5), (22, 1.0))
+
+_FILLER = bytes(range(256)) * (SEND_SIZE // 256)
+
+
+def video_ids(prefix, count):
+    """Make count 11 character video ids starting with prefix"""
+    width = 11 - len(prefix)
+    return [f"{prefix}{i:0{width}d}" for i in range(count)]
+
+
+def _page(**scripts):
+    """Wrap JSON objects in the script tags pytube searches for"""
+    body = "".join(f"<script>var {name} = {json.dumps(value)};</script>"
+                   for name, value in scripts.items())
+    ytcfg = json.dumps({"INNERTUBE_API_KEY": "benchkey"})
+    return (f"<!DOCTYPE html><html><head><script>ytcfg.set({ytcfg});"
+            f"</script><script src=\"{JS_PATH}\"></script></head>"
+            f"<body>{body}</body></html>")
+
+
+def _continuation_item(token):
+    return {"continuationItemRenderer": {"continuationEndpoint": {
+        "continuationCommand": {"token": token}}}}
+
+
+class FakeYouTube:
+    """A threaded HTTP server holding a catalog of synthetic videos,
+    playlists and channels.
+
+    Keyword arguments:
+    latency -- seconds waited before answering each request
+    bandwidth -- bytes per second sent on each stream connection, None
+        for no limit
+    error_rate -- chance of a stream response being cut off partway
+    video_size -- bytes in each video's largest stream
+    port -- port to listen on, 0 for any free port
+    seed -- seed for the errors, so runs can be repeated
+    """
+    def __init__(self, latency=0.0, bandwidth=None, error_rate=0.0,
+                 video_size=256 * 1024, port=0, seed=350):
+        """Create the server; call start() to begin answering."""
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.video_size = video_size
+        self.playlists = {}
+        self.channels = {}
+        self.authors = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "stream_requests": 0,
+                       "stream_bytes": 0, "errors": 0}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port),
+                                           _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """The http://host:port address of the server"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_playlist(self, playlist_id, title, ids):
+        """List videos in a playlist"""
+        self.playlists[playlist_id] = {"title": title, "videos": list(ids)}
+
+    def add_channel(self, name, ids, playlist_ids=()):
+        """Upload videos to a channel at /c/name, newest first"""
+        self.channels[name] = {"videos": list(ids),
+                               "playlists": list(playlist_ids)}
+        for video_id in ids:
+            self.authors[video_id] = name
+
+    def start(self):
+        """Answer requests on a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop answering and close the socket"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        """Return a copy of the counts of what has been served"""
+        with self._lock:
+            return dict(self._stats)
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def cut_point(self, length):
+        """Pick where a stream response of length bytes is cut off, or
+        return length to send all of it"""
+        with self._lock:
+            if length > 1 and self._random.random() < self.error_rate:
+                self._stats["errors"] += 1
+                return self._random.randrange(1, length)
+        return length
+
+    def stream_size(self, itag):
+        for format_itag, share in STREAM_FORMATS:
+            if format_itag == itag:
+                return int(self.video_size * share)
+        return None
+
+    def player_response(self, video_id):
+        """The innertube player answer for a video"""
+        formats = []
+        for itag, share in STREAM_FORMATS:
+            size = int(self.video_size * share)
+            formats.append({
+                "itag": itag,
+                # "signature" in the url means pytube skips deciphering
+                "url": (f"{self.base_url}/videoplayback/{video_id}/{itag}"
+                        f"?signature=bench"),
+                "mimeType": 'video/mp4; codecs="avc1.64001F, mp4a.40.2"',
+                "bitrate": size * 8 // 60,
+                "contentLength": str(size),
+                "qualityLabel": "720p" if itag == 22 else "360p"})
+        return {
+            "playabilityStatus": {"status": "OK"},
+            "videoDetails": {
+                "videoId": video_id,
+                "title": f"Video {video_id}",
+                "author": self.authors.get(video_id, "Bench Channel"),
+                "lengthSeconds": "60",
+                "thumbnail": {"thumbnails": [{
+                    "url": f"{self.base_url}/vi/{video_id}/default.jpg"}]}},
+            "streamingData": {"formats": formats, "adaptiveFormats": []}}
+
+    def watch_page(self, video_id):
+        return _page(ytInitialPlayerResponse={
+            "playabilityStatus": {"status": "OK"},
+            "videoDetails": {"videoId": video_id}})
+
+    def playlist_items(self, playlist_id, offset):
+        """One page of a playlist's videos and the token for the next"""
+        ids = self.playlists[playlist_id]["videos"]
+        items = [{"playlistVideoRenderer": {"videoId": video_id}}
+                 for video_id in ids[offset:offset + PAGE_SIZE]]
+        if offset + PAGE_SIZE < len(ids):
+            items.append(_continuation_item(
+                f"playlist:{playlist_id}:{offset + PAGE_SIZE}"))
+        return items
+
+    def channel_items(self, name, offset):
+        """One page of a channel's uploads and the token for the next"""
+        ids = self.channels[name]["videos"]
+        items = [{"gridVideoRenderer": {"videoId": video_id}}
+                 for video_id in ids[offset:offset + PAGE_SIZE]]
+        if offset + PAGE_SIZE < len(ids):
+            items.append(_continuation_item(
+                f"channel:{name}:{offset + PAGE_SIZE}"))
+        return items
+
+    def playlist_page(self, playlist_id):
+        playlist = self.playlists[playlist_id]
+        return _page(ytInitialData={
+            "contents": {"twoColumnBrowseResultsRenderer": {"tabs": [
+                {"tabRenderer": {"content": {"sectionListRenderer": {
+                    "contents": [{"itemSectionRenderer": {"contents": [
+                        {"playlistVideoListRenderer": {
+                            "contents": self.playlist_items(playlist_id,
+                                                            0)}}]}}]}}}}]}},
+            "sidebar": {"playlistSidebarRenderer": {"items": [
+                {"playlistSidebarPrimaryInfoRenderer": {
+                    "title": {"runs": [{"text": playlist["title"]}]},
+                    "description": {"simpleText": ""}}}]}}})
+
+    def channel_page(self, name, tab):
+        """A channel page, where only the videos tab lists uploads"""
+        channel = self.channels[name]
+        uploads = self.channel_items(name, 0) if tab == "videos" else []
+        playlists = [{"gridPlaylistRenderer": {"playlistId": playlist_id}}
+                     for playlist_id in channel["playlists"]]
+
+        def grid_tab(items):
+            return {"tabRenderer": {"content": {"sectionListRenderer": {
+                "contents": [{"itemSectionRenderer": {"contents": [
+                    {"gridRenderer": {"items": items}}]}}]}}}}
+
+        return _page(ytInitialData={
+            "responseContext": {"serviceTrackingParams": []},
+            "contents": {"twoColumnBrowseResultsRenderer": {"tabs": [
+                grid_tab([]), grid_tab(uploads), grid_tab(playlists)]}},
+            "metadata": {"channelMetadataRenderer": {"title": name}}})
+
+    def continuation(self, token):
+        """The browse API answer for a continuation token"""
+        kind, source, offset = token.rsplit(":", 2)
+        if kind == "playlist":
+            items = self.playlist_items(source, int(offset))
+        else:
+            items = self.channel_items(source, int(offset))
+        return {"onResponseReceivedActions": [
+            {"appendContinuationItemsAction": {"continuationItems": items}}]}
+
+
+def _handler(site):
+    """Make a request handler class answering from site's catalog"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self._answer("GET")
+
+        def do_POST(self):
+            self._answer("POST")
+
+        def _answer(self, method):
+            site.count("requests")
+            if site.latency:
+                time.sleep(site.latency)
+            parts = urlsplit(self.path)
+            query = parse_qs(parts.query)
+            path = parts.path.rstrip("/")
+            body = b""
+            if method == "POST":
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+
+            try:
+                if path.startswith("/videoplayback/"):
+                    self._send_stream(path)
+                elif path == "/watch":
+                    self._send(site.watch_page(query["v"][0]))
+                elif path == "/youtubei/v1/player":
+                    self._send_json(site.player_response(
+                        query["videoId"][0]))
+                elif path == "/youtubei/v1/browse":
+                    self._send_json(site.continuation(
+                        json.loads(body)["continuation"]))
+                elif path == JS_PATH:
+                    self._send(BASE_JS, "text/javascript")
+                elif path == "/playlist":
+                    self._send(site.playlist_page(query["list"][0]))
+                elif path.startswith("/c/"):
+                    name, _, tab = path[3:].partition("/")
+                    self._send(site.channel_page(name, tab))
+                else:
+                    self._send("Not Found", status=404)
+            except (KeyError, ValueError):
+                self._send("Not Found", status=404)
+
+        def _send(self, text, content_type="text/html", status=200):
+            data = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_json(self, value):
+            self._send(json.dumps(value), "application/json")
+
+        def _send_stream(self, path):
+            """Send stream bytes, honouring Range, at the set bandwidth,
+            sometimes dropping the connection partway through"""
+            _, _, video_id, itag = path.split("/")
+            size = site.stream_size(int(itag))
+            if size is None:
+                raise KeyError(itag)
+            site.count("stream_requests")
+
+            start, end = 0, size - 1
+            status = 200
+            byte_range = self.headers.get("Range")
+            if byte_range:
+                first, _, last = byte_range.removeprefix(
+                    "bytes=").partition("-")
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+                if start >= size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = 206
+            length = end + 1 - start
+
+            self.send_response(status)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            if status == 206:
+                self.send_header("Content-Range",
+                                 f"bytes {start}-{end}/{size}")
+            self.end_headers()
+
+            # A cut off response stops somewhere inside the body
+            cut_at = site.cut_point(length)
+
+            sent = 0
+            while sent < cut_at:
+                chunk = _FILLER[:min(SEND_SIZE, cut_at - sent)]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                site.count("stream_bytes", len(chunk))
+                if site.bandwidth:
+                    time.sleep(len(chunk) / site.bandwidth)
+            if cut_at < length:
+                self.close_connection = True
+    return Handler
+
+
+def route_pytube_to(base_url):
+    """Send pytube's requests for YouTube pages to base_url instead.
+
+    Wraps whichever request function pytube has at the time, so the
+    shared connection pool installed by pytube_code is still used.
+    """
+    execute = pytube_request._execute_request
+    base = urlsplit(base_url)
+
+    def rerouted(url, *args, **kwargs):
+        parts = urlsplit(url)
+        if parts.netloc in YOUTUBE_HOSTS:
+            url = urlunsplit((base.scheme, base.netloc, parts.path,
+                              parts.query, parts.fragment))
+        return execute(url, *args, **kwargs)
+
+    pytube_request._execute_request = rerouted
+    return rerouted
+
+
+def main():
+    """Serve a small catalog until interrupted"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=int, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--video-size", type=int, default=256 * 1024)
+    args = parser.parse_args()
+
+    site = FakeYouTube(args.latency, args.bandwidth, args.error_rate,
+                       args.video_size, args.port)
+    ids = video_ids("bench", 250)
+    site.add_playlist("PLbench", "Bench Playlist", ids[:50])
+    site.add_channel("bench", ids, ["PLbench"])
+    site.start()
+    print(f"Serving on {site.base_url}, e.g. {site.base_url}/c/bench/videos")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        site.stop()
+
+
+if __name__ == "__main__":
+    main()
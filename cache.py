@@ -0,0 +1,109 @@
+"""This module is where data is cached on disk between program runs"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from jobs import BUSY_TIMEOUT
+
+# Folder the program keeps its caches in
+CACHE_PATH = os.pardir + "/YouTube-Downloads/.cache/"
+
+# Seconds an entry's access time may lag behind before a read updates it,
+# so a burst of reads from several processes does not write every time
+ACCESS_INTERVAL = 60
+
+
+class PersistentCache:
+    """A key/value store kept in a sqlite file that expires old entries
+    and evicts the least recently used ones once it is full.
+
+    Keyword arguments:
+    file_path -- string of the sqlite file, or ":memory:" for a
+        cache that only lasts as long as the object
+    ttl -- seconds an entry stays valid, None to keep entries forever
+    max_entries -- number of entries kept before eviction starts
+    """
+    def __init__(self, file_path, ttl=None, max_entries=10000):
+        """Open (or create) the cache stored at file_path."""
+        if file_path != ":memory:":
+            folder = os.path.dirname(file_path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+        self.file_path = file_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_path, timeout=BUSY_TIMEOUT,
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed "
+                "ON entries (accessed_at)")
+
+    def get(self, key, default=None):
+        """Return the value stored for key, or default if it is
+        missing or has expired."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, stored_at, accessed_at FROM entries "
+                "WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            value, stored_at, accessed_at = row
+            if self.ttl is not None and now - stored_at > self.ttl:
+                with self._connection:
+                    self._connection.execute(
+                        "DELETE FROM entries WHERE key = ?", (key,))
+                return default
+            if now - accessed_at >= ACCESS_INTERVAL:
+                with self._connection:
+                    self._connection.execute(
+                        "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                        (now, key))
+        return json.loads(value)
+
+    def set(self, key, value):
+        """Store a JSON serializable value under key."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now))
+            overflow = self._connection.execute(
+                "SELECT COUNT(*) FROM entries").fetchone()[0] - \
+                self.max_entries
+            if overflow > 0:
+                self._connection.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM "
+                    "entries ORDER BY accessed_at LIMIT ?)", (overflow,))
+
+    def delete(self, key):
+        """Remove the entry stored under key if there is one."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries WHERE key = ?",
+                                     (key,))
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries")
+
+    def close(self):
+        """Close the underlying sqlite file."""
+        with self._lock:
+            self._connection.close()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM entries").fetchone()[0]
@@ -0,0 +1,257 @@
+"""Sync YouTube links without the window, for cron and headless servers.
+
+Prints a JSON summary when done and exits with 0 if every link synced,
+1 if any failed and 2 if the arguments were wrong. Qt is never
+imported, and pytube and requests are only imported once there is
+something to download, so --help and empty runs start instantly.
+
+Usage: python cli.py [URL ...] [--file URLS.txt] [--subscriptions]
+    [--processes N] [--workers N] [--max-res 720] [--incremental]
+    [--max-rate 2M] [--connections-per-host N] [--metrics FILE]
+    [--output SUMMARY.json]
+       python cli.py --join [--queue JOBS.db] [--workers N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# Set as early as possible so the summary can report the start up cost
+_STARTED = time.perf_counter()
+
+# "YouTube-Downloads" is placed parallel to this folder, as for main.py
+PROGRAM_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+class _DiscardSink:
+    """Lets the metrics counters add up without keeping any records"""
+    def emit(self, record):
+        pass
+
+    def close(self):
+        pass
+
+
+def read_url_file(file_path):
+    """Return the urls in a file, one a line, skipping blank lines and
+    lines starting with #. A path of - reads standard input."""
+    if file_path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(file_path, "r", encoding="utf-8") as f_hand:
+            lines = f_hand.read().splitlines()
+    return [line.strip() for line in lines
+            if line.strip() and not line.lstrip().startswith("#")]
+
+
+def parse_args(argv=None):
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description=__doc__.splitlines()[0])
+    parser.add_argument("urls", nargs="*", metavar="URL",
+                        help="video, playlist or channel link")
+    parser.add_argument("-f", "--file", action="append", default=[],
+                        help="file of links, one a line (- for stdin)")
+    parser.add_argument("-s", "--subscriptions", action="store_true",
+                        help="also sync every subscribed channel")
+    parser.add_argument("-p", "--processes", type=int, default=1,
+                        help="processes sharing the subscription sync")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="videos downloaded at the same time")
+    parser.add_argument("-r", "--max-res", type=int, default=720,
+                        help="highest resolution to download")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="skip channel and playlist videos synced "
+                             "before")
+    parser.add_argument("--max-rate", metavar="RATE",
+                        help="bytes per second for every download of "
+                             "each process, such as 500K or 2M")
+    parser.add_argument("--connections-per-host", type=int, metavar="N",
+                        help="most connections open to one host")
+    parser.add_argument("--join", action="store_true",
+                        help="help with a subscription sync started by "
+                             "another process or host, at its resolution "
+                             "and incremental setting, then exit")
+    parser.add_argument("--queue", metavar="FILE",
+                        help="job queue of the sync, shared by every "
+                             "process (default: YouTube-Downloads/jobs.db)")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write timing spans and counters as JSONL")
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="write the summary here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def limit_transfers(max_rate=None, connections_per_host=None):
+    """Hold every download to a budget, keeping the limits from the
+    environment for any not given
+
+    The limits are also put in the environment, so the worker processes
+    a sync starts are held to the same budget each.
+
+    Keyword arguments:
+    max_rate -- string of the bytes per second, such as "2M"
+    connections_per_host -- int of the most connections open to a host
+    """
+    import transfer
+
+    if max_rate is not None:
+        transfer.parse_rate(max_rate)
+        os.environ[transfer.MAX_RATE_VARIABLE] = max_rate
+    if connections_per_host is not None:
+        if connections_per_host < 1:
+            raise ValueError("--connections-per-host must be at least 1")
+        os.environ[transfer.CONNECTIONS_VARIABLE] = str(connections_per_host)
+    current = transfer.scheduler_from_environment()
+    transfer.configure_scheduler(current.bytes_per_second,
+                                 current.connections_per_host)
+
+
+def sync(urls, max_res, workers=None, incremental=False):
+    """Download every url and return one result dict for each
+
+    Keyword arguments:
+    urls -- list of links to download as given
+    """
+    import pytube_code
+
+    if workers is None:
+        workers = pytube_code.DEFAULT_MAX_WORKERS
+    # Shared by every link, so a video found twice is resolved once
+    downloaded = {}
+    results = []
+    for url in urls:
+        start = time.perf_counter()
+        result = {"url": url}
+        try:
+            message = pytube_code.download_link(url, max_res, workers,
+                                                incremental,
+                                                downloaded=downloaded)
+        except Exception as e:  # pylint: disable=broad-except
+            # One broken link should not stop the rest of the batch
+            result.update(ok=False, error=f"{type(e).__name__}: {e}")
+        else:
+            result.update(ok=message.startswith("Valid"), message=message)
+        result["seconds"] = time.perf_counter() - start
+        results.append(result)
+    return results
+
+
+def sync_subscriptions(max_res, workers=None, processes=1,
+                       queue_path=None):
+    """Sync every subscribed channel through the job queue, resuming an
+    update that was interrupted, and return one result dict for each
+
+    Keyword arguments:
+    processes -- number of processes sharing the jobs
+    queue_path -- string of the job queue file, None for the default
+    """
+    import jobs
+    import subscriptions
+
+    queue = jobs.JobQueue(queue_path or jobs.JOBS_PATH)
+    # Channels share one queue of videos, so there is no time per link
+    return [{"url": url, "ok": message.startswith("Valid"),
+             "message": message}
+            for url, message in subscriptions.fetch_updates(
+                max_res, workers, queue=queue, processes=processes)]
+
+
+def join_sync(workers=None, queue_path=None):
+    """Work on the jobs of a sync started elsewhere, at the resolution
+    it was started with, until none are left, and return the number of
+    jobs in each state"""
+    import jobs
+    import pytube_code
+    import sync
+
+    if workers is None:
+        workers = pytube_code.DEFAULT_MAX_WORKERS
+    return sync.join_sync(workers,
+                          queue=jobs.JobQueue(queue_path or jobs.JOBS_PATH))
+
+
+def main(argv=None):
+    """Run a sync from the command line and return the exit status"""
+    args = parse_args(argv)
+    urls = list(args.urls)
+    try:
+        for file_path in args.file:
+            urls.extend(read_url_file(file_path))
+    except OSError as e:
+        print(f"cli.py: error: {e}", file=sys.stderr)
+        return 2
+
+    if args.max_rate is not None or args.connections_per_host is not None:
+        try:
+            limit_transfers(args.max_rate, args.connections_per_host)
+        except ValueError as e:
+            print(f"cli.py: error: {e}", file=sys.stderr)
+            return 2
+
+    output = args.output and os.path.abspath(args.output)
+    metrics_path = args.metrics and os.path.abspath(args.metrics)
+    queue_path = args.queue and os.path.abspath(args.queue)
+    # Cron starts jobs in the home folder, not next to the program
+    os.chdir(PROGRAM_PATH)
+
+    if args.join:
+        import metrics
+        recorder = metrics.configure_metrics(metrics_path,
+                                             [_DiscardSink()])
+        counts = join_sync(args.workers, queue_path)
+        metrics.configure_metrics()
+        summary = {"jobs": counts,
+                   "seconds": time.perf_counter() - _STARTED,
+                   "counters": recorder.counters()}
+        text = json.dumps(summary, indent=2)
+        if output:
+            with open(output, "w", encoding="utf-8") as f_hand:
+                f_hand.write(text + "\n")
+        else:
+            print(text)
+        return 0 if not counts.get("failed") else 1
+
+    subscribed = []
+    if args.subscriptions:
+        import subscriptions
+        subscribed = subscriptions.subscription_store().urls()
+
+    summary = {"urls": len(urls) + len(subscribed)}
+    results = []
+    counters = {}
+    if urls or subscribed:
+        import metrics
+        import_start = time.perf_counter()
+        import pytube_code  # noqa: F401 pylint: disable=unused-import
+        summary["import_seconds"] = time.perf_counter() - import_start
+
+        recorder = metrics.configure_metrics(metrics_path,
+                                             [_DiscardSink()])
+        results = sync(urls, args.max_res, args.workers, args.incremental)
+        if subscribed:
+            results.extend(sync_subscriptions(args.max_res, args.workers,
+                                              args.processes, queue_path))
+            subscriptions.update_date()
+        counters = recorder.counters()
+        metrics.configure_metrics()
+
+    summary.update(
+        ok=all(result["ok"] for result in results),
+        synced=sum(result["ok"] for result in results),
+        failed=sum(not result["ok"] for result in results),
+        seconds=time.perf_counter() - _STARTED,
+        counters=counters,
+        results=results)
+    text = json.dumps(summary, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f_hand:
+            f_hand.write(text + "\n")
+    else:
+        print(text)
+    return 0 if summary["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
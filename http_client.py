@@ -0,0 +1,152 @@
+"""This module is where the HTTP connections shared by the program
+are pooled"""
+import json
+import socket
+import threading
+from urllib.error import HTTPError, URLError
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+from pytube import request as pytube_request
+
+# Connections kept open to each host
+POOL_SIZE = 16
+
+# Hosts a pool is kept for at the same time
+POOL_HOSTS = 10
+
+# Seconds to wait for a server when the caller gives no timeout
+DEFAULT_TIMEOUT = 30
+
+HEADERS = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+
+
+class _Counter:
+    """A thread safe count of connections opened"""
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.value += 1
+
+
+def _counting_pool(pool_class, counter):
+    """Make a connection pool class that counts the connections it opens"""
+    class CountingPool(pool_class):
+        def _new_conn(self):
+            counter.add()
+            return super()._new_conn()
+    return CountingPool
+
+
+class HTTPClient:
+    """One keep-alive requests.Session shared by metadata, thumbnail and
+    stream requests, so connections (and their TLS handshakes) are made
+    once per host and then reused.
+
+    Keyword arguments:
+    pool_size -- connections kept open to each host
+    """
+    def __init__(self, pool_size=POOL_SIZE):
+        """Create the session and its connection pools."""
+        self.pool_size = pool_size
+        self._opened = _Counter()
+        self._requests = _Counter()
+        adapter = HTTPAdapter(pool_connections=POOL_HOSTS,
+                              pool_maxsize=pool_size)
+        adapter.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self._opened),
+            "https": _counting_pool(HTTPSConnectionPool, self._opened)}
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        """Send a request through the shared session"""
+        self._requests.add()
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """Send a GET request through the shared session"""
+        return self.request("GET", url, **kwargs)
+
+    def stats(self):
+        """Return how many requests were sent and connections opened
+        and reused"""
+        requests_sent = self._requests.value
+        opened = self._opened.value
+        return {"requests": requests_sent,
+                "connections_opened": opened,
+                "connections_reused": max(0, requests_sent - opened)}
+
+    def close(self):
+        """Close every pooled connection"""
+        self.session.close()
+
+
+class _PytubeResponse:
+    """The parts of a urllib response pytube reads"""
+    def __init__(self, response):
+        self._response = response
+        self._read = False
+
+    def read(self, *args):
+        if self._read:
+            return b""
+        self._read = True
+        return self._response.content
+
+    def info(self):
+        return self._response.headers
+
+
+def _execute_request(url, method=None, headers=None, data=None,
+                     timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+    """Stand-in for pytube.request._execute_request using the pool.
+
+    Failures are raised as the urllib errors pytube expects.
+    """
+    if not url.lower().startswith("http"):
+        raise ValueError("Invalid URL")
+    if data and not isinstance(data, bytes):
+        data = bytes(json.dumps(data), encoding="utf-8")
+    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+        timeout = DEFAULT_TIMEOUT
+    try:
+        response = client().request(method or ("POST" if data else "GET"),
+                                    url, headers=headers, data=data,
+                                    timeout=timeout)
+    except requests.RequestException as e:
+        raise URLError(e) from e
+    if response.status_code >= 400:
+        raise HTTPError(url, response.status_code, response.reason,
+                        response.headers, None)
+    return _PytubeResponse(response)
+
+
+_CLIENT = HTTPClient()
+
+
+def client():
+    """Return the client shared by every request"""
+    return _CLIENT
+
+
+def configure_client(pool_size=POOL_SIZE):
+    """Replace the shared client with one keeping pool_size connections
+    open to each host"""
+    global _CLIENT
+    old_client = _CLIENT
+    _CLIENT = HTTPClient(pool_size)
+    old_client.close()
+    return _CLIENT
+
+
+def install_pytube_hook():
+    """Send every pytube request through the shared client"""
+    pytube_request._execute_request = _execute_request
@@ -0,0 +1,275 @@
+"""This module is where the work of a sync is queued on disk, so a sync
+that is stopped partway through carries on where it left off, and
+several processes (on one host or several sharing the folder) can share
+the work"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Database of the jobs of the current sync
+JOBS_PATH = os.pardir + "/YouTube-Downloads/jobs.db"
+
+# States a job moves through
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Times a job is tried before it is left as failed
+MAX_ATTEMPTS = 3
+
+# Seconds a worker holds a job without renewing its lease before another
+# worker may take it over
+LEASE_SECONDS = 30
+
+# Seconds a process waits for another to finish writing to the file
+BUSY_TIMEOUT = 60
+
+_COLUMNS = ("seq", "key", "kind", "url", "parent", "state", "attempts",
+            "result", "error", "owner", "lease_until", "updated_at")
+
+
+class JobQueue:
+    """The jobs of one sync, kept in a sqlite file. Each job has a key
+    that names the work it does, so queueing the same work twice keeps
+    the first job. Every change is committed on its own, so after a
+    crash the queue still says which jobs finished.
+
+    Workers claim a job with a lease they keep renewing while they run
+    it. A job whose lease runs out, because its worker stopped, is
+    claimed again by the next worker that asks.
+
+    Keyword arguments:
+    file_path -- string of the sqlite file, or ":memory:"
+    max_attempts -- times a job is tried before it is left as failed
+    """
+    def __init__(self, file_path=JOBS_PATH, max_attempts=MAX_ATTEMPTS):
+        """Open (or create) the queue stored at file_path."""
+        if file_path != ":memory:":
+            folder = os.path.dirname(file_path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+        self.file_path = file_path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_path, timeout=BUSY_TIMEOUT,
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL UNIQUE,
+                    kind TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    parent TEXT,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    lease_until REAL,
+                    updated_at REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, seq);
+                CREATE INDEX IF NOT EXISTS jobs_parent ON jobs (parent);
+                CREATE TABLE IF NOT EXISTS settings (
+                    name TEXT PRIMARY KEY,
+                    value TEXT);
+            """)
+            # Queues made before jobs had leases
+            columns = {row[1] for row in self._connection.execute(
+                "PRAGMA table_info(jobs)")}
+            for column, column_type in (("owner", "TEXT"),
+                                        ("lease_until", "REAL")):
+                if column not in columns:
+                    self._connection.execute(
+                        f"ALTER TABLE jobs ADD COLUMN {column} "
+                        f"{column_type}")
+
+    def add(self, key, kind, url, parent=None, state=PENDING, result=None):
+        """Queue a job unless one with the same key is already queued.
+
+        Returns True if it was added or False if the key was taken.
+
+        Keyword arguments:
+        key -- string naming the work, such as "video:<video id>"
+        kind -- string of the type of job
+        url -- string of the YouTube link the job works on
+        parent -- key of the job that queued this one
+        state -- DONE to record work that is already finished
+        result -- JSON serializable result of a finished job
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO jobs (key, kind, url, parent, state, "
+                "result, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, url, parent, state, json.dumps(result),
+                 time.time()))
+            return cursor.rowcount == 1
+
+    def claim(self, owner=None, lease=None):
+        """Mark the oldest pending job, or a running job whose lease has
+        run out, as running and return it, or None if there is no such
+        job
+
+        Keyword arguments:
+        owner -- string naming the worker that will run the job
+        lease -- seconds the worker has to renew its lease in, None for
+            a job that is only given back by recover
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            # Taken before reading so no other process claims the same job
+            self._connection.execute("BEGIN IMMEDIATE")
+            # A job that keeps stopping its worker is not handed out again
+            self._connection.execute(
+                "UPDATE jobs SET state = ?, error = ?, updated_at = ? "
+                "WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, "Lease expired", now, RUNNING, now,
+                 self.max_attempts))
+            row = self._connection.execute(
+                "SELECT key FROM jobs WHERE state = ? OR (state = ? AND "
+                "lease_until < ?) ORDER BY seq LIMIT 1",
+                (PENDING, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, "
+                "owner = ?, lease_until = ?, updated_at = ? WHERE key = ?",
+                (RUNNING, owner, None if lease is None else now + lease,
+                 now, row[0]))
+            return self._get(row[0])
+
+    def renew(self, owner, lease):
+        """Extend the lease on every job a worker is running, and return
+        how many there were"""
+        now = time.time()
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND "
+                "state = ?", (now + lease, owner, RUNNING)).rowcount
+
+    def complete(self, key, result=None):
+        """Record that a job finished, with its result"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = NULL, "
+                "updated_at = ? WHERE key = ?",
+                (DONE, json.dumps(result), time.time(), key))
+
+    def fail(self, key, error, owner=None):
+        """Record that a job stopped with an error. It is queued again
+        until it has been tried max_attempts times.
+
+        Returns the job's new state, or None if there is no such job or
+        owner is given and no longer holds the job.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            row = self._connection.execute(
+                "SELECT attempts, owner, state FROM jobs WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            attempts, job_owner, state = row
+            if owner is not None and (job_owner != owner or
+                                      state != RUNNING):
+                # Its lease ran out and another worker took it over
+                return None
+            state = PENDING if attempts < self.max_attempts else FAILED
+            self._connection.execute(
+                "UPDATE jobs SET state = ?, error = ?, updated_at = ? "
+                "WHERE key = ?", (state, error, time.time(), key))
+        return state
+
+    def recover(self):
+        """Queue again the jobs claimed without a lease and left running
+        by a sync that stopped without finishing them, and return how
+        many there were
+
+        Jobs with a lease are left to run out, as their worker may be
+        another process that is still running them.
+        """
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE state = ? "
+                "AND lease_until IS NULL",
+                (PENDING, time.time(), RUNNING)).rowcount
+
+    def get(self, key):
+        """Return a dict describing a job, or None"""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        row = self._connection.execute(
+            "SELECT " + ", ".join(_COLUMNS) + " FROM jobs WHERE key = ?",
+            (key,)).fetchone()
+        return None if row is None else _job(row)
+
+    def jobs(self, kind=None, state=None, parent=None):
+        """Return the jobs matching every given filter in the order they
+        were queued"""
+        filters = [(column, value) for column, value in
+                   (("kind", kind), ("state", state), ("parent", parent))
+                   if value is not None]
+        where = " AND ".join(column + " = ?" for column, _ in filters)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT " + ", ".join(_COLUMNS) + " FROM jobs" +
+                (" WHERE " + where if where else "") + " ORDER BY seq",
+                [value for _, value in filters]).fetchall()
+        return [_job(row) for row in rows]
+
+    def counts(self, kind=None):
+        """Return a dict of the number of jobs in each state"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT state, COUNT(*) FROM jobs" +
+                (" WHERE kind = ?" if kind is not None else "") +
+                " GROUP BY state", () if kind is None else (kind,)).fetchall()
+        return dict(rows)
+
+    def unfinished(self):
+        """Return the number of jobs pending or running"""
+        counts = self.counts()
+        return counts.get(PENDING, 0) + counts.get(RUNNING, 0)
+
+    def settings(self):
+        """Return a dict of the settings the sync was started with"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT name, value FROM settings").fetchall()
+        return {name: json.loads(value) for name, value in rows}
+
+    def set_settings(self, settings):
+        """Record the settings a sync is started with, so processes
+        joining it work the same way
+
+        Keyword arguments:
+        settings -- dict of JSON serializable values
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO settings (name, value) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                [(name, json.dumps(value))
+                 for name, value in settings.items()])
+
+    def clear(self):
+        """Remove every job and setting, ready for a new sync"""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM jobs")
+            self._connection.execute("DELETE FROM settings")
+
+    def close(self):
+        """Close the underlying sqlite file."""
+        with self._lock:
+            self._connection.close()
+
+
+def _job(row):
+    job = dict(zip(_COLUMNS, row))
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
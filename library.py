@@ -0,0 +1,200 @@
+"""This module is where the record of downloaded videos and playlists
+is kept"""
+import os
+import sqlite3
+import threading
+import time
+from jobs import BUSY_TIMEOUT
+
+# Database of everything that has been downloaded
+LIBRARY_PATH = os.pardir + "/YouTube-Downloads/library.db"
+
+
+class Library:
+    """An indexed record of downloaded videos and the playlists they
+    belong to. Every change is written in its own transaction so the
+    record stays correct if the program stops partway through a download.
+
+    Keyword arguments:
+    file_path -- string of the sqlite file, or ":memory:"
+    """
+    def __init__(self, file_path=LIBRARY_PATH):
+        """Open (or create) the library stored at file_path."""
+        if file_path != ":memory:":
+            folder = os.path.dirname(file_path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_path, timeout=BUSY_TIMEOUT,
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS videos (
+                    video_id TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    author_folder TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    downloaded_at REAL NOT NULL,
+                    updated_at REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS videos_path ON videos (path);
+                CREATE TABLE IF NOT EXISTS playlists (
+                    playlist_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    updated_at REAL NOT NULL);
+                CREATE TABLE IF NOT EXISTS playlist_entries (
+                    playlist_id TEXT NOT NULL,
+                    entry TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    added_at REAL NOT NULL,
+                    PRIMARY KEY (playlist_id, entry));
+                CREATE INDEX IF NOT EXISTS playlist_entries_position
+                    ON playlist_entries (playlist_id, position);
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    source TEXT PRIMARY KEY,
+                    video_id TEXT NOT NULL,
+                    updated_at REAL NOT NULL);
+            """)
+
+    def record_video(self, video_id, path, author_folder, size):
+        """Record that a video finished downloading.
+
+        Keyword arguments:
+        video_id -- string of the YouTube video id
+        path -- string of the video's path inside "YouTube-Downloads"
+        author_folder -- string of the folder named after the author
+        size -- int of the file size in bytes
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO videos (video_id, path, author_folder, size, "
+                "downloaded_at, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (video_id) DO UPDATE SET path = excluded.path, "
+                "author_folder = excluded.author_folder, "
+                "size = excluded.size, updated_at = excluded.updated_at",
+                (video_id, path, author_folder, size, now, now))
+
+    def get_video(self, video_id):
+        """Return a dict describing a downloaded video, or None"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT video_id, path, author_folder, size, downloaded_at, "
+                "updated_at FROM videos WHERE video_id = ?",
+                (video_id,)).fetchone()
+        if row is None:
+            return None
+        keys = ("video_id", "path", "author_folder", "size",
+                "downloaded_at", "updated_at")
+        return dict(zip(keys, row))
+
+    def has_video(self, video_id):
+        """Check if a video has been downloaded before"""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT 1 FROM videos WHERE video_id = ?",
+                (video_id,)).fetchone() is not None
+
+    def add_playlist(self, playlist_id, title):
+        """Record a playlist, updating its title if it changed"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO playlists (playlist_id, title, updated_at) "
+                "VALUES (?, ?, ?) ON CONFLICT (playlist_id) DO UPDATE SET "
+                "title = excluded.title, updated_at = excluded.updated_at",
+                (playlist_id, title, time.time()))
+
+    def has_playlist(self, playlist_id):
+        """Check if a playlist has been recorded before"""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT 1 FROM playlists WHERE playlist_id = ?",
+                (playlist_id,)).fetchone() is not None
+
+    def add_to_playlist(self, playlist_id, entry):
+        """Append an entry to the end of a playlist.
+
+        Returns True if it was added or False if it was already there.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO playlist_entries "
+                "(playlist_id, entry, position, added_at) VALUES (?, ?, "
+                "(SELECT COALESCE(MAX(position), -1) + 1 FROM "
+                "playlist_entries WHERE playlist_id = ?), ?)",
+                (playlist_id, entry, playlist_id, time.time()))
+            return cursor.rowcount == 1
+
+    def in_playlist(self, playlist_id, entry):
+        """Check if an entry is already part of a playlist"""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT 1 FROM playlist_entries WHERE playlist_id = ? AND "
+                "entry = ?", (playlist_id, entry)).fetchone() is not None
+
+    def playlist_entries(self, playlist_id):
+        """Return a playlist's entries in the order they were added"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT entry FROM playlist_entries WHERE playlist_id = ? "
+                "ORDER BY position", (playlist_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def video_playlists(self, video_id):
+        """Return the ids of every playlist a downloaded video is in"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT e.playlist_id FROM playlist_entries e "
+                "JOIN videos v ON v.path = e.entry WHERE v.video_id = ?",
+                (video_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def import_playlist_file(self, playlist_id, title, file_path):
+        """Move a playlist's old .txt file into the library the first time
+        the playlist is seen, keeping the order of its lines"""
+        if self.has_playlist(playlist_id):
+            return
+        self.add_playlist(playlist_id, title)
+        if os.path.isfile(file_path):
+            with open(file_path, "r", encoding="utf-8") as fplaylist:
+                for line in fplaylist:
+                    entry = line.removesuffix("\n")
+                    if entry:
+                        self.add_to_playlist(playlist_id, entry)
+
+    def write_playlist_file(self, playlist_id, file_path):
+        """Generate a playlist's .txt file from the library.
+
+        The file is written next to its final path and then swapped in,
+        so readers never see half of a playlist.
+        """
+        temp_path = file_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as fplaylist:
+            fplaylist.writelines(entry + "\n" for entry in
+                                 self.playlist_entries(playlist_id))
+        os.replace(temp_path, file_path)
+        return file_path
+
+    def get_watermark(self, source):
+        """Return the newest video id already synced from a channel or
+        playlist url, or None if it has never been synced"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT video_id FROM watermarks WHERE source = ?",
+                (source,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_watermark(self, source, video_id):
+        """Record the newest video id synced from a channel or playlist"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO watermarks (source, video_id, updated_at) "
+                "VALUES (?, ?, ?) ON CONFLICT (source) DO UPDATE SET "
+                "video_id = excluded.video_id, "
+                "updated_at = excluded.updated_at",
+                (source, video_id, time.time()))
+
+    def close(self):
+        """Close the underlying sqlite file."""
+        with self._lock:
+            self._connection.close()
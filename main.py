@@ -1,15 +1,432 @@
-"""This module is where the GUI and all its elements are created"""
-from datetime import date
-import os
-import sys
-from sys import platform
-import PyQt5.QtWidgets as Qtw
-import PyQt5.QtGui as Qtg
-import PyQt5.QtCore as Qtc
-import pytube
-import qdarktheme as qdt
-import requests
-import pytube_code
+"""This module is where the GUI and all its elements are created
+
+pytube, requests and the download modules are imported where they are
+first used rather than here, so the window appears before they load.
+"""
+import time
+
+# Taken before anything else is imported to time the first paint from
+_STARTED = time.perf_counter()
+
+# pylint: disable=wrong-import-position
+from collections import OrderedDict  # noqa: E402
+import hashlib  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+from sys import platform  # noqa: E402
+import PyQt5.QtWidgets as Qtw  # noqa: E402
+import PyQt5.QtGui as Qtg  # noqa: E402
+import PyQt5.QtCore as Qtc  # noqa: E402
+import search  # noqa: E402
+import subscriptions  # noqa: E402
+from cache import CACHE_PATH  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+
+# Number of links downloaded at the same time in the background
+DOWNLOAD_THREADS = 3
+
+# Milliseconds closing the window waits for background work to stop.
+# Channel pages and searches being fetched are not cut short, so they
+# finish after the window has gone.
+CLOSE_WAIT_MS = 2000
+
+# Number of thumbnails fetched at the same time
+THUMBNAIL_THREADS = 6
+
+# Number of decoded thumbnails kept in memory
+THUMBNAIL_CACHE_SIZE = 90
+
+# Folder thumbnails are saved in between runs
+THUMBNAIL_PATH = CACHE_PATH + "thumbnails/"
+
+# Number of thumbnails kept on disk. Once there are more, the oldest are
+# removed until only THUMBNAIL_KEEP of the limit is left, so the folder
+# is not listed again for every new thumbnail.
+THUMBNAIL_FILES = 2000
+THUMBNAIL_KEEP = 0.9
+
+# Size thumbnails are scaled to once, when they are loaded
+THUMBNAIL_WIDTH = 400
+THUMBNAIL_HEIGHT = 225
+
+# Height of one search result in the results list
+RESULT_ROW_HEIGHT = 250
+
+
+class DownloadSignals(Qtc.QObject):
+    """Signals a DownloadWorker uses to report back to the window."""
+    started = Qtc.pyqtSignal(str)
+    finished = Qtc.pyqtSignal(str, str)
+    failed = Qtc.pyqtSignal(str, str)
+
+
+class DownloadWorker(Qtc.QRunnable):
+    """Downloads one link on a background thread.
+
+    Keyword arguments:
+    url -- string of the YouTube link to download
+    max_res -- int of the highest resolution to download
+    cancel -- threading.Event that stops the download once set, the
+        videos already transferring at their next chunk
+    """
+    def __init__(self, url, max_res, cancel=None):
+        """Create the worker and the signals it reports through."""
+        super().__init__()
+        self.url = url
+        self.max_res = max_res
+        self.cancel = threading.Event() if cancel is None else cancel
+        self.signals = DownloadSignals()
+
+    def run(self):
+        """Download the link, emitting the result or the error."""
+        import pytube_code
+
+        self.signals.started.emit(self.url)
+        try:
+            message = pytube_code.download_link(
+                self.url, self.max_res, pytube_code.DEFAULT_MAX_WORKERS,
+                cancel=self.cancel)
+        except pytube_code.DownloadCancelled:
+            self.signals.failed.emit(self.url, "Cancelled")
+        except Exception as e:  # pylint: disable=broad-except
+            self.signals.failed.emit(self.url, f"{type(e).__name__}: {e}")
+        else:
+            self.signals.finished.emit(self.url, message)
+
+
+class UpdateSignals(Qtc.QObject):
+    """Signals an UpdateWorker uses to report back to the window."""
+    progress = Qtc.pyqtSignal(int, int, str)
+    finished = Qtc.pyqtSignal(int)
+    cancelled = Qtc.pyqtSignal()
+    failed = Qtc.pyqtSignal(str)
+
+
+class UpdateWorker(Qtc.QRunnable):
+    """Fetches new videos from subscribed channels on a background
+    thread, stopping early if cancelled.
+
+    Keyword arguments:
+    max_res -- int of the highest resolution to download
+    """
+    def __init__(self, max_res):
+        """Create the worker and the signals it reports through."""
+        super().__init__()
+        self.max_res = max_res
+        self.signals = UpdateSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stop after the videos already transferring have finished"""
+        self._cancel.set()
+
+    def run(self):
+        """Sync every subscription and mark today's update as done."""
+        import pytube_code
+
+        try:
+            results = subscriptions.fetch_updates(
+                self.max_res, pytube_code.DEFAULT_MAX_WORKERS,
+                progress=self.signals.progress.emit, cancel=self._cancel)
+        except pytube_code.DownloadCancelled:
+            # Left undated so the update runs again next launch
+            self.signals.cancelled.emit()
+        except Exception as e:  # pylint: disable=broad-except
+            self.signals.failed.emit(f"{type(e).__name__}: {e}")
+        else:
+            subscriptions.update_date()
+            self.signals.finished.emit(len(results))
+
+
+class SearchSignals(Qtc.QObject):
+    """Signals a SearchWorker uses to report a fetched batch."""
+    loaded = Qtc.pyqtSignal(object, int)
+    failed = Qtc.pyqtSignal(object, str)
+
+
+class SearchWorker(Qtc.QRunnable):
+    """Fetches the next batch of search results on a background thread.
+
+    Keyword arguments:
+    results -- search.SearchResults to add the batch to
+    signals -- SearchSignals to report the result through
+    """
+    def __init__(self, results, signals):
+        """Create the worker for one batch."""
+        super().__init__()
+        self.results = results
+        self.signals = signals
+
+    def run(self):
+        """Fetch the batch off the UI thread."""
+        try:
+            added = self.results.fetch_next()
+        except Exception as e:  # pylint: disable=broad-except
+            self.signals.failed.emit(self.results, f"{type(e).__name__}: {e}")
+        else:
+            self.signals.loaded.emit(self.results, added)
+
+
+# Thumbnails saved since the folder was last counted, None until then
+_thumbnail_count = None
+_THUMBNAIL_LOCK = threading.Lock()
+
+
+def _evict_thumbnails():
+    """Note a thumbnail was saved and remove the oldest once there are
+    more than THUMBNAIL_FILES"""
+    global _thumbnail_count
+    with _THUMBNAIL_LOCK:
+        if _thumbnail_count is not None:
+            _thumbnail_count += 1
+            if _thumbnail_count <= THUMBNAIL_FILES:
+                return
+        with os.scandir(THUMBNAIL_PATH) as entries:
+            files = [(entry.stat().st_mtime, entry.path) for entry in entries
+                     if entry.name.endswith(".jpg")]
+        _thumbnail_count = len(files)
+        if _thumbnail_count <= THUMBNAIL_FILES:
+            return
+        files.sort()
+        for _, file_path in files[:len(files) -
+                                  int(THUMBNAIL_FILES * THUMBNAIL_KEEP)]:
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                # Removed by another process sharing the folder
+                pass
+            _thumbnail_count -= 1
+
+
+def fetch_thumbnail(url):
+    """Return a thumbnail's image bytes, reading the disk cache first"""
+    import transfer
+
+    file_path = (THUMBNAIL_PATH +
+                 hashlib.sha1(url.encode("utf-8")).hexdigest() + ".jpg")
+    if os.path.isfile(file_path):
+        with open(file_path, "rb") as f_hand:
+            return f_hand.read()
+
+    data = transfer.fetch(url, job="thumbnails", timeout=5)
+    if not os.path.exists(THUMBNAIL_PATH):
+        os.makedirs(THUMBNAIL_PATH, exist_ok=True)
+    # write then rename so a reader never sees half an image
+    with open(file_path + ".tmp", "wb") as f_hand:
+        f_hand.write(data)
+    os.replace(file_path + ".tmp", file_path)
+    _evict_thumbnails()
+    return data
+
+
+class ThumbnailSignals(Qtc.QObject):
+    """Signals a ThumbnailWorker uses to hand back a decoded image."""
+    loaded = Qtc.pyqtSignal(str, Qtg.QImage)
+    failed = Qtc.pyqtSignal(str)
+
+
+class ThumbnailWorker(Qtc.QRunnable):
+    """Fetches and decodes one thumbnail on a background thread.
+
+    Keyword arguments:
+    url -- string of the thumbnail url
+    signals -- ThumbnailSignals to report the result through
+    """
+    def __init__(self, url, signals):
+        """Create the worker for one thumbnail url."""
+        super().__init__()
+        self.url = url
+        self.signals = signals
+
+    def run(self):
+        """Fetch, decode and scale the image off the UI thread."""
+        import requests
+
+        try:
+            image = Qtg.QImage.fromData(fetch_thumbnail(self.url)).scaled(
+                THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT, Qtc.Qt.KeepAspectRatio,
+                Qtc.Qt.SmoothTransformation)
+        except (requests.RequestException, OSError):
+            self.signals.failed.emit(self.url)
+        else:
+            self.signals.loaded.emit(self.url, image)
+
+
+class PixmapCache:
+    """The most recently used thumbnails, kept decoded in memory.
+
+    Keyword arguments:
+    max_entries -- number of thumbnails kept before the oldest is dropped
+    """
+    def __init__(self, max_entries):
+        """Create an empty cache."""
+        self.max_entries = max_entries
+        self._pixmaps = OrderedDict()
+
+    def get(self, url):
+        """Return the pixmap for url, or None if it is not cached"""
+        pixmap = self._pixmaps.get(url)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(url)
+        return pixmap
+
+    def put(self, url, pixmap):
+        """Add a pixmap, dropping the least recently used if full"""
+        self._pixmaps[url] = pixmap
+        self._pixmaps.move_to_end(url)
+        while len(self._pixmaps) > self.max_entries:
+            self._pixmaps.popitem(last=False)
+
+
+class SearchResultsModel(Qtc.QAbstractListModel):
+    """The results of the current search as rows of a list, with each
+    row's thumbnail fetched in the background the first time the row is
+    drawn.
+
+    Keyword arguments:
+    thumbnail_pool -- QThreadPool thumbnails are fetched on
+    """
+    # Role a row's search.SearchResult is read with
+    RESULT_ROLE = Qtc.Qt.UserRole
+
+    def __init__(self, thumbnail_pool, parent=None):
+        """Create a model with no search in it."""
+        super().__init__(parent)
+        self._results = None
+        self._count = 0
+        self._thumbnail_pool = thumbnail_pool
+        self._thumbnails = PixmapCache(THUMBNAIL_CACHE_SIZE)
+        self._pending_thumbnails = set()
+        # thumbnails that could not be fetched are tried again next search
+        self._failed_thumbnails = set()
+        # rows waiting on each thumbnail url
+        self._thumbnail_rows = {}
+        self._thumbnail_signals = ThumbnailSignals()
+        self._thumbnail_signals.loaded.connect(self.thumbnail_loaded)
+        self._thumbnail_signals.failed.connect(self.thumbnail_failed)
+
+    def set_results(self, results):
+        """Show the rows already loaded for a new search"""
+        self.beginResetModel()
+        self._results = results
+        self._count = len(results)
+        self._thumbnail_rows = {}
+        self._failed_thumbnails.clear()
+        self.endResetModel()
+
+    def rows_loaded(self, results):
+        """Add the rows of results fetched since the last call"""
+        count = len(results)
+        if results is self._results and count > self._count:
+            self.beginInsertRows(Qtc.QModelIndex(), self._count, count - 1)
+            self._count = count
+            self.endInsertRows()
+
+    def rowCount(  # pylint: disable=invalid-name
+            self, parent=Qtc.QModelIndex()):
+        """Return the number of rows loaded"""
+        return 0 if parent.isValid() else self._count
+
+    def data(self, index, role=Qtc.Qt.DisplayRole):
+        """Return what a view asks for about a row"""
+        if not index.isValid() or index.row() >= self._count:
+            return None
+        result = self._results[index.row()]
+        if role == self.RESULT_ROLE:
+            return result
+        if role == Qtc.Qt.DisplayRole:
+            return result.title
+        if role == Qtc.Qt.DecorationRole:
+            pixmap = self._thumbnails.get(result.thumbnail_url)
+            if pixmap is None:
+                self._thumbnail_rows.setdefault(
+                    result.thumbnail_url, set()).add(index.row())
+                self.load_thumbnail(result.thumbnail_url)
+            return pixmap
+        return None
+
+    def prefetch_thumbnails(self, rows):
+        """Start fetching the thumbnails of rows about to be shown"""
+        for row in rows:
+            if row < self._count:
+                url = self._results[row].thumbnail_url
+                if self._thumbnails.get(url) is None:
+                    self.load_thumbnail(url)
+
+    def load_thumbnail(self, url):
+        """Start fetching a thumbnail unless it is already on its way or
+        failed during this search"""
+        if url not in self._pending_thumbnails and \
+                url not in self._failed_thumbnails:
+            self._pending_thumbnails.add(url)
+            self._thumbnail_pool.start(
+                ThumbnailWorker(url, self._thumbnail_signals))
+
+    def thumbnail_loaded(self, url, image):
+        """Cache a fetched thumbnail and redraw the rows showing it"""
+        self._pending_thumbnails.discard(url)
+        self._thumbnails.put(url, Qtg.QPixmap.fromImage(image))
+        for row in self._thumbnail_rows.pop(url, ()):
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qtc.Qt.DecorationRole])
+
+    def thumbnail_failed(self, url):
+        """Leave a thumbnail that could not be fetched blank until the
+        next search"""
+        self._pending_thumbnails.discard(url)
+        self._failed_thumbnails.add(url)
+        self._thumbnail_rows.pop(url, None)
+
+
+class SearchResultDelegate(Qtw.QStyledItemDelegate):
+    """Draws a search result as its thumbnail with the title, channel
+    and length beside it."""
+    def __init__(self, parent=None):
+        """Create the delegate and the font it draws with."""
+        super().__init__(parent)
+        self._font = Qtg.QFont("Times", 20)
+
+    def paint(self, painter, option, index):
+        """Draw one row"""
+        result = index.data(SearchResultsModel.RESULT_ROLE)
+        widget = option.widget
+        style = widget.style() if widget else Qtw.QApplication.style()
+        style.drawPrimitive(Qtw.QStyle.PE_PanelItemViewItem, option,
+                            painter, widget)
+
+        rect = option.rect.adjusted(10, 0, -10, 0)
+        thumbnail = Qtc.QRect(
+            rect.left(), rect.top() + (rect.height() - THUMBNAIL_HEIGHT) // 2,
+            THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT)
+        pixmap = index.data(Qtc.Qt.DecorationRole)
+        if pixmap is None:
+            painter.fillRect(thumbnail, option.palette.alternateBase())
+        else:
+            painter.drawPixmap(
+                thumbnail.left() + (THUMBNAIL_WIDTH - pixmap.width()) // 2,
+                thumbnail.top() + (THUMBNAIL_HEIGHT - pixmap.height()) // 2,
+                pixmap)
+
+        text = rect.adjusted(THUMBNAIL_WIDTH + 30, 0, 0, 0)
+        minute, sec = divmod(result.length, 60)
+        painter.save()
+        painter.setFont(self._font)
+        if option.state & Qtw.QStyle.State_Selected:
+            painter.setPen(option.palette.color(Qtg.QPalette.HighlightedText))
+        else:
+            painter.setPen(option.palette.color(Qtg.QPalette.Text))
+        title = painter.fontMetrics().elidedText(
+            result.title, Qtc.Qt.ElideRight, text.width())
+        painter.drawText(text, Qtc.Qt.AlignLeft | Qtc.Qt.AlignVCenter,
+                         f"{title}\n\nCreated by: {result.author}\n\n"
+                         f"Length: {minute}:{sec:02}")
+        painter.restore()
+
+    def sizeHint(self, option, index):  # pylint: disable=invalid-name
+        """Give every row the same height"""
+        return Qtc.QSize(option.rect.width(), RESULT_ROW_HEIGHT)
 
 
 class Window(Qtw.QWidget):
@@ -31,16 +448,36 @@ class Window(Qtw.QWidget):
         self.center()
 
         # dark mode by default
+        import qdarktheme as qdt
         qdt.setup_theme("dark")
 
+        # time to first paint is recorded once, then background work starts
+        self.first_paint_seconds = None
+        self._update_worker = None
+
         # keep track of theme
         self._theme_number = 0
 
-        # keep track of organized search list for page view
-        self._search_page_view = []
-
-        # keep track of page number
-        self._page_number = 0
+        # results of the current search, fetched a batch at a time
+        self._search_results = None
+        self._search_fetching = None
+        self._search_error = None
+        self._search_pool = Qtc.QThreadPool()
+        self._search_pool.setMaxThreadCount(1)
+        self._search_signals = SearchSignals()
+        self._search_signals.loaded.connect(self.search_loaded)
+        self._search_signals.failed.connect(self.search_failed)
+
+        # run downloads in the background so the window stays responsive
+        self._download_pool = Qtc.QThreadPool()
+        self._download_pool.setMaxThreadCount(DOWNLOAD_THREADS)
+        self._active_downloads = 0
+        # set on close so running downloads stop between videos
+        self._cancel_downloads = threading.Event()
+
+        # load thumbnails in the background and keep recent ones in memory
+        self._thumbnail_pool = Qtc.QThreadPool()
+        self._thumbnail_pool.setMaxThreadCount(THUMBNAIL_THREADS)
 
         # set layout of window
         outer_layout = Qtw.QVBoxLayout()
@@ -115,6 +552,22 @@ class Window(Qtw.QWidget):
         subscribed_button.setFont(Qtg.QFont("Times", 20))
         subscribed_button.clicked.connect(self.switch_to_subscribed)
 
+        # label to show the progress of background downloads
+        self._status_label = Qtw.QLabel("")
+        self._status_label.setFont(Qtg.QFont("Times", 15))
+        outer_layout.addWidget(self._status_label)
+
+        # progress of the daily subscription update, hidden when idle
+        update_layout = Qtw.QHBoxLayout()
+        self._update_label = Qtw.QLabel("")
+        self._update_label.setFont(Qtg.QFont("Times", 15))
+        self._cancel_update_button = Qtw.QPushButton("Cancel update")
+        self._cancel_update_button.clicked.connect(self.cancel_update)
+        self._cancel_update_button.hide()
+        update_layout.addWidget(self._update_label, 1)
+        update_layout.addWidget(self._cancel_update_button)
+        outer_layout.addLayout(update_layout)
+
         # add the widgets to inner top layer
         buttons_layout.addWidget(menu_bar)
         buttons_layout.addWidget(self._search_button)
@@ -163,10 +616,9 @@ class Window(Qtw.QWidget):
         video_gui.setLayout(video_outer_layout)
 
         # create layouts for each element of page
-        # (search line, videos, and page buttons)
+        # (search line, videos, and search status)
         inner_layer1 = Qtw.QHBoxLayout()
-        self._inner_layer2 = Qtw.QVBoxLayout()
-        self._inner_layer3 = Qtw.QHBoxLayout()
+        inner_layer3 = Qtw.QHBoxLayout()
 
         # create search box
         self._search_box = Qtw.QLineEdit()
@@ -183,65 +635,73 @@ class Window(Qtw.QWidget):
         # adjusts first inner layer to the top of the layout
         inner_layer1.setAlignment(Qtc.Qt.AlignTop)
 
+        # list of results that only draws the rows on screen
+        self._search_model = SearchResultsModel(self._thumbnail_pool, self)
+        self._results_view = Qtw.QListView()
+        self._results_view.setModel(self._search_model)
+        self._results_view.setItemDelegate(SearchResultDelegate(self))
+        self._results_view.setUniformItemSizes(True)
+        self._results_view.setVerticalScrollMode(
+            Qtw.QAbstractItemView.ScrollPerPixel)
+        self._results_view.verticalScrollBar().setSingleStep(40)
+        self._results_view.setSelectionMode(
+            Qtw.QAbstractItemView.SingleSelection)
+        self._results_view.clicked.connect(self.result_clicked)
+        self._results_view.verticalScrollBar().valueChanged.connect(
+            lambda value: self.results_scrolled())
+
+        # progress of the search, with a retry button if a fetch failed
+        self._search_status = Qtw.QLabel("")
+        self._retry_button = Qtw.QPushButton("Retry")
+        self._retry_button.clicked.connect(self.retry_search)
+        self._retry_button.hide()
+        inner_layer3.addWidget(self._search_status, 1)
+        inner_layer3.addWidget(self._retry_button)
+
         # add layouts to page
         video_outer_layout.addLayout(inner_layer1, 0)
-        video_outer_layout.addLayout(self._inner_layer2, 9)
-        video_outer_layout.addLayout(self._inner_layer3, 1)
+        video_outer_layout.addWidget(self._results_view, 9)
+        video_outer_layout.addLayout(inner_layer3, 0)
 
         # add page to stackedLayout
         self._stacked.addWidget(video_gui)
 
     def sub_gui(self):
         """Arrange the subscribed channels page."""
-        def append_file(string, file_list):
-            """Appends a string to the next line of a file."""
-            if pytube_code.check_channel_or_playlist_url(string):
-                file_list.append("\n" + string)
-                with open(os.pardir + "/YouTube-Downloads/programInfo.txt",
-                          'w', encoding="utf-8") as f_hand:
-                    f_hand.writelines(file_list)
-                self.clear_window(self._sub_layout)
-                for i in range(0, len(program_info)):
-                    if i == 0:
-                        sub_label = Qtw.QLabel("Subscribed Channels:\n")
-                        sub_label.setFont(Qtg.QFont("Times", 30))
-                        self._sub_layout.addWidget(
-                            sub_label, 1, Qtc.Qt.Alignment(Qtc.Qt.AlignTop))
-                    else:
-                        channel_label = Qtw.QLabel(program_info[i])
-                        channel_label.setFont(Qtg.QFont("Times", 15))
-                        self._sub_layout.addWidget(
-                            channel_label, 1,
-                            Qtc.Qt.Alignment(Qtc.Qt.AlignTop))
+        def add_channel(url):
+            """Subscribe to a channel and list it above the text box."""
+            import pytube_code
+            url = url.strip()
+            if (pytube_code.check_channel_or_playlist_url(url) and
+                    subscriptions.subscription_store().add(url)):
+                channel_label = Qtw.QLabel(url)
+                channel_label.setFont(Qtg.QFont("Times", 15))
+                # The text box row stays last
+                self._sub_layout.insertWidget(
+                    self._sub_layout.count() - 1, channel_label, 1,
+                    Qtc.Qt.Alignment(Qtc.Qt.AlignTop))
 
         sub_gui = Qtw.QWidget()
 
         self._sub_layout = Qtw.QVBoxLayout()
         sub_gui.setLayout(self._sub_layout)
 
-        with open(os.pardir + "/YouTube-Downloads/programInfo.txt",
-                  'r') as f_hand:
-            program_info = f_hand.readlines()
-            f_hand.close()
-
-        for i in range(0, len(program_info)):
-            if i == 0:
-                sub_label = Qtw.QLabel("Subscribed Channels:\n")
-                sub_label.setFont(Qtg.QFont("Times", 30))
-                self._sub_layout.addWidget(sub_label, 1,
-                                           Qtc.Qt.Alignment(Qtc.Qt.AlignTop))
-            else:
-                channel_label = Qtw.QLabel(program_info[i])
-                channel_label.setFont(Qtg.QFont("Times", 15))
-                self._sub_layout.addWidget(channel_label, 1,
-                                           Qtc.Qt.Alignment(Qtc.Qt.AlignTop))
+        sub_label = Qtw.QLabel("Subscribed Channels:\n")
+        sub_label.setFont(Qtg.QFont("Times", 30))
+        self._sub_layout.addWidget(sub_label, 1,
+                                   Qtc.Qt.Alignment(Qtc.Qt.AlignTop))
+        for url in subscriptions.subscription_store().urls():
+            channel_label = Qtw.QLabel(url)
+            channel_label.setFont(Qtg.QFont("Times", 15))
+            self._sub_layout.addWidget(channel_label, 1,
+                                       Qtc.Qt.Alignment(Qtc.Qt.AlignTop))
 
         bottom_label = Qtw.QHBoxLayout()
         channel_box = Qtw.QLineEdit()
         channel_box.setPlaceholderText("Type channel URL here...")
         channel_button = Qtw.QPushButton("Add Channel")
-        text = channel_box.text()
-        channel_button.clicked.connect(lambda: append_file(text, program_info))
+        channel_button.clicked.connect(
+            lambda: add_channel(channel_box.text()))
         bottom_label.addWidget(channel_box)
         bottom_label.addWidget(channel_button)
         self._sub_layout.addLayout(bottom_label)
@@ -251,60 +711,194 @@ class Window(Qtw.QWidget):
     def on_click(self):
         """Perform the download pytube function."""
         if self._url_box.text() != "":
-            pytube_code.download_link(self._url_box.text(), self.resolution)
+            self.start_download(self._url_box.text())
+
+    def start_download(self, url):
+        """Queue a link to be downloaded in the background"""
+        worker = DownloadWorker(url, self._resolution,
+                                self._cancel_downloads)
+        worker.signals.started.connect(self.download_started)
+        worker.signals.finished.connect(self.download_finished)
+        worker.signals.failed.connect(self.download_failed)
+        self._active_downloads += 1
+        self._status_label.setText(f"Queued: {url}")
+        self._download_pool.start(worker)
+
+    def download_started(self, url):
+        """Show that a background download began"""
+        self._status_label.setText(f"Downloading ({self._active_downloads} "
+                                   f"active): {url}")
+
+    def download_finished(self, url, message):
+        """Show the result of a background download"""
+        self._active_downloads -= 1
+        self._status_label.setText(f"Done ({self._active_downloads} "
+                                   f"active): {message}")
+
+    def download_failed(self, url, error):
+        """Show that a background download stopped with an error"""
+        self._active_downloads -= 1
+        self._status_label.setText(f"Failed ({self._active_downloads} "
+                                   f"active): {url} - {error}")
+
+    def paintEvent(self, event):  # pylint: disable=invalid-name
+        """Record the time to first paint and then start the work that
+        was held back so the window could appear quickly"""
+        super().paintEvent(event)
+        if self.first_paint_seconds is None:
+            self.first_paint_seconds = time.perf_counter() - _STARTED
+            metrics().event("app.first_paint",
+                            f"First paint after "
+                            f"{self.first_paint_seconds:.3f}s",
+                            seconds=self.first_paint_seconds)
+            Qtc.QTimer.singleShot(0, self.start_update_check)
+
+    def start_update_check(self):
+        """Fetch new videos from subscribed channels in the background
+        if that has not been done today"""
+        if self._update_worker is not None or not subscriptions.updates_due():
+            return
+        self._update_worker = UpdateWorker(self._resolution)
+        signals = self._update_worker.signals
+        signals.progress.connect(self.update_progress)
+        signals.finished.connect(self.update_finished)
+        signals.cancelled.connect(self.update_cancelled)
+        signals.failed.connect(self.update_failed)
+        self._update_label.setText("Checking subscriptions for new videos")
+        self._cancel_update_button.show()
+        self._download_pool.start(self._update_worker)
+
+    def cancel_update(self):
+        """Stop the subscription update once running videos finish"""
+        if self._update_worker is not None:
+            self._update_worker.cancel()
+            self._cancel_update_button.setEnabled(False)
+            self._update_label.setText("Cancelling subscription update...")
+
+    def update_progress(self, index, total, url):
+        """Show which subscription is being updated"""
+        self._update_label.setText(
+            f"Updating subscriptions ({index + 1}/{total}): {url}")
+
+    def update_finished(self, count):
+        """Show that every subscription is up to date"""
+        self._end_update(f"Subscriptions updated ({count} checked)")
+
+    def update_cancelled(self):
+        """Show that the update stopped early"""
+        self._end_update("Subscription update cancelled")
+
+    def update_failed(self, error):
+        """Show that the update stopped with an error"""
+        self._end_update(f"Subscription update failed: {error}")
+
+    def _end_update(self, text):
+        self._update_worker = None
+        self._update_label.setText(text)
+        self._cancel_update_button.hide()
+        self._cancel_update_button.setEnabled(True)
+
+    def closeEvent(self, event):  # pylint: disable=invalid-name
+        """Drop queued downloads, stop running ones at their next chunk
+        and wait a short while for background work to end"""
+        if self._update_worker is not None:
+            self._update_worker.cancel()
+        self._cancel_downloads.set()
+        self._download_pool.clear()
+        self._thumbnail_pool.clear()
+        deadline = time.monotonic() + CLOSE_WAIT_MS / 1000
+        for pool in (self._download_pool, self._thumbnail_pool,
+                     self._search_pool):
+            pool.waitForDone(max(0, int((deadline - time.monotonic()) *
+                                        1000)))
+        super().closeEvent(event)
 
     def search_click(self):
-        """Create sorted list and shows them on search page"""
+        """Start a new search, showing its cached results straight away
+        or its first batch once it arrives"""
         if self._search_box.text() != "":
-            search_list = pytube.Search(self._search_box.text()).results
-            self.search_page_view = self.page_view_list(search_list)
-            self.show_videos(self.search_page_view)
-
-    def show_videos(self, organized_search_list):
-        """Show videos on search page when clicking go"""
-        if self._inner_layer2.count() > 0:
-            self.clear_window(self._inner_layer2)
-        for video in organized_search_list[self._page_number]:
-            time = self.get_time(video.length)
-            button = Qtw.QPushButton(f"     {video.title}\n\n     "
-                                     f"Created by: {video.author}\n\n   "
-                                     f"  Length: {time[0]}:{time[1]}")
-            button.setFont(Qtg.QFont("Times", 20))
-            pixmap = Qtg.QPixmap()
-            pixmap.loadFromData(requests.get(video.thumbnail_url,
-                                             timeout=5).content)
-            button.setIcon(Qtg.QIcon(pixmap))
-            button.setIconSize(Qtc.QSize(400, 235))
-            button.setStyleSheet("text-align:left;")
-            url = video.watch_url
-            button.clicked.connect(lambda:
-                                   pytube_code.download_link(url,
-                                                             self._resolution))
-            button.setMinimumSize(0, 250)
-            self._inner_layer2.addWidget(button, 1,
-                                         Qtc.Qt.Alignment(Qtc.Qt.AlignTop))
-        prev_button = Qtw.QPushButton("Previous")
-        prev_button.clicked.connect(self.previous_button)
-        nxt_button = Qtw.QPushButton("Next")
-        nxt_button.clicked.connect(self.next_button)
-        self.clear_window(self._inner_layer3)
-        if 0 < self._page_number < len(organized_search_list) - 1:
-            self._inner_layer3.addWidget(prev_button)
-            self._inner_layer3.addWidget(nxt_button)
-        if self._page_number == 0:
-            self._inner_layer3.addWidget(nxt_button)
-        if self._page_number == len(organized_search_list) - 1:
-            self._inner_layer3.addWidget(prev_button)
-
-    def next_button(self):
-        """Next button when searching through videos"""
-        self._page_number += 1
-        self.show_videos(self.search_page_view)
-
-    def previous_button(self):
-        """Back button when searching through videos"""
-        self._page_number -= 1
-        self.show_videos(self.search_page_view)
+            self._search_results = search.SearchResults(
+                self._search_box.text(), cache=search.search_cache())
+            self._search_fetching = None
+            self._search_error = None
+            self._retry_button.hide()
+            self._search_model.set_results(self._search_results)
+            self._results_view.scrollToTop()
+            self.results_scrolled()
+            self.show_search_status()
+
+    def fetch_more_results(self):
+        """Fetch the next batch of the current search in the background"""
+        results = self._search_results
+        if results is not None and not results.exhausted and \
+                self._search_fetching is not results:
+            self._search_fetching = results
+            self._search_error = None
+            self._search_pool.start(
+                SearchWorker(results, self._search_signals))
+
+    def search_loaded(self, results, added):
+        """Add a fetched batch to the list if it belongs to the current
+        search"""
+        if results is not self._search_results:
+            return
+        self._search_fetching = None
+        self._search_model.rows_loaded(results)
+        self.results_scrolled()
+        self.show_search_status()
+
+    def search_failed(self, results, error):
+        """Show that more results could not be fetched"""
+        if results is not self._search_results:
+            return
+        self._search_fetching = None
+        self._search_error = error
+        self._retry_button.show()
+        self.show_search_status()
+
+    def retry_search(self):
+        """Try fetching the next batch again after it failed"""
+        self._search_error = None
+        self._retry_button.hide()
+        self.results_scrolled()
+        self.show_search_status()
+
+    def results_scrolled(self):
+        """Fetch more results, and the thumbnails of the rows below the
+        list, once the list is scrolled close to its last loaded row"""
+        results = self._search_results
+        if results is None:
+            return
+        view = self._results_view
+        index = view.indexAt(view.viewport().rect().bottomLeft())
+        last_row = index.row() if index.isValid() else len(results) - 1
+        if self._search_error is None and \
+                results.wants_more(max(last_row, 0) // results.page_size):
+            self.fetch_more_results()
+        self._search_model.prefetch_thumbnails(
+            range(last_row + 1, last_row + 1 + results.page_size))
+
+    def show_search_status(self):
+        """Show how many results are loaded and if more are coming"""
+        count = len(self._search_results)
+        if self._search_error is not None:
+            text = f"Could not load more results: {self._search_error}"
+        elif self._search_fetching is self._search_results:
+            text = f"{count} results, loading more..."
+        elif self._search_results.exhausted:
+            text = f"{count} results"
+        else:
+            text = f"{count} results, scroll down for more"
+        if self._search_results.cached:
+            # They can be up to search.SEARCH_CACHE_TTL old
+            text += " (saved from an earlier search)"
+        self._search_status.setText(text)
+
+    def result_clicked(self, index):
+        """Download the video of a clicked result"""
+        result = index.data(SearchResultsModel.RESULT_ROLE)
+        if result is not None:
+            self.start_download(result.watch_url)
 
     def set_res(self, res):
         """Set resolution download for videos"""
@@ -324,6 +918,8 @@ class Window(Qtw.QWidget):
 
     def switch_theme(self):
         """Toggle button for switching themes"""
+        import qdarktheme as qdt
+
         # doing the change twice is required to fully change theme
         if self._theme_number == 0:
             qdt.setup_theme("light")
@@ -348,83 +944,9 @@ class Window(Qtw.QWidget):
             print("Windows detected lol")
         os.system("explorer.exe " + os.pardir)
 
-    def clear_window(self, layout):
-        """Clears the videos from search page
-        once we don't need them anymore"""
-        for i in reversed(range(layout.count())):
-            item = layout.itemAt(i)
-            if isinstance(item, Qtw.QWidgetItem):
-                item.widget().close()
-            layout.removeItem(item)
-
-    def page_view_list(self, lov):
-        """Create sorted list of video objects for show_videos to
-        reference from"""
-        num = 0
-        if len(lov) % 3 == 0:
-            num = len(lov) // 3
-        else:
-            num = (len(lov) // 3) + 1
-        new_lst = [[] for i in range(num)]
-        for i in new_lst:
-            for j in range(3):
-                if len(lov) >= 3:
-                    i.append(lov[j])
-                elif len(lov) > 0:
-                    for x in lov:
-                        i.append(x)
-                    break
-                else:
-                    break
-            lov = lov[3:]
-        return new_lst
-
-    def get_time(self, seconds):
-        """
-        Get time in minutes and seconds
-        :param seconds: int
-        :return: minute: int, sec: int
-        """
-        minute = seconds // 60
-        sec = seconds % 60
-        return minute, sec
-
-
-def fetch_updates():
-    """Fetch new videos from channels we are subscribed to"""
-    try:
-        f_hand = open(os.pardir + "/YouTube-Downloads/programInfo.txt", 'r',
-                      encoding="utf-8")
-        program_info = f_hand.readlines()
-    except FileNotFoundError:
-        if not os.path.exists(os.pardir + "/YouTube-Downloads/"):
-            os.makedirs(os.pardir + "/YouTube-Downloads/")
-        f_hand = open(os.pardir + "/YouTube-Downloads/programInfo.txt", 'x',
-                      encoding="utf-8")
-        program_info = [date.today().ctime() + "\n"]
-        f_hand.writelines(program_info)
-    if program_info[0] != date.today().ctime() + "\n":
-        print("Fetching updates!")
-        for i in range(1, len(program_info)):
-            pytube_code.download_link(program_info[i], 720)
-    f_hand.close()
-
-
-def update_date():
-    """Update date in txt file for fetching_updates """
-    with open(os.pardir + "/YouTube-Downloads/programInfo.txt", 'r') as f_hand:
-        program_info = f_hand.readlines()
-    program_info[0] = date.today().ctime() + "\n"
-    with open(os.pardir + "/YouTube-Downloads/programInfo.txt", 'w',
-              encoding="utf-8") as f_hand:
-        f_hand.writelines(program_info)
-        f_hand.close()
-    app.exec_()
-
 
 if __name__ == "__main__":
     app = Qtw.QApplication(sys.argv)
-    fetch_updates()
     window = Window()
     window.show()
-    sys.exit(update_date())
+    sys.exit(app.exec_())
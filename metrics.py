@@ -0,0 +1,195 @@
+"""This module is where timings and counts of the program's work are
+recorded"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Environment variable naming a JSONL file to record to from startup
+METRICS_ENV = "YOUTUBE_DOWNLOADER_METRICS"
+
+# Handed out by span() when nothing is recording
+_NULL_SPAN = nullcontext()
+
+
+class JSONLSink:
+    """Writes each record as one line of JSON, appending to file_path.
+
+    Keyword arguments:
+    file_path -- string of the file to append to
+    """
+    def __init__(self, file_path):
+        """Open file_path for appending."""
+        folder = os.path.dirname(file_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._file = open(file_path, "a", encoding="utf-8")
+
+    def emit(self, record):
+        """Write one record"""
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        """Close the file"""
+        with self._lock:
+            self._file.close()
+
+
+class MemorySink:
+    """Keeps every record in a list, for tests and summaries"""
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def close(self):
+        pass
+
+
+class _Span:
+    """Times one phase and emits it when the phase ends"""
+    def __init__(self, metrics, name, fields):
+        self._metrics = metrics
+        self._name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        record = {"type": "span", "name": self._name,
+                  "start": self._started_at,
+                  "duration": time.perf_counter() - self._start,
+                  "thread": threading.current_thread().name}
+        record.update(self.fields)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        self._metrics.emit(record)
+        return False
+
+
+class Metrics:
+    """Timing spans, counters and events sent to pluggable sinks.
+
+    A sink is any object with emit(record) and close() methods, where
+    record is a JSON serializable dict. With no sinks nothing is
+    recorded and span() hands back a shared do-nothing context, so the
+    instrumented code costs about one method call per phase.
+
+    Keyword arguments:
+    sinks -- iterable of sinks to send records to
+    """
+    def __init__(self, sinks=()):
+        """Create a recorder sending to sinks."""
+        self._sinks = list(sinks)
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    @property
+    def enabled(self):
+        """Whether anything is being recorded"""
+        return bool(self._sinks)
+
+    def add_sink(self, sink):
+        """Start sending records to sink"""
+        with self._lock:
+            self._sinks = self._sinks + [sink]
+        return sink
+
+    def remove_sink(self, sink):
+        """Stop sending records to sink"""
+        with self._lock:
+            self._sinks = [found for found in self._sinks
+                           if found is not sink]
+
+    def emit(self, record):
+        """Send a record to every sink"""
+        for sink in self._sinks:
+            sink.emit(record)
+
+    def span(self, name, **fields):
+        """Context manager timing one phase of work"""
+        if not self._sinks:
+            return _NULL_SPAN
+        return _Span(self, name, fields)
+
+    def count(self, name, amount=1, **fields):
+        """Add amount to the counter called name"""
+        if not self._sinks:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+        record = {"type": "count", "name": name, "value": amount,
+                  "time": time.time()}
+        record.update(fields)
+        self.emit(record)
+
+    def event(self, name, message=None, **fields):
+        """Record that something happened, with a readable message"""
+        if not self._sinks:
+            return
+        record = {"type": "event", "name": name, "time": time.time()}
+        if message is not None:
+            record["message"] = message
+        record.update(fields)
+        self.emit(record)
+
+    def counters(self):
+        """Return a copy of every counter's total"""
+        with self._lock:
+            return dict(self._counters)
+
+    def close(self):
+        """Emit the counter totals and close every sink"""
+        if self._sinks:
+            self.emit({"type": "counters", "time": time.time(),
+                       "counters": self.counters()})
+        for sink in self._sinks:
+            sink.close()
+        self._sinks = []
+
+
+def _from_environment():
+    """Record to the file named by METRICS_ENV, if it is set"""
+    file_path = os.environ.get(METRICS_ENV)
+    return Metrics([JSONLSink(file_path)] if file_path else [])
+
+
+_METRICS = _from_environment()
+
+
+@atexit.register
+def _close_shared():
+    """Write the counter totals when the program exits"""
+    _METRICS.close()
+
+
+def metrics():
+    """Return the recorder shared by every module"""
+    return _METRICS
+
+
+def configure_metrics(file_path=None, sinks=()):
+    """Replace the shared recorder with one writing JSONL to file_path
+    (if given) and to any other sinks. Call with no arguments to stop
+    recording."""
+    global _METRICS
+    old_metrics = _METRICS
+    sinks = list(sinks)
+    if file_path:
+        sinks.insert(0, JSONLSink(file_path))
+    _METRICS = Metrics(sinks)
+    old_metrics.close()
+    return _METRICS
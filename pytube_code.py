@@ -1,10 +1,47 @@
 """This module is where the pytube functions and objects are incorporated"""
 import re
 
+import itertools
 import os
-from pytube import YouTube, Playlist, Channel, extract
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError
+from urllib.parse import urlsplit
+from pytube import YouTube, Playlist, Channel, extract, request
 from pytube.exceptions import VideoUnavailable
 from pytube.exceptions import RegexMatchError, AgeRestrictedError
+from cache import PersistentCache, CACHE_PATH
+from library import Library, LIBRARY_PATH
+import http_client
+import transfer
+from metrics import metrics
+from store import VideoStore, STORE_PATH, link_file
+from stream_index import StreamIndex, best_under_resolution
+
+
+# Send pytube's page and API requests through the shared connection pool
+http_client.install_pytube_hook()
+
+# Number of videos downloaded at once when a caller asks for parallel mode
+DEFAULT_MAX_WORKERS = 4
+
+# Number of channel pages fetched at once while looking for playlists
+CHANNEL_PAGE_WORKERS = 5
+
+# Top-level parts of a channel page's initial_data that never hold
+# playlists
+CHANNEL_SKIP_KEYS = frozenset({"responseContext", "topbar",
+                               "frameworkUpdates"})
+
+# Folder playlists are listed and linked into
+PLAYLISTS_PATH = os.pardir + "/YouTube-Downloads/Playlists/"
+
+# Seconds a video's cached metadata is trusted before it is fetched again
+METADATA_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Number of videos kept in the metadata cache
+METADATA_CACHE_SIZE = 50000
 
 
 class InvalidURLException(Exception):
@@ -23,38 +60,101 @@ class InvalidChannelException(InvalidURLException):
     """Raised when URL is not a valid Channel"""
 
 
+class DownloadCancelled(Exception):
+    """Raised when a download is cancelled before it finished"""
+
+
 class YDVideo(YouTube):
     """A video uploaded to YouTube.
 
     Keyword arguments:
     """
     # URL Parameter constructor
-    def __init__(self, url="https://www.youtube.com/watch?v=dQw4w9WgXcQ"):
+    def __init__(self, url="https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+                 cache=None):
         """Construct a YDVideo object using the video
-        uploaded to the given YouTube link."""
+        uploaded to the given YouTube link.
+
+        Keyword arguments:
+        cache -- PersistentCache to fill the video from, None to use the
+            shared metadata cache or False to always fetch from YouTube
+        """
         try:
             extract.video_id(url)
         except RegexMatchError as e:
             raise InvalidVideoException from e
+        recorder = metrics()
         try:
-            super().__init__(url)
-            self.video_url = url
-
-            bad_chars = "<>:\"/\\|?*"
-
-            self.clean_title = re.sub(rf'[{bad_chars}]', '',
-                                      self.title).removesuffix(
-                                          "...").strip() + ".mp4"
-            self.clean_author = re.sub(rf'[{bad_chars}]', '',
-                                       self.author).removesuffix("...").strip()
-
-            print(f'Creating video object: {self.clean_title} from {url}')
-            self.download_path = (os.pardir + "/YouTube-Downloads/" +
-                                  self.clean_author + "/")
+            with recorder.span("video.init", url=url):
+                super().__init__(url)
+                self.video_url = url
+                self._cache = metadata_cache() if cache is None else cache
+
+                metadata = None
+                if self._cache:
+                    with recorder.span("video.cache_lookup",
+                                       video_id=self.video_id):
+                        metadata = self._cache.get(self.video_id)
+
+                if metadata is not None:
+                    # Filled without network access
+                    recorder.count("video.cache_hits")
+                    self.title = metadata["title"]
+                    self.author = metadata["author"]
+                    self.clean_title = metadata["clean_title"]
+                    self.clean_author = metadata["clean_author"]
+                    self.download_path = metadata["download_path"]
+                    self.stream_records = metadata["streams"]
+                    self._stream_index = None
+                else:
+                    bad_chars = "<>:\"/\\|?*"
+
+                    with recorder.span("video.page_fetch",
+                                       video_id=self.video_id):
+                        title = self.title
+                        author = self.author
+                    self.clean_title = re.sub(rf'[{bad_chars}]', '',
+                                              title).removesuffix(
+                                                  "...").strip() + ".mp4"
+                    self.clean_author = re.sub(rf'[{bad_chars}]', '',
+                                               author).removesuffix(
+                                                   "...").strip()
+                    self.download_path = (os.pardir + "/YouTube-Downloads/" +
+                                          self.clean_author + "/")
+                    self.stream_records = None
+                    self._stream_index = None
+                    self._save_metadata()
+
+            recorder.event("video.created",
+                           f'Creating video object: {self.clean_title} '
+                           f'from {url}', video_id=self.video_id)
         except VideoUnavailable as e:
             raise e
 
-    def download_video(self, max_res):
+    def _save_metadata(self):
+        """Store the video's metadata in the cache for later runs"""
+        if self._cache:
+            self._cache.set(self.video_id, {
+                "title": self.title,
+                "author": self.author,
+                "clean_title": self.clean_title,
+                "clean_author": self.clean_author,
+                "download_path": self.download_path,
+                "streams": self.stream_records
+            })
+
+    @property
+    def stream_index(self):
+        """StreamIndex of the video's .mp4 streams, built once"""
+        if self.stream_records is None:
+            self.stream_records = [_stream_record(stream)
+                                   for stream in super().streams]
+            self._save_metadata()
+        if self._stream_index is None:
+            self._stream_index = StreamIndex(self.stream_records)
+        return self._stream_index
+
+    def download_video(self, max_res, policy=None, cancel=None):
         """Download a video from a YouTube link.
 
         Keyword arguments:
@@ -62,39 +162,157 @@ class YDVideo(YouTube):
             that posted the given video
         path -- string of the download path
         ("YouTube-Downloads" folder placed parallel to the program folder)
+        policy -- stream_index policy used to pick the stream, defaults
+            to the best resolution at or below max_res
+        cancel -- threading.Event that stops the transfer once set,
+            raising DownloadCancelled
+
+        Returns the video's path inside "YouTube-Downloads", or None if
+        it is no longer available.
         """
         video_name = self.clean_author + "/" + self.clean_title
+        file_path = self.download_path + self.clean_title
+        downloads = download_library()
+        videos = video_store()
+        recorder = metrics()
+
+        # An index lookup replaces asking YouTube for the streams
+        with recorder.span("video.library_lookup", video_id=self.video_id):
+            recorded = downloads.get_video(self.video_id)
+        if (recorded is not None and recorded["path"] == video_name and
+                os.path.isfile(file_path)):
+            recorder.count("video.skipped", reason="downloaded")
+            recorder.event("video.already_downloaded",
+                           "Video already downloaded: " + file_path,
+                           video_id=self.video_id)
+            return video_name
 
         try:
-            # Filter to only .mp4 files
-            filtered_streams = super().streams.filter(progressive=True,
-                                                      file_extension="mp4")
+            if policy is None:
+                policy = best_under_resolution(max_res)
+
+            # Only .mp4 files are indexed
+            with recorder.span("video.manifest", video_id=self.video_id):
+                index = self.stream_index
+
+            with recorder.span("video.select", video_id=self.video_id):
+                best_record = index.select(policy)
+
+            recorder.event("video.selected",
+                           "Best res: " + best_record["resolution"],
+                           video_id=self.video_id,
+                           resolutions=[record["resolution"]
+                                        for record in index.records])
+
+            if not videos.has(self.video_id, best_record["filesize"]) and \
+                    _file_is_complete(file_path, best_record["filesize"]):
+                # Downloaded before videos were kept in the store
+                videos.add(self.video_id, file_path)
+
+            if videos.has(self.video_id, best_record["filesize"]):
+                recorder.count("video.skipped", reason="file_complete")
+                recorder.event("video.already_downloaded",
+                               "Video already downloaded: " + file_path,
+                               video_id=self.video_id)
+            else:
+                with recorder.span("video.stream_url",
+                                   video_id=self.video_id):
+                    best_res_stream = super().streams.get_by_itag(
+                        best_record["itag"])
+                # Resumes from a .part file left by an interrupted run
+                with recorder.span("video.transfer", video_id=self.video_id,
+                                   size=best_res_stream.filesize):
+                    try:
+                        transfer.download_stream(best_res_stream.url,
+                                                 videos.path(self.video_id),
+                                                 best_res_stream.filesize,
+                                                 cancel=cancel)
+                    except transfer.TransferCancelled as e:
+                        raise DownloadCancelled from e
+                recorder.count("video.downloaded")
+                recorder.event("video.downloaded",
+                               "Video downloaded: " + file_path +
+                               " with ID: " + self.video_id,
+                               video_id=self.video_id)
+
+            videos.link(self.video_id, file_path)
+            with recorder.span("video.record", video_id=self.video_id):
+                downloads.record_video(self.video_id, video_name,
+                                       self.clean_author,
+                                       os.path.getsize(file_path))
+        except AgeRestrictedError:
+            recorder.count("video.skipped", reason="age_restricted")
+            recorder.event("video.age_restricted",
+                           f'Video {self.video_url} is age restricted, '
+                           'skipping as no credentials.',
+                           video_id=self.video_id)
+            return video_name + " (Skipped as Age Restricted)"
+        except VideoUnavailable:
+            # Made private or removed since its metadata was cached
+            recorder.count("video.skipped", reason="unavailable")
+            recorder.event("video.unavailable",
+                           f'Video {self.video_url} is unavailable, '
+                           'skipping.', video_id=self.video_id)
+            if self._cache:
+                self._cache.delete(self.video_id)
+            return None
 
-            # Print resolutions for testing
-            print([stream.resolution for stream in filtered_streams])
+        return video_name
 
-            # Initialize to the lowest res in case no res is below max res
-            best_res_stream = filtered_streams.get_lowest_resolution()
 
-            # Find the best res
-            for stream in filtered_streams:
-                if (stream.resolution is not None and
-                        int(stream.resolution.removesuffix('p')) <= max_res):
-                    best_res_stream = stream
+def _stream_record(stream):
+    """Describe a pytube Stream as a dict that can be cached"""
+    return {
+        "itag": stream.itag,
+        "resolution": stream.resolution,
+        "subtype": stream.subtype,
+        "progressive": stream.is_progressive,
+        "bitrate": stream.bitrate,
+        # Read the size YouTube already sent instead of asking for it
+        "filesize": getattr(stream, "_filesize", 0) or 0
+    }
 
-            print("Best res:", best_res_stream.resolution)
 
-            best_res_stream.download(output_path=self.download_path,
-                                     filename=self.clean_title,
-                                     skip_existing=True)
-            print("Video downloaded: " + self.download_path +
-                  self.clean_title + " with ID: " + self.video_id)
-        except AgeRestrictedError:
-            print(f'Video {self.video_url} is age restricted,' +
-                  'skipping as no credentials.')
-            return video_name + " (Skipped as Age Restricted)"
+def _file_is_complete(file_path, expected_size):
+    """Check if a file was already fully downloaded"""
+    if not os.path.isfile(file_path):
+        return False
+    return not expected_size or os.path.getsize(file_path) == expected_size
 
-        return video_name
+
+_DOWNLOAD_LIBRARY = None
+_METADATA_CACHE = None
+_VIDEO_STORE = None
+_SINGLETON_LOCK = threading.Lock()
+
+
+def metadata_cache():
+    """Return the metadata cache shared by every YDVideo"""
+    global _METADATA_CACHE
+    with _SINGLETON_LOCK:
+        if _METADATA_CACHE is None:
+            _METADATA_CACHE = PersistentCache(
+                CACHE_PATH + "metadata.db", ttl=METADATA_CACHE_TTL,
+                max_entries=METADATA_CACHE_SIZE)
+    return _METADATA_CACHE
+
+
+def download_library():
+    """Return the library of downloads shared by every download"""
+    global _DOWNLOAD_LIBRARY
+    with _SINGLETON_LOCK:
+        if _DOWNLOAD_LIBRARY is None:
+            _DOWNLOAD_LIBRARY = Library(LIBRARY_PATH)
+    return _DOWNLOAD_LIBRARY
+
+
+def video_store():
+    """Return the store every download keeps its video file in"""
+    global _VIDEO_STORE
+    with _SINGLETON_LOCK:
+        if _VIDEO_STORE is None:
+            _VIDEO_STORE = VideoStore(STORE_PATH)
+    return _VIDEO_STORE
 
 
 class YDPlaylist(Playlist):
@@ -103,170 +321,452 @@ class YDPlaylist(Playlist):
         if "list=" not in url:
             raise InvalidPlaylistException
         else:
-            super().__init__(url)
+            recorder = metrics()
+            with recorder.span("playlist.init", url=url):
+                super().__init__(url)
 
-            bad_chars = "<>:\"/\\|?*"
+                bad_chars = "<>:\"/\\|?*"
 
-            self.clean_title = re.sub(
-                rf'[{bad_chars}]', '', self.title).removesuffix("...").strip()
+                with recorder.span("playlist.page_fetch", url=url):
+                    title = self.title
+                self.clean_title = re.sub(
+                    rf'[{bad_chars}]', '', title).removesuffix("...").strip()
 
-            self.yd_playlist = []
+            self._yd_playlist = None
 
-            for video_url in self.video_urls:
-                try:
-                    v = YDVideo(video_url)
-                    self.yd_playlist.append(v)
-                except VideoUnavailable as e:
-                    print(f'Video from {e.video_id} is unavailable, skipping.')
+    @property
+    def yd_playlist(self):
+        """List of every YDVideo in the playlist, built on first access"""
+        if self._yd_playlist is None:
+            self._yd_playlist = list(self.iter_videos())
+        return self._yd_playlist
 
-    def download_playlist(self, max_res):
-        """Download a playlist from a YouTube link."""
-        playlist_path = os.pardir + "/YouTube-Downloads/Playlists/"
-        file_path = playlist_path + self.clean_title + ".txt"
-        print(f"Downloading to {file_path}")
-        if not os.path.exists(playlist_path):
-            os.makedirs(playlist_path)
+    def iter_videos(self, skip_downloaded=False, downloaded=None):
+        """Yield the playlist's YDVideo objects one at a time as each is
+        resolved, so downloading can start before the last is fetched
 
-        video_urls = []
+        Keyword arguments:
+        skip_downloaded -- don't resolve videos already in the library
+        downloaded -- dict of video id to the path saved for it earlier
+            in this sync; those videos are not resolved again
+        """
+        if self._yd_playlist is not None:
+            return iter(self._yd_playlist)
+        return _resolve_videos(self.video_urls, skip_downloaded,
+                               downloaded)
 
-        if os.path.isfile(file_path):
-            with open(file_path, "r", encoding="utf-8") as old_fplaylist:
-                video_urls = old_fplaylist.readlines()
-                old_fplaylist.close()
-            os.remove(file_path)
+    def download_playlist(self, max_res, max_workers=1, incremental=False,
+                          cancel=None, downloaded=None):
+        """Download a playlist from a YouTube link.
 
-            for video in self.yd_playlist:
-                video_save_path = video.download_video(max_res) + "\n"
+        Besides the .txt list, every video is linked into a folder named
+        after the playlist, without taking up more disk space.
 
-                if video_save_path not in video_urls:
-                    video_urls.append(video_save_path)
-        else:
-            for video in self.yd_playlist:
-                video_urls.append(video.download_video(max_res) + "\n")
+        Keyword arguments:
+        max_workers -- number of videos to download at the same time
+        incremental -- only resolve videos that are not in the library,
+            since playlists can gain videos anywhere in their order
+        cancel -- threading.Event that stops the download once set
+        downloaded -- dict of video id to saved path shared by one sync
+        """
+        file_path = PLAYLISTS_PATH + self.clean_title + ".txt"
+        metrics().event("playlist.download", f"Downloading to {file_path}",
+                        playlist_id=self.playlist_id)
+        if not os.path.exists(PLAYLISTS_PATH):
+            os.makedirs(PLAYLISTS_PATH)
+
+        downloads = download_library()
+
+        # Older versions kept playlists only in the .txt file
+        downloads.import_playlist_file(self.playlist_id, self.clean_title,
+                                       file_path)
+
+        for video_save_path in download_videos(
+                self.iter_videos(incremental, downloaded), max_res,
+                max_workers, cancel, downloaded):
+            if video_save_path is not None:
+                add_playlist_video(self.playlist_id, self.clean_title,
+                                   video_save_path)
 
-        with open(file_path, 'x', encoding="utf-8") as fplaylist:
-            fplaylist.writelines(video_urls)
-            fplaylist.close()
+        downloads.write_playlist_file(self.playlist_id, file_path)
 
         return file_path
 
 
-def _find_ids(key, var):
-    if hasattr(var, 'items'):
-        for k, v in var.items():
-            if k == key:
-                yield v
-            if isinstance(v, dict):
-                for result in _find_ids(key, v):
-                    yield result
-            elif isinstance(v, list):
-                for d in v:
-                    for playlist_id in _find_ids(key, d):
-                        yield playlist_id
+def add_playlist_video(playlist_id, clean_title, video_save_path):
+    """Add a video to the end of a playlist in the library and link it
+    into the playlist's folder
 
+    Keyword arguments:
+    clean_title -- string of the playlist's folder name
+    video_save_path -- string of the video's path inside
+        "YouTube-Downloads", as download_video returns it
+    """
+    download_library().add_to_playlist(playlist_id, video_save_path)
+    saved_path = os.pardir + "/YouTube-Downloads/" + video_save_path
+    if os.path.isfile(saved_path):
+        # Named with the author too, as titles can repeat
+        link_file(saved_path, PLAYLISTS_PATH + clean_title + "/" +
+                  video_save_path.replace("/", " - "))
+
+
+class DownloadedVideo:
+    """A video the library already has, or that was downloaded earlier
+    in the same sync, used in place of a YDVideo so it does not need to
+    be resolved again."""
+    def __init__(self, recorded):
+        self.video_id = recorded["video_id"]
+        self.video_name = recorded["path"]
+
+    def download_video(self, max_res, policy=None, cancel=None):
+        """Return the saved path without downloading anything"""
+        return self.video_name
+
+
+def _resolve_videos(video_urls, skip_downloaded=False, downloaded=None):
+    """Yield a YDVideo for each url, skipping unavailable videos
+
+    Keyword arguments:
+    skip_downloaded -- yield a DownloadedVideo instead of resolving
+        videos that are already in the library
+    downloaded -- dict of video id to saved path shared by one sync, so
+        a video in several playlists is only resolved the first time.
+        Only the paths are kept, as a YDVideo holds its whole page.
+    """
+    for video_url in video_urls:
+        if downloaded is not None:
+            video_id = extract.video_id(video_url)
+            if video_id in downloaded:
+                metrics().count("video.resolve_reused")
+                yield DownloadedVideo({"video_id": video_id,
+                                       "path": downloaded[video_id]})
+                continue
+        if skip_downloaded:
+            recorded = download_library().get_video(
+                extract.video_id(video_url))
+            if recorded is not None:
+                metrics().count("video.skipped", reason="in_library")
+                yield DownloadedVideo(recorded)
+                continue
+        try:
+            video = YDVideo(video_url)
+        except VideoUnavailable as e:
+            metrics().count("video.skipped", reason="unavailable")
+            metrics().event("video.unavailable",
+                            f'Video from {e.video_id} is unavailable, '
+                            'skipping.', video_id=e.video_id)
+        else:
+            yield video
+
+
+def _check_cancelled(cancel, executor=None):
+    """Raise DownloadCancelled if cancel has been set, first dropping
+    the videos still queued in executor"""
+    if cancel is not None and cancel.is_set():
+        if executor is not None:
+            # Videos already transferring stop at their next chunk
+            executor.shutdown(cancel_futures=True)
+        raise DownloadCancelled
+
+
+def _download_video(video, max_res, downloaded=None, cancel=None):
+    """Download one video, noting where it was saved in downloaded"""
+    video_save_path = video.download_video(max_res, cancel=cancel)
+    if downloaded is not None and video_save_path is not None:
+        downloaded[video.video_id] = video_save_path
+    return video_save_path
+
+
+def download_videos(videos, max_res, max_workers=1, cancel=None,
+                    downloaded=None):
+    """Download videos and yield each result in the original order.
+
+    At most max_workers videos are transferred at once and only a small
+    window of finished results is held, so the first results are
+    available before the last download starts.
+
+    Keyword arguments:
+    videos -- iterable of YDVideo objects
+    max_res -- int of the highest resolution to download
+    max_workers -- number of videos to download at the same time
+    cancel -- threading.Event that stops the download once set, raising
+        DownloadCancelled
+    downloaded -- dict of video id to saved path, filled in as each
+        video finishes
+    """
+    if max_workers <= 1:
+        for video in videos:
+            _check_cancelled(cancel)
+            yield _download_video(video, max_res, downloaded, cancel)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for video in videos:
+            _check_cancelled(cancel, executor)
+            pending.append(executor.submit(_download_video, video, max_res,
+                                           downloaded, cancel))
+            # Keep the queue bounded so a huge list is not submitted at once
+            if len(pending) >= max_workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            _check_cancelled(cancel, executor)
+            yield pending.popleft().result()
+
+
+def _walk_keys(keys, var, skip_keys=()):
+    """Yield (key, value) for every key in keys found in a JSON tree.
+
+    Walks with an explicit stack rather than recursion, so deep trees
+    cost no generator frames and cannot hit the recursion limit. Values
+    are found in document order, with a dict's own keys before anything
+    nested in it.
 
-def _find_urls(key, var):
-    ids = set(_find_ids(key, var))
+    Keyword arguments:
+    keys -- collection of keys to look for
+    var -- dict or list parsed from JSON
+    skip_keys -- collection of keys of the top-level dict whose values
+        are not searched
+    """
+    keys = frozenset(keys)
+    if skip_keys and type(var) is dict:
+        # Pruned once at the top, so the walk pays nothing per dict
+        var = {k: v for k, v in var.items() if k not in skip_keys}
+    stack = [var]
+    pop = stack.pop
+    push_all = stack.extend
+    while stack:
+        node = pop()
+        node_type = type(node)
+        if node_type is dict:
+            # Set checks run in C, so most dicts cost one call each
+            if not keys.isdisjoint(node):
+                for k in keys:
+                    if k in node:
+                        yield k, node[k]
+            # Reversed so the first value comes off the stack first
+            push_all(reversed(node.values()))
+        elif node_type is list:
+            push_all(node[::-1])
+
+
+def _find_ids(key, var, skip_keys=()):
+    for _, v in _walk_keys((key,), var, skip_keys):
+        yield v
+
+
+def _find_urls(key, var, skip_keys=()):
+    ids = dict.fromkeys(_find_ids(key, var, skip_keys))
     for playlist_id in ids:
         url = f'https://www.youtube.com/playlist?list={playlist_id}'
         yield url
 
 
+def _page_key(url):
+    """Reduce a YouTube page url to one spelling, so pages written with
+    or without "www." or a trailing slash are only fetched once"""
+    parts = urlsplit(url)
+    host = parts.netloc.lower().removeprefix("www.").removeprefix("m.")
+    return host + parts.path.rstrip("/")
+
+
 class YDChannel(Channel):
     """A channel uploaded to YouTube."""
     def __init__(self, url):
+        recorder = metrics()
         try:
             base_url = "https://www.youtube.com" + extract.channel_name(
                 url).removesuffix("/None") + "/"
-            print("Base:", base_url)
         except RegexMatchError as e:
             raise InvalidChannelException from e
         else:
-            super().__init__(base_url)
-
-            self.all_videos = []
-
-            for video_url in self.video_urls:
-                try:
-                    v = YDVideo(url=video_url)
-                    print('Creating video object:' +
-                          f'{v.clean_title} from {video_url}')
-                    self.all_videos.append(v)
-                except VideoUnavailable as e:
-                    print(f'Video from {e.video_id} is unavailable, skipping.')
-
-            self.playlist_urls = []
-
-            channel_pages = {base_url, base_url + "videos/",
-                             base_url + "playlists/",
-                             base_url + "releases/", url}
-
-            for extension in channel_pages:
-                channel_page = extension
-                try:
-                    extract.channel_name(channel_page)
-                except RegexMatchError as e:
-                    print(channel_page + " not found.")
+            with recorder.span("channel.init", url=base_url):
+                super().__init__(base_url)
+
+                self._all_videos = None
+
+                channel_pages = [base_url, base_url + "videos/",
+                                 base_url + "playlists/",
+                                 base_url + "releases/", url]
+
+                # Several of these can be the same page written differently
+                unique_pages = {}
+                for channel_page in channel_pages:
+                    try:
+                        extract.channel_name(channel_page)
+                    except RegexMatchError:
+                        recorder.event("channel.page_not_found",
+                                       channel_page + " not found.",
+                                       url=channel_page)
+                    else:
+                        unique_pages.setdefault(_page_key(channel_page),
+                                                channel_page)
+
+                with ThreadPoolExecutor(
+                        max_workers=min(len(unique_pages) or 1,
+                                        CHANNEL_PAGE_WORKERS)) as executor:
+                    found_pages = list(executor.map(
+                        self._find_page_playlists, unique_pages.values()))
+
+                # Ensure no duplicates while keeping the order they were
+                # found
+                self.playlist_urls = list(dict.fromkeys(
+                    found_url for found_urls in found_pages
+                    for found_url in found_urls))
+
+            recorder.event("channel.playlists",
+                           f"All urls: {self.playlist_urls}", url=base_url,
+                           playlists=len(self.playlist_urls))
+
+    def _find_page_playlists(self, channel_page):
+        """Fetch one channel page and return the playlist urls on it"""
+        recorder = metrics()
+        try:
+            with recorder.span("channel.page_fetch", url=channel_page):
+                if _page_key(channel_page) == _page_key(self.videos_url):
+                    # Shared with video enumeration so it is only fetched
+                    # once
+                    html = self.html
                 else:
-                    found_urls = list(_find_urls(
-                        'playlistId', Channel(channel_page).initial_data))
-
-                    # Skip Watch Later playlists as they break download
-                    if "https://www.youtube.com/playlist?list=WL" in found_urls:
-                        found_urls.remove(
-                            "https://www.youtube.com/playlist?list=WL")
-
-                    print(channel_page + " found playlist(s):")
-                    print(found_urls)
-
-                    # Ensure no duplicates
-                    for found_url in found_urls:
-                        if found_url not in self.playlist_urls:
-                            self.playlist_urls.append(found_url)
-                        else:
-                            print("Found duplicate playlist url (skipped):",
-                                  found_url)
-
-            print("All urls:")
-            print(self.playlist_urls)
-
-    def download_channel_videos(self, max_res):
-        """Download all the individual videos found on the channel page"""
-        for video in self.all_videos:
-            video.download_video(max_res)
-
-    def download_channel_playlists(self, max_res):
+                    html = request.get(channel_page)
+            with recorder.span("channel.parse", url=channel_page):
+                found_urls = list(_find_urls('playlistId',
+                                             extract.initial_data(html),
+                                             CHANNEL_SKIP_KEYS))
+        except (URLError, RegexMatchError):
+            recorder.event("channel.page_not_found",
+                           channel_page + " not found.", url=channel_page)
+            return []
+
+        # Skip Watch Later playlists as they break download
+        if "https://www.youtube.com/playlist?list=WL" in found_urls:
+            found_urls.remove("https://www.youtube.com/playlist?list=WL")
+
+        recorder.event("channel.page_playlists",
+                       f"{channel_page} found playlist(s): {found_urls}",
+                       url=channel_page, playlists=len(found_urls))
+        return found_urls
+
+    @property
+    def all_videos(self):
+        """List of every YDVideo on the channel, built on first access"""
+        if self._all_videos is None:
+            self._all_videos = list(self.iter_videos())
+        return self._all_videos
+
+    def iter_videos(self, until_video_id=None, downloaded=None):
+        """Yield the channel's YDVideo objects one at a time as each is
+        resolved, so downloading can start before the last is fetched
+
+        Keyword arguments:
+        until_video_id -- stop before this video, as uploads are listed
+            newest first
+        downloaded -- dict of video id to saved path shared by one sync
+        """
+        if self._all_videos is not None:
+            videos = iter(self._all_videos)
+            if until_video_id is not None:
+                videos = itertools.takewhile(
+                    lambda video: video.video_id != until_video_id, videos)
+            return videos
+        if until_video_id is not None:
+            return _resolve_videos(self.trimmed(until_video_id),
+                                   downloaded=downloaded)
+        return _resolve_videos(self.video_urls, downloaded=downloaded)
+
+    def download_channel_videos(self, max_res, max_workers=1,
+                                incremental=False, cancel=None,
+                                downloaded=None):
+        """Download all the individual videos found on the channel page
+
+        Keyword arguments:
+        max_workers -- number of videos to download at the same time
+        incremental -- only download videos uploaded after the newest
+            one seen by the last incremental sync
+        cancel -- threading.Event that stops the download once set
+        downloaded -- dict of video id to saved path shared by one sync
+        """
+        if not incremental:
+            return list(download_videos(
+                self.iter_videos(downloaded=downloaded), max_res,
+                max_workers, cancel, downloaded))
+
+        downloads = download_library()
+        watermark = downloads.get_watermark(self.channel_url)
+        newest_url = next(iter(self.video_urls), None)
+        results = list(download_videos(
+            self.iter_videos(watermark, downloaded), max_res, max_workers,
+            cancel, downloaded))
+
+        # Only move the watermark once every newer video is downloaded
+        if newest_url is not None:
+            downloads.set_watermark(self.channel_url,
+                                    extract.video_id(newest_url))
+        return results
+
+    def download_channel_playlists(self, max_res, max_workers=1,
+                                   incremental=False, cancel=None,
+                                   downloaded=None):
         """Download all the playlists discovered for the channel"""
         valid_playlist_paths = []
 
         for playlist_url in self.playlist_urls:
+            _check_cancelled(cancel)
             try:
                 playlist = YDPlaylist(playlist_url)
             except InvalidPlaylistException:
-                print("Invalid Playlist: " + playlist_url)
+                metrics().event("playlist.invalid",
+                                "Invalid Playlist: " + playlist_url,
+                                url=playlist_url)
             else:
-                print("Valid Playlist: " + playlist_url)
+                metrics().event("playlist.valid",
+                                "Valid Playlist: " + playlist_url,
+                                url=playlist_url)
                 valid_playlist_paths.append(
-                    playlist.download_playlist(max_res))
+                    playlist.download_playlist(max_res, max_workers,
+                                               incremental, cancel,
+                                               downloaded))
         return valid_playlist_paths
 
-    def download_channel(self, max_res):
-        """Wrapper function to run the two helper functions"""
-        self.download_channel_videos(max_res)
-        self.download_channel_playlists(max_res)
+    def download_channel(self, max_res, max_workers=1, incremental=False,
+                         cancel=None, downloaded=None):
+        """Wrapper function to run the two helper functions
+
+        Videos downloaded for the uploads are not resolved again for the
+        playlists, which mostly hold the same videos.
+        """
+        if downloaded is None:
+            downloaded = {}
+        self.download_channel_videos(max_res, max_workers, incremental,
+                                     cancel, downloaded)
+        self.download_channel_playlists(max_res, max_workers, incremental,
+                                        cancel, downloaded)
 
 
 def check_channel_or_playlist_url(url):
     """Checks if a link is a channel or playlist"""
     try:
         extract.channel_name(url)
-    except InvalidChannelException:
-        return False
+    except RegexMatchError:
+        try:
+            extract.playlist_id(url)
+        except KeyError:
+            return False
     return True
 
 
-def download_link(url, max_res):
-    """Download a YouTube link by turning it into the right type of object"""
+def download_link(url, max_res, max_workers=1, incremental=False,
+                  cancel=None, downloaded=None):
+    """Download a YouTube link by turning it into the right type of object
+
+    Keyword arguments:
+    max_workers -- number of videos to download at the same time
+    incremental -- skip channel and playlist videos synced before
+    cancel -- threading.Event that stops the download once set, raising
+        DownloadCancelled
+    downloaded -- dict of video id to saved path shared by every link of
+        one sync, so a video found through several links is resolved once
+    """
     link_confirmed = False
     message = "Link unconfirmed"
 
@@ -277,7 +777,8 @@ def download_link(url, max_res):
     else:
         link_confirmed = True
         message = "Valid Channel url: " + url
-        c.download_channel(max_res)
+        c.download_channel(max_res, max_workers, incremental, cancel,
+                           downloaded)
     if not link_confirmed:
         try:
             p = YDPlaylist(url)
@@ -286,7 +787,8 @@ def download_link(url, max_res):
         else:
             link_confirmed = True
             message = "Valid Playlist url: " + url
-            p.download_playlist(max_res)
+            p.download_playlist(max_res, max_workers, incremental, cancel,
+                                downloaded)
     if not link_confirmed:
         try:
             v = YDVideo(url)
@@ -296,7 +798,8 @@ def download_link(url, max_res):
             message = "Invalid Channel/Playlist/Video url: " + url
         else:
             message = "Valid Video: " + url
-            v.download_video(max_res)
+            _check_cancelled(cancel)
+            _download_video(v, max_res, downloaded, cancel)
 
     return message
 
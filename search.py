@@ -0,0 +1,156 @@
+"""This module is where search results are fetched a batch at a time and
+split into pages, without any of the window code"""
+import threading
+from collections import namedtuple
+from cache import PersistentCache, CACHE_PATH
+from metrics import metrics
+
+# Number of videos shown on one search page
+PAGE_SIZE = 3
+
+# Seconds a search's cached results are shown before it is run again
+SEARCH_CACHE_TTL = 6 * 60 * 60
+
+# Number of searches kept in the cache
+SEARCH_CACHE_SIZE = 500
+
+# The next batch is fetched once the rows shown are this many pages from
+# the last loaded row, so it is usually there before it is scrolled to
+PREFETCH_PAGES = 2
+
+
+class SearchResult(namedtuple("SearchResult", ("title", "author", "length",
+                                               "thumbnail_url",
+                                               "watch_url"))):
+    """What a search page shows for one video, small enough to cache."""
+    __slots__ = ()
+
+    @classmethod
+    def from_video(cls, video):
+        """Build the result from a pytube YouTube object, which looks up
+        the duration and thumbnail over the network"""
+        try:
+            length = video.length
+        except TypeError:
+            # live streams have no length
+            length = 0
+        return cls(video.title, video.author, length, video.thumbnail_url,
+                   video.watch_url)
+
+
+_SEARCH_CACHE = None
+_SINGLETON_LOCK = threading.Lock()
+
+
+def search_cache():
+    """Return the cache of search results shared by every search"""
+    global _SEARCH_CACHE
+    with _SINGLETON_LOCK:
+        if _SEARCH_CACHE is None:
+            _SEARCH_CACHE = PersistentCache(
+                CACHE_PATH + "search.db", ttl=SEARCH_CACHE_TTL,
+                max_entries=SEARCH_CACHE_SIZE)
+    return _SEARCH_CACHE
+
+
+def normalize_query(query):
+    """Return the form of a query its results are cached under"""
+    return " ".join(query.casefold().split())
+
+
+class SearchResults:
+    """The results of one YouTube search, loaded a batch at a time.
+
+    fetch_next does the network work and is meant to run on a background
+    thread; everything else only reads what is already loaded and never
+    blocks. cached is True if the search started from the results of an
+    earlier one, which the window shows next to the count.
+
+    Keyword arguments:
+    query -- string to search YouTube for
+    page_size -- number of results on a page
+    cache -- PersistentCache the batches fetched so far are kept in, so
+        the same search starts from them later, or None to not cache
+    """
+    def __init__(self, query, page_size=PAGE_SIZE, cache=None):
+        """Create the search, starting from its cached results if there
+        are any, without fetching anything yet."""
+        self.query = query
+        self.page_size = page_size
+        self.cache = cache
+        self.exhausted = False
+        self.cached = False
+        self._search = None
+        self._continuation = None
+        self._results = []
+        self._fetching = False
+        self._lock = threading.Lock()
+        if cache is not None:
+            entry = cache.get(normalize_query(query))
+            if entry is not None:
+                self._results = [SearchResult(**result)
+                                 for result in entry["results"]]
+                self._continuation = entry["continuation"]
+                self.exhausted = self._continuation is None
+                self.cached = True
+                metrics().count("search.cache_hits")
+
+    def fetch_next(self):
+        """Fetch the next batch of results and return how many were
+        added, 0 if another fetch is running or there are no more
+
+        The duration and thumbnail of each result are looked up
+        here too, so showing a page later does not touch the network.
+        A result whose details cannot be looked up, such as an age
+        restricted or removed video, is left out and the rest are kept.
+        """
+        import pytube
+        from pytube.exceptions import PytubeError
+
+        with self._lock:
+            if self._fetching or self.exhausted:
+                return 0
+            self._fetching = True
+        try:
+            if self._search is None:
+                self._search = pytube.Search(self.query)
+            # a search's first batch is fetched without a continuation
+            videos, continuation = self._search.fetch_and_parse(
+                self._continuation)
+            batch = []
+            for video in videos or []:
+                try:
+                    batch.append(SearchResult.from_video(video))
+                except PytubeError:
+                    metrics().count("search.results_skipped")
+        except BaseException:
+            with self._lock:
+                self._fetching = False
+            raise
+        with self._lock:
+            self._results.extend(batch)
+            self._continuation = continuation
+            self.exhausted = continuation is None
+            self._fetching = False
+            entry = {"results": [result._asdict()
+                                 for result in self._results],
+                     "continuation": continuation}
+        if self.cache is not None:
+            self.cache.set(normalize_query(self.query), entry)
+        return len(batch)
+
+    def __len__(self):
+        return len(self._results)
+
+    def __getitem__(self, index):
+        return self._results[index]
+
+    def page_count(self):
+        """Return the number of pages that can be shown so far"""
+        return -(-len(self._results) // self.page_size)
+
+    def wants_more(self, number):
+        """Check if the next batch should be fetched while a page is
+        shown, so later pages are loaded before they are asked for"""
+        return (not self.exhausted and not self._fetching and
+                self.page_count() - number <= PREFETCH_PAGES)
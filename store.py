@@ -0,0 +1,75 @@
+"""This module is where each downloaded video is stored once, by its id,
+and linked into the folders people browse"""
+import errno
+import os
+import shutil
+
+# Folder every video file is kept in, named by video id
+STORE_PATH = os.pardir + "/YouTube-Downloads/.store/"
+
+# Errors os.link raises where a filesystem cannot hard link the file
+_NO_LINK_ERRORS = frozenset({errno.EXDEV, errno.EPERM, errno.EMLINK,
+                             errno.ENOTSUP, errno.EOPNOTSUPP})
+
+
+class VideoStore:
+    """Video files kept once each under their video id. The author and
+    playlist folders hold hard links to them, so a video in several
+    places takes up its size on disk only once.
+
+    Keyword arguments:
+    folder -- string of the folder the files are kept in
+    """
+    def __init__(self, folder=STORE_PATH):
+        """Use the store kept in folder, which is created when the first
+        video is added."""
+        self.folder = folder
+
+    def path(self, video_id):
+        """Return the path a video's file is kept at"""
+        # Spread over subfolders so no one folder holds every video
+        return os.path.join(self.folder, video_id[:2], video_id + ".mp4")
+
+    def has(self, video_id, expected_size=0):
+        """Check if a video's file is stored, and is expected_size bytes
+        long if that is known"""
+        file_path = self.path(video_id)
+        if not os.path.isfile(file_path):
+            return False
+        return not expected_size or os.path.getsize(file_path) == \
+            expected_size
+
+    def add(self, video_id, file_path):
+        """Take an already downloaded file into the store, leaving it
+        where it is as a link"""
+        link_file(file_path, self.path(video_id))
+
+    def link(self, video_id, view_path):
+        """Make a stored video appear at view_path"""
+        link_file(self.path(video_id), view_path)
+
+
+def link_file(source, view_path):
+    """Make source appear at view_path as a hard link, or a copy where
+    the filesystem cannot link it
+
+    A file already at view_path is replaced unless it is source itself.
+    """
+    if os.path.exists(view_path):
+        if os.path.samefile(source, view_path):
+            return
+    folder = os.path.dirname(view_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    # Made next to view_path and then swapped in, so the view is never
+    # missing or half copied
+    temp_path = view_path + ".link"
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(source, temp_path)
+    except OSError as e:
+        if e.errno not in _NO_LINK_ERRORS:
+            raise
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, view_path)
@@ -0,0 +1,104 @@
+"""This module is where a video's streams are indexed for selection"""
+from bisect import bisect_left, bisect_right
+
+
+def resolution_number(record):
+    """Turn a record's resolution such as "720p" into 720"""
+    return int(record["resolution"].removesuffix('p'))
+
+
+class StreamIndex:
+    """A video's downloadable streams sorted once by resolution, bitrate
+    and size, so each selection is a binary search.
+
+    Keyword arguments:
+    records -- list of stream record dicts with "itag", "resolution",
+        "subtype", "progressive", "bitrate" and "filesize"
+    progressive -- only index streams with both video and audio
+    subtype -- only index streams of this file type
+    """
+    def __init__(self, records, progressive=True, subtype="mp4"):
+        """Sort the matching records and build the search keys."""
+        self.records = sorted(
+            (record for record in records
+             if record["resolution"] is not None and
+             (not progressive or record["progressive"]) and
+             (subtype is None or record["subtype"] == subtype)),
+            key=lambda record: (resolution_number(record),
+                                record["bitrate"] or 0,
+                                record["filesize"] or 0))
+        self.resolutions = [resolution_number(record)
+                            for record in self.records]
+
+        # Streams of a known size, smallest first, with the best stream
+        # at or under each size worked out ahead of time
+        sized = sorted((record for record in self.records
+                        if record["filesize"]),
+                       key=lambda record: record["filesize"])
+        self.sizes = [record["filesize"] for record in sized]
+        self.best_by_size = []
+        best = None
+        for record in sized:
+            if best is None or self._rank(record) > self._rank(best):
+                best = record
+            self.best_by_size.append(best)
+
+    @staticmethod
+    def _rank(record):
+        return resolution_number(record), record["bitrate"] or 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def lowest(self):
+        """Return the lowest resolution stream, or None if there are none"""
+        return self.records[0] if self.records else None
+
+    def best_under_resolution(self, max_res):
+        """Return the best stream at or below max_res, or None"""
+        position = bisect_right(self.resolutions, max_res)
+        return self.records[position - 1] if position else None
+
+    def smallest_over_resolution(self, min_res):
+        """Return the smallest stream at or above min_res, or None"""
+        position = bisect_left(self.resolutions, min_res)
+        if position == len(self.records):
+            return None
+        return self.records[position]
+
+    def best_under_size(self, max_bytes):
+        """Return the best stream whose file is at most max_bytes, or None"""
+        position = bisect_right(self.sizes, max_bytes)
+        return self.best_by_size[position - 1] if position else None
+
+    def select(self, policy):
+        """Pick a stream using a policy from this module"""
+        return policy(self)
+
+
+def best_under_resolution(max_res):
+    """Policy for the best stream at or below max_res, or the lowest
+    stream if every stream is above it"""
+    def policy(index):
+        return index.best_under_resolution(max_res) or index.lowest()
+    return policy
+
+
+def smallest_over_resolution(min_res):
+    """Policy for the smallest stream at or above min_res, or the
+    highest stream if every stream is below it"""
+    def policy(index):
+        found = index.smallest_over_resolution(min_res)
+        if found is None and len(index):
+            found = index.records[-1]
+        return found
+    return policy
+
+
+def best_under_size(max_megabytes):
+    """Policy for the best stream of at most max_megabytes, or the
+    lowest stream if none are that small"""
+    def policy(index):
+        return (index.best_under_size(int(max_megabytes * 1024 * 1024)) or
+                index.lowest())
+    return policy
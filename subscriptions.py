@@ -0,0 +1,281 @@
+"""This module is where the list of subscribed channels is kept and
+synced, without any of the window code"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from jobs import BUSY_TIMEOUT
+
+# Database of the subscribed channels and playlists
+SUBSCRIPTIONS_PATH = os.pardir + "/YouTube-Downloads/subscriptions.db"
+
+# Where older versions kept the list, the day updates were last fetched
+# on the first line and then one url a line
+OLD_SUBSCRIPTIONS_PATH = os.pardir + "/YouTube-Downloads/programInfo.txt"
+
+# Kinds of subscription
+CHANNEL = "channel"
+PLAYLIST = "playlist"
+
+_COLUMNS = ("url", "kind", "added_at", "synced_at", "last_video_id",
+            "failures", "last_error")
+
+# Oldest sync first, with subscriptions never synced before all the rest
+_STALEST_FIRST = "synced_at IS NOT NULL, synced_at, seq"
+
+
+def _today():
+    return date.today().isoformat()
+
+
+def subscription_kind(url):
+    """Return whether a url subscribes to a channel or a playlist"""
+    return PLAYLIST if "list=" in url else CHANNEL
+
+
+class SubscriptionStore:
+    """The subscribed channels and playlists, one record each, kept in a
+    sqlite file with how their last sync went. Every change is its own
+    transaction, so adding a subscription or recording a sync never
+    rewrites the others.
+
+    Keyword arguments:
+    file_path -- string of the sqlite file, or ":memory:"
+    """
+    def __init__(self, file_path=SUBSCRIPTIONS_PATH):
+        """Open (or create) the store kept at file_path."""
+        if file_path != ":memory:":
+            folder = os.path.dirname(file_path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(file_path, timeout=BUSY_TIMEOUT,
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL UNIQUE,
+                    kind TEXT NOT NULL,
+                    added_at REAL NOT NULL,
+                    synced_at REAL,
+                    last_video_id TEXT,
+                    failures INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT);
+                CREATE INDEX IF NOT EXISTS subscriptions_synced
+                    ON subscriptions (synced_at);
+                CREATE TABLE IF NOT EXISTS settings (
+                    name TEXT PRIMARY KEY,
+                    value TEXT);
+            """)
+
+    def add(self, url, kind=None):
+        """Subscribe to a channel or playlist url.
+
+        Returns True if it was added or False if it was already there.
+
+        Keyword arguments:
+        kind -- CHANNEL or PLAYLIST, worked out from the url if None
+        """
+        url = url.strip()
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "INSERT OR IGNORE INTO subscriptions (url, kind, added_at) "
+                "VALUES (?, ?, ?)",
+                (url, kind or subscription_kind(url),
+                 time.time())).rowcount == 1
+
+    def remove(self, url):
+        """Unsubscribe from a url, returning True if it was subscribed"""
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "DELETE FROM subscriptions WHERE url = ?",
+                (url,)).rowcount == 1
+
+    def get(self, url):
+        """Return a dict describing a subscription, or None"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT " + ", ".join(_COLUMNS) + " FROM subscriptions "
+                "WHERE url = ?", (url,)).fetchone()
+        return None if row is None else dict(zip(_COLUMNS, row))
+
+    def subscriptions(self, kind=None, stalest_first=False):
+        """Return a dict for each subscription, in the order they were
+        added or with the longest since its last sync first
+
+        Keyword arguments:
+        kind -- CHANNEL or PLAYLIST to only return that kind
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT " + ", ".join(_COLUMNS) + " FROM subscriptions" +
+                (" WHERE kind = ?" if kind is not None else "") +
+                " ORDER BY " + (_STALEST_FIRST if stalest_first else "seq"),
+                () if kind is None else (kind,)).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def urls(self, stalest_first=False):
+        """Return the subscribed urls"""
+        return [subscription["url"] for subscription in
+                self.subscriptions(stalest_first=stalest_first)]
+
+    def record_sync(self, url, last_video_id=None, error=None):
+        """Record how syncing a subscription went
+
+        Keyword arguments:
+        last_video_id -- id of the newest video synced, as the library's
+            watermark records it, None to keep the one from before
+        error -- string of why the sync failed, None if it worked
+        """
+        with self._lock, self._connection:
+            if error is None:
+                self._connection.execute(
+                    "UPDATE subscriptions SET synced_at = ?, "
+                    "last_video_id = COALESCE(?, last_video_id), "
+                    "failures = 0, last_error = NULL WHERE url = ?",
+                    (time.time(), last_video_id, url))
+            else:
+                self._connection.execute(
+                    "UPDATE subscriptions SET failures = failures + 1, "
+                    "last_error = ? WHERE url = ?", (error, url))
+
+    def fetched_on(self):
+        """Return the ISO date updates were last fetched, or None"""
+        return self._setting("fetched_on")
+
+    def set_fetched_on(self, day=None):
+        """Record the ISO date updates were fetched, today if day is
+        None"""
+        self._set_setting("fetched_on", day or _today())
+
+    def migrate_file(self, file_path=OLD_SUBSCRIPTIONS_PATH):
+        """Move the subscriptions of an older version's text file into
+        the store, once, and rename the file so it is not edited by
+        mistake
+
+        Returns the number of urls moved.
+        """
+        if self._setting("migrated") or not os.path.isfile(file_path):
+            return 0
+        with open(file_path, "r", encoding="utf-8") as f_hand:
+            lines = f_hand.read().splitlines()
+        added = sum(self.add(line) for line in lines[1:] if line.strip())
+        if lines and self.fetched_on() is None:
+            try:
+                # Written with date.ctime()
+                day = datetime.strptime(lines[0].strip(),
+                                        "%a %b %d %H:%M:%S %Y").date()
+            except ValueError:
+                pass
+            else:
+                self.set_fetched_on(day.isoformat())
+        self._set_setting("migrated", _today())
+        os.replace(file_path, file_path + ".migrated")
+        return added
+
+    def _setting(self, name):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM settings WHERE name = ?",
+                (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_setting(self, name, value):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO settings (name, value) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                (name, value))
+
+    def close(self):
+        """Close the underlying sqlite file."""
+        with self._lock:
+            self._connection.close()
+
+
+_SUBSCRIPTION_STORE = None
+_SINGLETON_LOCK = threading.Lock()
+
+
+def subscription_store():
+    """Return the store of subscriptions shared by the window and the
+    command line, moving in the old text file the first time"""
+    global _SUBSCRIPTION_STORE
+    with _SINGLETON_LOCK:
+        if _SUBSCRIPTION_STORE is None:
+            _SUBSCRIPTION_STORE = SubscriptionStore(SUBSCRIPTIONS_PATH)
+            _SUBSCRIPTION_STORE.migrate_file(OLD_SUBSCRIPTIONS_PATH)
+    return _SUBSCRIPTION_STORE
+
+
+def updates_due(store=None):
+    """Check if updates have not been fetched yet today"""
+    if store is None:
+        store = subscription_store()
+    return store.fetched_on() != _today()
+
+
+def fetch_updates(max_res=720, max_workers=None, store=None, progress=None,
+                  cancel=None, queue=None, processes=1):
+    """Download new videos from every subscription, the longest since
+    synced first, record how each went and return a list of (url,
+    message) pairs
+
+    The work is kept in a job queue on disk, so an update that is
+    cancelled or stopped by a crash carries on where it left off the
+    next time this is called.
+
+    Keyword arguments:
+    max_res -- int of the highest resolution to download
+    max_workers -- number of videos to download at the same time,
+        defaults to pytube_code.DEFAULT_MAX_WORKERS
+    store -- SubscriptionStore to sync, defaults to the shared one
+    progress -- function called with (index, total, url) before each
+        channel, playlist and video is synced
+    cancel -- threading.Event that stops the sync once set, raising
+        pytube_code.DownloadCancelled
+    queue -- jobs.JobQueue to work from, defaults to the shared one
+    processes -- number of processes sharing the jobs
+    """
+    # Imported here so reading the list stays quick for callers that
+    # never download
+    import jobs
+    import pytube_code
+    import sync
+
+    if max_workers is None:
+        max_workers = pytube_code.DEFAULT_MAX_WORKERS
+    if store is None:
+        store = subscription_store()
+    if queue is None:
+        queue = jobs.JobQueue(jobs.JOBS_PATH)
+    urls = store.urls(stalest_first=True)
+    results = sync.sync_links(urls, max_res, max_workers, incremental=True,
+                              cancel=cancel, progress=progress, queue=queue,
+                              processes=processes)
+    downloads = pytube_code.download_library()
+    for job in queue.jobs(kind="link"):
+        link = job["result"]
+        if job["state"] != jobs.DONE:
+            store.record_sync(job["url"],
+                              error=job["error"] or "Sync failed")
+        elif link.get("failed_videos"):
+            # The watermark was held back, so the link is not synced yet
+            store.record_sync(job["url"], error=(
+                f"{len(link['failed_videos'])} of its videos failed to "
+                "download"))
+        else:
+            # The library's watermark is the newest video synced
+            store.record_sync(job["url"], downloads.get_watermark(
+                link["channel_url"]) if "channel_url" in link else None)
+    return results
+
+
+def update_date(store=None):
+    """Record that updates were fetched today"""
+    if store is None:
+        store = subscription_store()
+    store.set_fetched_on()
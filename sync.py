@@ -0,0 +1,343 @@
+"""This module is where links are synced from the job queue, with a job
+for each link, playlist and video, so an interrupted sync resumes where
+it stopped instead of starting over, and other processes can join in"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pytube import extract
+from pytube.exceptions import VideoUnavailable
+import pytube_code as pytc
+from jobs import JobQueue, JOBS_PATH, LEASE_SECONDS, DONE, FAILED
+from metrics import metrics
+
+# Seconds a worker with nothing to claim waits before asking again, while
+# other workers still hold jobs that may queue more
+POLL_SECONDS = 1
+
+# Started for each extra worker process of a sync
+CLI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "cli.py")
+
+
+def worker_name():
+    """Return a name for a worker that no other process on any host
+    sharing the queue uses"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def link_key(url):
+    """Return the job key of a link given to sync"""
+    return "link:" + url
+
+
+def playlist_key(playlist_id):
+    """Return the job key of a playlist"""
+    return "playlist:" + playlist_id
+
+
+def video_key(video_id):
+    """Return the job key of a video, the same for every link and
+    playlist it is found through"""
+    return "video:" + video_id
+
+
+def sync_links(urls, max_res, max_workers=1, incremental=True,
+               cancel=None, progress=None, queue=None, processes=1):
+    """Sync every link through the job queue and return a list of
+    (url, message) pairs
+
+    If the last sync stopped before finishing, its jobs are carried on
+    with instead of queueing the links again, and any link not in it is
+    added.
+
+    Keyword arguments:
+    max_res -- int of the highest resolution to download
+    max_workers -- number of jobs run at the same time
+    incremental -- skip channel and playlist videos synced before
+    cancel -- threading.Event that stops the sync once set, raising
+        pytube_code.DownloadCancelled and leaving the rest queued
+    progress -- function called with (index, total, url) before each
+        job, where index is the number of jobs finished and total the
+        number queued so far
+    queue -- JobQueue to work from, defaults to the one at JOBS_PATH
+    processes -- number of processes working through the jobs, each
+        running max_workers at a time. The extra ones are started with
+        "cli.py --join", which can also be run on other hosts sharing
+        the queue file.
+    """
+    if queue is None:
+        queue = JobQueue(JOBS_PATH)
+    resumed = queue.recover() or queue.unfinished()
+    if resumed:
+        metrics().event("sync.resumed",
+                        f"Resuming sync with {queue.unfinished()} jobs left",
+                        jobs=queue.unfinished())
+    else:
+        queue.clear()
+    queue.set_settings({"max_res": max_res, "incremental": incremental})
+    for url in urls:
+        queue.add(link_key(url), "link", url)
+
+    children = []
+    if processes > 1 and queue.file_path != ":memory:":
+        command = [sys.executable, CLI_PATH, "--join",
+                   "--queue", os.path.abspath(queue.file_path),
+                   "--workers", str(max_workers)]
+        children = [subprocess.Popen(command, stdout=subprocess.DEVNULL)
+                    for _ in range(processes - 1)]
+    try:
+        run_jobs(queue, max_res, max_workers, incremental, cancel, progress)
+    except BaseException:
+        # Their jobs are claimed again once the leases run out
+        for child in children:
+            child.terminate()
+        raise
+    finally:
+        for child in children:
+            child.wait()
+    return finish_sync(queue)
+
+
+def join_sync(max_workers=1, cancel=None, queue=None):
+    """Work on the jobs of a sync started by another process, possibly on
+    another host, until none are left, and return the number of jobs in
+    each state
+
+    The highest resolution and whether the sync is incremental are read
+    from the queue, as the process that started the sync recorded them,
+    so every process downloads the same way. That process also writes
+    out its playlists once every job has run.
+    """
+    if queue is None:
+        queue = JobQueue(JOBS_PATH)
+    settings = queue.settings()
+    if "max_res" not in settings:
+        # No sync has been started with this queue
+        return queue.counts()
+    run_jobs(queue, settings["max_res"], max_workers,
+             settings.get("incremental", True), cancel)
+    return queue.counts()
+
+
+def run_jobs(queue, max_res, max_workers=1, incremental=True, cancel=None,
+             progress=None, owner=None, lease=LEASE_SECONDS):
+    """Run queued jobs until none are left, including the ones they
+    queue along the way and the ones other workers are running
+
+    Jobs are claimed with a lease that is renewed while they run, so a
+    job whose worker is stopped goes back to the other workers.
+
+    Keyword arguments:
+    queue -- JobQueue to take jobs from
+    owner -- string naming this worker, defaults to worker_name()
+    lease -- seconds another worker waits before taking over a job this
+        worker stopped renewing
+    """
+    if owner is None:
+        owner = worker_name()
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_renew_leases,
+                                 args=(queue, owner, lease, stop),
+                                 daemon=True)
+    heartbeat.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = set()
+            while True:
+                if cancel is not None and cancel.is_set():
+                    # Running jobs finish, the rest stay queued
+                    raise pytc.DownloadCancelled
+                job = (queue.claim(owner, lease)
+                       if len(running) < max_workers else None)
+                if job is None:
+                    if running:
+                        _, running = wait(running,
+                                          return_when=FIRST_COMPLETED)
+                    elif not queue.unfinished():
+                        break
+                    else:
+                        # Other workers hold the rest, and may queue more
+                        # or stop and leave theirs to be claimed
+                        (cancel or stop).wait(POLL_SECONDS)
+                    continue
+                if progress is not None:
+                    counts = queue.counts()
+                    progress(counts.get(DONE, 0) + counts.get(FAILED, 0),
+                             sum(counts.values()), job["url"])
+                running.add(executor.submit(run_job, queue, job, max_res,
+                                            incremental, owner))
+    finally:
+        stop.set()
+        heartbeat.join()
+
+
+def _renew_leases(queue, owner, lease, stop):
+    """Renew the leases on a worker's jobs until stop is set"""
+    while not stop.wait(lease / 3):
+        queue.renew(owner, lease)
+
+
+def run_job(queue, job, max_res, incremental=True, owner=None):
+    """Do one job and record how it went in the queue
+
+    Keyword arguments:
+    owner -- string naming the worker that claimed the job
+    """
+    recorder = metrics()
+    try:
+        with recorder.span("sync.job", kind=job["kind"], key=job["key"]):
+            result = _RUNNERS[job["kind"]](queue, job, max_res,
+                                           incremental)
+    except Exception as e:  # pylint: disable=broad-except
+        error = f"{type(e).__name__}: {e}"
+        state = queue.fail(job["key"], error, owner)
+        recorder.count("sync.job_errors", kind=job["kind"], state=state)
+        recorder.event("sync.job_error", f"{job['key']} failed: {error}",
+                       key=job["key"], attempts=job["attempts"],
+                       state=state)
+    else:
+        queue.complete(job["key"], result)
+        recorder.count("sync.jobs_done", kind=job["kind"])
+
+
+def _run_link(queue, job, max_res, incremental):
+    """Work out what a link is and queue the jobs it needs"""
+    url = job["url"]
+    try:
+        channel = pytc.YDChannel(url)
+    except pytc.InvalidChannelException:
+        pass
+    else:
+        return _queue_channel(queue, job, channel, incremental)
+
+    try:
+        playlist = pytc.YDPlaylist(url)
+    except pytc.InvalidPlaylistException:
+        pass
+    else:
+        queue.add(playlist_key(playlist.playlist_id), "playlist", url,
+                  parent=job["key"])
+        return {"message": "Valid Playlist url: " + url}
+
+    try:
+        video = pytc.YDVideo(url)
+    except VideoUnavailable:
+        return {"message": "Unavailable Video: " + url}
+    except pytc.InvalidVideoException:
+        return {"message": "Invalid Channel/Playlist/Video url: " + url}
+    queue.add(video_key(video.video_id), "video", url, parent=job["key"])
+    return {"message": "Valid Video: " + url}
+
+
+def _queue_channel(queue, job, channel, incremental):
+    """Queue a job for each new upload and each playlist of a channel"""
+    watermark = None
+    if incremental:
+        watermark = pytc.download_library().get_watermark(
+            channel.channel_url)
+    newest_url = next(iter(channel.video_urls), None)
+    video_urls = (channel.trimmed(watermark) if watermark is not None
+                  else channel.video_urls)
+    video_ids = []
+    for video_url in video_urls:
+        video_id = extract.video_id(video_url)
+        video_ids.append(video_id)
+        queue.add(video_key(video_id), "video", video_url, parent=job["key"])
+    for playlist_url in channel.playlist_urls:
+        queue.add(playlist_key(extract.playlist_id(playlist_url)),
+                  "playlist", playlist_url, parent=job["key"])
+    return {"message": "Valid Channel url: " + job["url"],
+            "channel_url": channel.channel_url,
+            # Some may already have been queued through another link
+            "videos": video_ids,
+            "newest": None if newest_url is None else
+            extract.video_id(newest_url)}
+
+
+def _run_playlist(queue, job, max_res, incremental):
+    """Queue a job for each video of a playlist, recording the order
+    they are listed in"""
+    playlist = pytc.YDPlaylist(job["url"])
+    downloads = pytc.download_library()
+    # Older versions kept playlists only in the .txt file
+    downloads.import_playlist_file(
+        playlist.playlist_id, playlist.clean_title,
+        pytc.PLAYLISTS_PATH + playlist.clean_title + ".txt")
+    video_ids = []
+    for video_url in playlist.video_urls:
+        video_id = extract.video_id(video_url)
+        video_ids.append(video_id)
+        recorded = downloads.get_video(video_id) if incremental else None
+        if recorded is not None:
+            # Playlists can gain videos anywhere, so each is checked
+            queue.add(video_key(video_id), "video", video_url,
+                      parent=job["key"], state=DONE,
+                      result=recorded["path"])
+        else:
+            queue.add(video_key(video_id), "video", video_url,
+                      parent=job["key"])
+    return {"playlist_id": playlist.playlist_id,
+            "title": playlist.clean_title, "videos": video_ids}
+
+
+def _run_video(queue, job, max_res, incremental):
+    """Download one video and return where it was saved, or None if it
+    is unavailable"""
+    # Each video has one job however many links it was found through,
+    # and its metadata is cached, so it is simply resolved here
+    try:
+        video = pytc.YDVideo(job["url"])
+    except VideoUnavailable:
+        metrics().count("video.skipped", reason="unavailable")
+        return None
+    return video.download_video(max_res)
+
+
+_RUNNERS = {"link": _run_link, "playlist": _run_playlist,
+            "video": _run_video}
+
+
+def finish_sync(queue):
+    """Write out the playlists and move the channel watermarks of a
+    sync whose jobs have all run, and return (url, message) for each
+    link
+
+    The ids of the uploads that failed, and so held a channel's
+    watermark back, are added to its link job's result as
+    "failed_videos".
+    """
+    downloads = pytc.download_library()
+    for job in queue.jobs(kind="playlist", state=DONE):
+        playlist = job["result"]
+        if not os.path.exists(pytc.PLAYLISTS_PATH):
+            os.makedirs(pytc.PLAYLISTS_PATH)
+        for video_id in playlist["videos"]:
+            video = queue.get(video_key(video_id))
+            if video is not None and video["result"]:
+                pytc.add_playlist_video(playlist["playlist_id"],
+                                        playlist["title"], video["result"])
+        downloads.write_playlist_file(
+            playlist["playlist_id"],
+            pytc.PLAYLISTS_PATH + playlist["title"] + ".txt")
+
+    failed = {job["key"] for job in queue.jobs(state=FAILED)}
+    results = []
+    for job in queue.jobs(kind="link"):
+        if job["state"] != DONE:
+            results.append((job["url"], "Sync failed: " + job["error"]))
+            continue
+        link = job["result"]
+        # Only move the watermark once every newer upload is downloaded,
+        # keeping the uploads that held it back with the link
+        link["failed_videos"] = [video_id
+                                 for video_id in link.get("videos", ())
+                                 if video_key(video_id) in failed]
+        if link.get("newest") is not None and not link["failed_videos"]:
+            downloads.set_watermark(link["channel_url"], link["newest"])
+        queue.complete(job["key"], link)
+        results.append((job["url"], link["message"]))
+    return results
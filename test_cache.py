@@ -0,0 +1,60 @@
+import tempfile
+import time
+from unittest import TestCase, mock
+import cache
+from cache import PersistentCache
+
+
+class TestPersistentCache(TestCase):
+    def test_set_and_get(self):
+        """Test values come back the way they were stored"""
+        c = PersistentCache(":memory:")
+        c.set("abc", {"clean_title": "Video.mp4", "streams": [1, 2]})
+        self.assertEqual(c.get("abc"),
+                         {"clean_title": "Video.mp4", "streams": [1, 2]})
+        self.assertIsNone(c.get("missing"))
+
+    def test_expired_entry(self):
+        """Test entries older than the ttl are treated as missing"""
+        c = PersistentCache(":memory:", ttl=0.05)
+        c.set("abc", 1)
+        time.sleep(0.1)
+        self.assertIsNone(c.get("abc"))
+        self.assertEqual(len(c), 0)
+
+    def test_least_recently_used_evicted(self):
+        """Test the least recently used entry is removed when full"""
+        c = PersistentCache(":memory:", max_entries=2)
+        with mock.patch("cache.time.time", side_effect=[0, 100, 200, 300]):
+            c.set("a", 1)
+            c.set("b", 2)
+            c.get("a")
+            c.set("c", 3)
+        self.assertEqual(c.get("a"), 1)
+        self.assertIsNone(c.get("b"))
+        self.assertEqual(c.get("c"), 3)
+
+    def test_reads_close_together_do_not_write(self):
+        """Test a read only records its access time once the last one
+        recorded is ACCESS_INTERVAL old"""
+        c = PersistentCache(":memory:")
+        with mock.patch("cache.time.time", return_value=0):
+            c.set("a", 1)
+        changes = c._connection.total_changes
+        with mock.patch("cache.time.time", return_value=1):
+            self.assertEqual(c.get("a"), 1)
+        self.assertEqual(c._connection.total_changes, changes)
+        with mock.patch("cache.time.time",
+                        return_value=cache.ACCESS_INTERVAL):
+            self.assertEqual(c.get("a"), 1)
+        self.assertEqual(c._connection.total_changes, changes + 1)
+
+    def test_persists_between_objects(self):
+        """Test entries are still there after reopening the file"""
+        with tempfile.TemporaryDirectory() as folder:
+            c = PersistentCache(folder + "/cache.db")
+            c.set("abc", "value")
+            c.close()
+            c = PersistentCache(folder + "/cache.db")
+            self.assertEqual(c.get("abc"), "value")
+            c.close()
@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase, mock
+import cli
+
+
+class TestCLI(TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.folder.name, "summary.json")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def run_cli(self, argv):
+        status = cli.main(argv + ["--output", self.output])
+        with open(self.output, "r", encoding="utf-8") as f_hand:
+            return status, json.load(f_hand)
+
+    def test_never_imports_qt(self):
+        """Test a run with nothing to download imports neither Qt nor
+        pytube"""
+        code = ("import sys, cli; cli.main(['--output', sys.argv[1]]); "
+                "print(sorted(m for m in ('PyQt5', 'pytube', 'requests') "
+                "if m in sys.modules))")
+        found = subprocess.run(
+            [sys.executable, "-c", code, self.output], check=True,
+            capture_output=True, text=True, cwd=cli.PROGRAM_PATH).stdout
+        self.assertEqual(found.strip(), "[]")
+
+    def test_url_file(self):
+        """Test blank and commented lines of a url file are skipped"""
+        file_path = os.path.join(self.folder.name, "urls.txt")
+        with open(file_path, "w", encoding="utf-8") as f_hand:
+            f_hand.write("# subscriptions\nhttps://youtu.be/a\n\n"
+                         "  https://youtu.be/b  \n")
+        self.assertEqual(cli.read_url_file(file_path),
+                         ["https://youtu.be/a", "https://youtu.be/b"])
+
+    def test_summary(self):
+        """Test every link is synced with the given options and a
+        failure is reported without stopping the rest"""
+        def fake_download(url, max_res, max_workers, incremental,
+                          downloaded):
+            if url == "bad":
+                raise ValueError("broken")
+            return "Valid Video: " + url
+
+        with mock.patch("pytube_code.download_link",
+                        side_effect=fake_download) as download:
+            status, summary = self.run_cli(["good", "bad", "-w", "2",
+                                            "-r", "480", "-i"])
+        download.assert_any_call("good", 480, 2, True, downloaded={})
+        self.assertEqual(status, 1)
+        self.assertEqual((summary["synced"], summary["failed"]), (1, 1))
+        self.assertEqual(summary["results"][1]["error"],
+                         "ValueError: broken")
+
+    def test_success_status(self):
+        """Test the exit status is 0 when every link synced"""
+        with mock.patch("pytube_code.download_link",
+                        return_value="Valid Playlist url: x"):
+            status, summary = self.run_cli(["x"])
+        self.assertEqual(status, 0)
+        self.assertTrue(summary["ok"])
+
+    def test_transfer_limits(self):
+        """Test --max-rate and --connections-per-host limit every
+        download and are passed on to worker processes"""
+        import transfer
+
+        with mock.patch.dict(os.environ), \
+                mock.patch("transfer.configure_scheduler") as configure:
+            self.run_cli(["--max-rate", "2M", "--connections-per-host",
+                          "2"])
+            self.assertEqual(os.environ[transfer.MAX_RATE_VARIABLE], "2M")
+        configure.assert_called_once_with(2 * 1024 ** 2, 2)
+        with mock.patch.dict(os.environ):
+            self.assertEqual(cli.main(["--max-rate", "fast"]), 2)
@@ -0,0 +1,57 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from urllib.error import HTTPError
+from pytube import request
+import http_client
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serves a small page with keep-alive, or 404 for /missing"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        body = b"<html>page</html>"
+        self.send_response(404 if self.path == "/missing" else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPClient(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.client = http_client.configure_client(pool_size=4)
+
+    def test_connections_reused(self):
+        """Test one keep-alive connection serves every request"""
+        for _ in range(5):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.stats(), {
+            "requests": 5, "connections_opened": 1,
+            "connections_reused": 4})
+
+    def test_pytube_requests_use_pool(self):
+        """Test pytube's requests go through the shared client"""
+        http_client.install_pytube_hook()
+        self.assertEqual(request.get(self.url), "<html>page</html>")
+        self.assertEqual(request.get(self.url), "<html>page</html>")
+        self.assertEqual(self.client.stats()["connections_reused"], 1)
+
+    def test_pytube_errors(self):
+        """Test failures reach pytube as the urllib errors it expects"""
+        http_client.install_pytube_hook()
+        with self.assertRaises(HTTPError):
+            request.get(self.url + "missing")
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+import jobs
+from jobs import JobQueue
+
+
+def work_through(file_path, owner):
+    """Claim and finish jobs in another process until none are left"""
+    queue = JobQueue(file_path)
+    while True:
+        job = queue.claim(owner, lease=30)
+        if job is None:
+            break
+        queue.complete(job["key"], owner)
+    queue.close()
+
+
+def claim_and_stop(file_path):
+    """Claim a job in another process and exit without finishing it"""
+    JobQueue(file_path).claim("stopped", lease=0.2)
+
+
+class TestJobQueue(TestCase):
+    def setUp(self):
+        self.queue = JobQueue(":memory:", max_attempts=2)
+
+    def test_same_key_queued_once(self):
+        """Test a job is not queued twice under the same key"""
+        self.assertTrue(self.queue.add("video:a", "video", "url-a"))
+        self.assertFalse(self.queue.add("video:a", "video", "url-b",
+                                        parent="link:x"))
+        self.assertEqual(self.queue.get("video:a")["url"], "url-a")
+        self.assertEqual(self.queue.unfinished(), 1)
+
+    def test_claim_in_order(self):
+        """Test jobs are claimed oldest first and only once"""
+        self.queue.add("link:a", "link", "a")
+        self.queue.add("link:b", "link", "b")
+        first = self.queue.claim()
+        self.assertEqual((first["key"], first["state"], first["attempts"]),
+                         ("link:a", jobs.RUNNING, 1))
+        self.assertEqual(self.queue.claim()["key"], "link:b")
+        self.assertIsNone(self.queue.claim())
+        self.queue.complete("link:a", {"message": "done"})
+        self.assertEqual(self.queue.get("link:a")["result"],
+                         {"message": "done"})
+
+    def test_failed_job_retried_then_left(self):
+        """Test a failing job is queued again until it runs out of
+        attempts"""
+        self.queue.add("video:a", "video", "a")
+        self.queue.claim()
+        self.assertEqual(self.queue.fail("video:a", "OSError"),
+                         jobs.PENDING)
+        self.queue.claim()
+        self.assertEqual(self.queue.fail("video:a", "OSError"), jobs.FAILED)
+        self.assertIsNone(self.queue.claim())
+        self.assertEqual(len(self.queue.jobs(state=jobs.FAILED)), 1)
+        self.assertIsNone(self.queue.fail("video:gone", "OSError"))
+
+    def test_running_jobs_recovered_after_crash(self):
+        """Test jobs left running in the file are queued again when it
+        is opened next"""
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = os.path.join(folder, "jobs.db")
+            queue = JobQueue(file_path)
+            queue.add("video:a", "video", "a")
+            queue.add("video:b", "video", "b", state=jobs.DONE,
+                      result="A/b.mp4")
+            queue.claim()
+            queue.close()
+
+            queue = JobQueue(file_path)
+            self.assertEqual(queue.recover(), 1)
+            self.assertEqual(queue.claim()["key"], "video:a")
+            self.assertEqual(queue.get("video:b")["result"], "A/b.mp4")
+            queue.close()
+
+    def test_expired_lease_claimed_again(self):
+        """Test a job is handed to another worker once its lease runs out,
+        and the first worker can no longer fail it"""
+        self.queue.add("video:a", "video", "a")
+        self.queue.claim("one", lease=30)
+        self.assertIsNone(self.queue.claim("two", lease=30))
+        self.assertEqual(self.queue.renew("one", 30), 1)
+        later = time.time() + 31
+        with mock.patch("jobs.time.time", return_value=later):
+            job = self.queue.claim("two", lease=30)
+        self.assertEqual((job["key"], job["owner"], job["attempts"]),
+                         ("video:a", "two", 2))
+        self.assertIsNone(self.queue.fail("video:a", "OSError", "one"))
+        self.assertEqual(self.queue.get("video:a")["state"], jobs.RUNNING)
+
+    def test_settings_kept_until_cleared(self):
+        """Test the settings of a sync are kept, updated in place, until
+        the queue is cleared for the next one"""
+        self.queue.set_settings({"max_res": 720, "incremental": True})
+        self.queue.set_settings({"max_res": 360})
+        self.assertEqual(self.queue.settings(),
+                         {"max_res": 360, "incremental": True})
+        self.queue.clear()
+        self.assertEqual(self.queue.settings(), {})
+
+
+class TestJobQueueProcesses(TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.file_path = os.path.join(folder.name, "jobs.db")
+        self.context = multiprocessing.get_context("spawn")
+
+    def test_processes_claim_each_job_once(self):
+        """Test workers in several processes share the jobs without any
+        being claimed twice"""
+        queue = JobQueue(self.file_path)
+        for number in range(200):
+            queue.add(f"video:{number}", "video", str(number))
+        workers = [self.context.Process(target=work_through,
+                                        args=(self.file_path, f"w{number}"))
+                   for number in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        done = queue.jobs(state=jobs.DONE)
+        self.assertEqual(len(done), 200)
+        self.assertTrue(all(job["attempts"] == 1 for job in done))
+        queue.close()
+
+    def test_stopped_process_job_claimed_again(self):
+        """Test the job of a process that exits without finishing it is
+        claimed again once its lease runs out"""
+        queue = JobQueue(self.file_path)
+        queue.add("video:a", "video", "a")
+        worker = self.context.Process(target=claim_and_stop,
+                                      args=(self.file_path,))
+        worker.start()
+        worker.join()
+        self.assertEqual(queue.recover(), 0)
+        self.assertIsNone(queue.claim("next", lease=30))
+        time.sleep(0.3)
+        job = queue.claim("next", lease=30)
+        self.assertEqual((job["key"], job["attempts"]), ("video:a", 2))
+        queue.close()
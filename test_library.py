@@ -0,0 +1,58 @@
+import os
+import tempfile
+from unittest import TestCase
+from library import Library
+
+
+class TestLibrary(TestCase):
+    def setUp(self):
+        self.library = Library(":memory:")
+
+    def tearDown(self):
+        self.library.close()
+
+    def test_record_video(self):
+        """Test a recorded video can be looked up by id"""
+        self.library.record_video("abc", "Author/Video.mp4", "Author", 10)
+        self.assertTrue(self.library.has_video("abc"))
+        self.assertFalse(self.library.has_video("xyz"))
+        self.assertEqual(self.library.get_video("abc")["size"], 10)
+
+    def test_playlist_keeps_order_without_duplicates(self):
+        """Test playlist entries stay in order and are only added once"""
+        self.assertTrue(self.library.add_to_playlist("PL1", "A/1.mp4"))
+        self.assertTrue(self.library.add_to_playlist("PL1", "A/2.mp4"))
+        self.assertFalse(self.library.add_to_playlist("PL1", "A/1.mp4"))
+        self.assertTrue(self.library.add_to_playlist("PL2", "A/1.mp4"))
+        self.assertEqual(self.library.playlist_entries("PL1"),
+                         ["A/1.mp4", "A/2.mp4"])
+        self.assertTrue(self.library.in_playlist("PL2", "A/1.mp4"))
+
+    def test_video_playlists(self):
+        """Test finding the playlists a video belongs to"""
+        self.library.record_video("abc", "A/1.mp4", "A", 10)
+        self.library.add_to_playlist("PL1", "A/1.mp4")
+        self.library.add_to_playlist("PL2", "A/1.mp4")
+        self.assertEqual(sorted(self.library.video_playlists("abc")),
+                         ["PL1", "PL2"])
+
+    def test_playlist_file_round_trip(self):
+        """Test an old .txt playlist is imported and written back out"""
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = os.path.join(folder, "Playlist.txt")
+            with open(file_path, "w", encoding="utf-8") as fplaylist:
+                fplaylist.writelines(["A/1.mp4\n", "A/2.mp4\n"])
+            self.library.import_playlist_file("PL1", "Playlist", file_path)
+            self.library.add_to_playlist("PL1", "A/3.mp4")
+            self.library.add_to_playlist("PL1", "A/1.mp4")
+            self.library.write_playlist_file("PL1", file_path)
+            with open(file_path, "r", encoding="utf-8") as fplaylist:
+                self.assertEqual(fplaylist.readlines(),
+                                 ["A/1.mp4\n", "A/2.mp4\n", "A/3.mp4\n"])
+
+    def test_watermark(self):
+        """Test the newest synced video is remembered per source"""
+        self.assertIsNone(self.library.get_watermark("channel"))
+        self.library.set_watermark("channel", "abc")
+        self.library.set_watermark("channel", "def")
+        self.assertEqual(self.library.get_watermark("channel"), "def")
@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+import metrics
+from metrics import Metrics, MemorySink, JSONLSink
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.sink = MemorySink()
+        self.recorder = Metrics([self.sink])
+
+    def test_span_records_duration_and_fields(self):
+        """Test a span is emitted with its name, duration and fields"""
+        with self.recorder.span("video.transfer", video_id="abc"):
+            pass
+        record = self.sink.records[0]
+        self.assertEqual(record["type"], "span")
+        self.assertEqual(record["name"], "video.transfer")
+        self.assertEqual(record["video_id"], "abc")
+        self.assertGreaterEqual(record["duration"], 0)
+
+    def test_span_records_error(self):
+        """Test a span that raised is emitted with the error's type"""
+        with self.assertRaises(ValueError):
+            with self.recorder.span("video.manifest"):
+                raise ValueError
+        self.assertEqual(self.sink.records[0]["error"], "ValueError")
+
+    def test_counters_total(self):
+        """Test counts are emitted and added up"""
+        self.recorder.count("transfer.bytes", 10)
+        self.recorder.count("transfer.bytes", 5)
+        self.recorder.count("video.skipped", reason="downloaded")
+        self.assertEqual(self.recorder.counters(),
+                         {"transfer.bytes": 15, "video.skipped": 1})
+        self.assertEqual(self.sink.records[2]["reason"], "downloaded")
+
+    def test_disabled_records_nothing(self):
+        """Test a recorder with no sinks hands out the shared null span"""
+        recorder = Metrics()
+        self.assertFalse(recorder.enabled)
+        self.assertIs(recorder.span("a"), recorder.span("b"))
+        recorder.count("transfer.bytes", 10)
+        recorder.event("video.created", "message")
+        self.assertEqual(recorder.counters(), {})
+
+    def test_jsonl_sink(self):
+        """Test each record is written as one line of JSON with the
+        counter totals last"""
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = os.path.join(folder, "metrics.jsonl")
+            recorder = Metrics([JSONLSink(file_path)])
+            with recorder.span("playlist.init"):
+                recorder.event("playlist.download", "Downloading")
+            recorder.count("video.downloaded")
+            recorder.close()
+            with open(file_path, "r", encoding="utf-8") as f_hand:
+                records = [json.loads(line) for line in f_hand]
+        self.assertEqual([record["type"] for record in records],
+                         ["event", "span", "count", "counters"])
+        self.assertEqual(records[-1]["counters"], {"video.downloaded": 1})
+
+    def test_configure_metrics(self):
+        """Test the shared recorder can be switched on and off"""
+        sink = MemorySink()
+        metrics.configure_metrics(sinks=[sink])
+        try:
+            metrics.metrics().event("video.created")
+            self.assertEqual(len(sink.records), 1)
+        finally:
+            metrics.configure_metrics()
+        self.assertFalse(metrics.metrics().enabled)
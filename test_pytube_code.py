@@ -1,8 +1,15 @@
+import json
 import os
-from unittest import TestCase
+import shutil
+import threading
+import time
+from unittest import TestCase, mock
 import pytube_code as pytc
 from pytube_code import YDVideo, YDPlaylist, YDChannel
 from pytube.exceptions import VideoUnavailable, AgeRestrictedError
+from cache import PersistentCache
+from library import Library
+from metrics import MemorySink, configure_metrics
 
 
 class TestYDVideo(TestCase):
@@ -82,9 +89,8 @@ class TestYDChannel(TestCase):
     def setUpClass(self):
         playlists_path = os.pardir + "/YouTube-Downloads/Playlists/"
         if os.path.isdir(playlists_path):
-            for filename in os.listdir(playlists_path):
-                os.unlink(playlists_path + filename)
-            os.rmdir(playlists_path)
+            # Holds a folder of links for each playlist besides its .txt
+            shutil.rmtree(playlists_path)
         self.c = YDChannel("https://www.youtube.com/@standjardanjar")
 
     def test_download_channel_videos(self):
@@ -111,6 +117,17 @@ class Test(TestCase):
         # not_channel = "https://www.youtube.com/watch?v=XKN3uZX2QMA"
         # self.assertFalse(pytc.check_channel_or_playlist_url(not_channel))
 
+    def test_playlist_or_invalid_url(self):
+        """Test a playlist is accepted and anything else is turned down
+        instead of raising"""
+        self.assertTrue(pytc.check_channel_or_playlist_url(
+            "https://www.youtube.com/playlist?list=PLa"))
+        self.assertTrue(pytc.check_channel_or_playlist_url(
+            "https://www.youtube.com/c/a"))
+        self.assertFalse(pytc.check_channel_or_playlist_url(
+            "https://www.youtube.com/watch?v=XKN3uZX2QMA"))
+        self.assertFalse(pytc.check_channel_or_playlist_url("not a link"))
+
     def test_download_link(self):
         """Test if downloading link figures out what to do correctly"""
         valid_channel = "https://www.youtube.com/@standjardanjar"
@@ -134,3 +151,213 @@ class Test(TestCase):
         unavailable_video = "https://www.youtube.com/watch?v=XKN3uZX2QMA"
         m = pytc.download_link(unavailable_video, 720)
         self.assertEqual(m, "Unavailable Video: " + unavailable_video)
+
+
+class FakeVideo:
+    """Stand-in for YDVideo that finishes after a short delay"""
+    def __init__(self, name, delay):
+        self.name = name
+        self.video_id = name
+        self.delay = delay
+
+    def download_video(self, max_res, cancel=None):
+        time.sleep(self.delay)
+        if self.name.startswith("age"):
+            return self.name + " (Skipped as Age Restricted)"
+        return self.name
+
+
+class TestDownloadVideos(TestCase):
+    def test_download_videos_keeps_order(self):
+        """Test parallel downloads return results in the original order"""
+        videos = [FakeVideo("slow", 0.2), FakeVideo("age", 0.0),
+                  FakeVideo("fast", 0.05)]
+        results = list(pytc.download_videos(videos, 720, max_workers=3))
+        self.assertEqual(results, ["slow", "age (Skipped as Age Restricted)",
+                                   "fast"])
+
+    def test_download_videos_runs_in_parallel(self):
+        """Test the wall-clock time is close to the slowest download"""
+        videos = [FakeVideo(str(i), 0.2) for i in range(4)]
+        start = time.perf_counter()
+        list(pytc.download_videos(videos, 720, max_workers=4))
+        self.assertLess(time.perf_counter() - start, 0.6)
+
+    def test_download_videos_cancelled(self):
+        """Test setting cancel stops queueing videos and raises"""
+        cancel = threading.Event()
+        videos = [FakeVideo(str(i), 0.05) for i in range(20)]
+        results = []
+        with self.assertRaises(pytc.DownloadCancelled):
+            for result in pytc.download_videos(videos, 720, max_workers=2,
+                                               cancel=cancel):
+                results.append(result)
+                cancel.set()
+        self.assertEqual(results, ["0"])
+
+
+class TestResolveVideos(TestCase):
+    def test_resolve_videos_is_lazy(self):
+        """Test videos are only built when the consumer asks for them"""
+        built = []
+
+        def fake_video(url):
+            if url == "private":
+                raise VideoUnavailable(video_id=url)
+            built.append(url)
+            return url
+
+        with mock.patch.object(pytc, "YDVideo", side_effect=fake_video):
+            videos = pytc._resolve_videos(["a", "private", "b", "c"])
+            self.assertEqual(next(videos), "a")
+            self.assertEqual(built, ["a"])
+            self.assertEqual(list(videos), ["b", "c"])
+
+    def test_resolve_videos_skips_downloaded(self):
+        """Test videos already in the library are not resolved again"""
+        downloads = Library(":memory:")
+        downloads.record_video("T5KBMhw87n8", "A/Meme.mp4", "A", 10)
+        urls = ["https://www.youtube.com/watch?v=T5KBMhw87n8",
+                "https://www.youtube.com/watch?v=dQw4w9WgXcQ"]
+        with mock.patch.object(pytc, "download_library",
+                               return_value=downloads), \
+                mock.patch.object(pytc, "YDVideo",
+                                  side_effect=lambda url: url):
+            videos = list(pytc._resolve_videos(urls, skip_downloaded=True))
+        self.assertEqual(videos[0].download_video(720), "A/Meme.mp4")
+        self.assertEqual(videos[1], urls[1])
+
+    def test_resolve_videos_once_per_sync(self):
+        """Test a video downloaded earlier in the same sync is not
+        resolved again, and only its path is kept"""
+        urls = ["https://www.youtube.com/watch?v=T5KBMhw87n8",
+                "https://youtu.be/T5KBMhw87n8"]
+        downloaded = {}
+        with mock.patch.object(
+                pytc, "YDVideo",
+                side_effect=lambda url: FakeVideo("T5KBMhw87n8", 0)) as built:
+            results = list(pytc.download_videos(
+                pytc._resolve_videos(urls, downloaded=downloaded), 720,
+                downloaded=downloaded))
+        self.assertEqual(built.call_count, 1)
+        self.assertEqual(results, ["T5KBMhw87n8", "T5KBMhw87n8"])
+        self.assertEqual(downloaded, {"T5KBMhw87n8": "T5KBMhw87n8"})
+
+
+class TestVideoMetadataCache(TestCase):
+    def test_video_filled_from_cache(self):
+        """Test a cached video is built without touching the network"""
+        c = PersistentCache(":memory:")
+        c.set("T5KBMhw87n8", {
+            "title": "ElderScrollsKnightMeme.mp4",
+            "author": "standjar danjar",
+            "clean_title": "ElderScrollsKnightMeme.mp4.mp4",
+            "clean_author": "standjar danjar",
+            "download_path": "../YouTube-Downloads/standjar danjar/",
+            "streams": [{"itag": 18, "resolution": "360p",
+                         "subtype": "mp4", "progressive": True,
+                         "bitrate": 1, "filesize": 0}]})
+        with mock.patch("pytube.request._execute_request") as request:
+            v = YDVideo("https://youtu.be/T5KBMhw87n8?feature=shared",
+                        cache=c)
+            self.assertEqual(v.clean_author, "standjar danjar")
+            self.assertEqual(v.title, "ElderScrollsKnightMeme.mp4")
+            request.assert_not_called()
+
+    def test_cached_video_gone_is_skipped(self):
+        """Test a cached video that has since been removed is skipped
+        and dropped from the cache"""
+        c = PersistentCache(":memory:")
+        c.set("T5KBMhw87n8", {
+            "title": "Meme", "author": "A", "clean_title": "Meme.mp4",
+            "clean_author": "A", "download_path": "../YouTube-Downloads/A/",
+            "streams": None})
+        gone = mock.PropertyMock(
+            side_effect=VideoUnavailable(video_id="T5KBMhw87n8"))
+        with mock.patch.object(pytc, "download_library",
+                               return_value=Library(":memory:")), \
+                mock.patch("pytube.YouTube.streams", new=gone):
+            v = YDVideo("https://youtu.be/T5KBMhw87n8", cache=c)
+            self.assertIsNone(v.download_video(720))
+        self.assertNotIn("T5KBMhw87n8", c)
+
+
+class TestChannelDiscovery(TestCase):
+    def test_page_key(self):
+        """Test different spellings of a page give the same key"""
+        self.assertEqual(pytc._page_key("https://www.youtube.com/c/foo/"),
+                         pytc._page_key("https://youtube.com/c/foo"))
+        self.assertNotEqual(
+            pytc._page_key("https://www.youtube.com/c/foo/videos/"),
+            pytc._page_key("https://www.youtube.com/c/foo/playlists/"))
+
+    def test_each_page_fetched_once(self):
+        """Test discovery fetches each distinct page once and keeps the
+        order the playlists were found in"""
+        pages = {
+            "https://www.youtube.com/c/foo/": ["PL2", "PL1", "WL"],
+            "https://www.youtube.com/c/foo/videos": ["PL1"],
+            "https://www.youtube.com/c/foo/playlists/": ["PL3", "PL2"],
+            "https://www.youtube.com/c/foo/releases/": []}
+        fetched = []
+
+        def fake_get(url, **kwargs):
+            fetched.append(url)
+            ids = [{"playlistId": playlist_id} for playlist_id in pages[url]]
+            return "var ytInitialData = " + json.dumps({"items": ids}) + ";"
+
+        with mock.patch("pytube.request.get", side_effect=fake_get):
+            c = YDChannel("https://www.youtube.com/c/foo")
+        self.assertEqual(sorted(fetched), sorted(pages))
+        self.assertEqual(c.playlist_urls, [
+            "https://www.youtube.com/playlist?list=PL2",
+            "https://www.youtube.com/playlist?list=PL1",
+            "https://www.youtube.com/playlist?list=PL3"])
+
+    def test_page_phases_timed(self):
+        """Test each channel page's fetch and parse are timed"""
+        def fake_get(url, **kwargs):
+            return "var ytInitialData = {};"
+
+        sink = MemorySink()
+        configure_metrics(sinks=[sink])
+        try:
+            with mock.patch("pytube.request.get", side_effect=fake_get):
+                YDChannel("https://www.youtube.com/c/foo")
+        finally:
+            configure_metrics()
+        names = [record["name"] for record in sink.records
+                 if record["type"] == "span"]
+        self.assertEqual(names.count("channel.page_fetch"), 4)
+        self.assertEqual(names.count("channel.parse"), 4)
+        self.assertEqual(names[-1], "channel.init")
+
+
+class TestWalkKeys(TestCase):
+    def test_find_ids_in_order(self):
+        """Test every matching value is found with list order kept"""
+        data = {"a": [{"playlistId": "PL1"}, {"b": {"playlistId": "PL2"}},
+                      "text", 3, None],
+                "c": {"playlistId": "PL3"}}
+        self.assertEqual(list(pytc._find_ids("playlistId", data)),
+                         ["PL1", "PL2", "PL3"])
+        data = {"a": {"playlistId": "PL1"}, "b": {"playlistId": "PL2"},
+                "c": [{"playlistId": "PL3"}, {"playlistId": "PL4"}]}
+        self.assertEqual(list(pytc._find_ids("playlistId", data)),
+                         ["PL1", "PL2", "PL3", "PL4"])
+
+    def test_several_keys_and_skip(self):
+        """Test several keys in one pass and skipping a top-level
+        subtree"""
+        data = {"videoId": "v1", "playlistId": "PL1",
+                "frameworkUpdates": {"playlistId": "PL2"}}
+        found = set(pytc._walk_keys(("videoId", "playlistId"), data,
+                                    ("frameworkUpdates",)))
+        self.assertEqual(found, {("videoId", "v1"), ("playlistId", "PL1")})
+
+    def test_deep_tree(self):
+        """Test trees deeper than the recursion limit are walked"""
+        data = {"playlistId": "PL1"}
+        for _ in range(5000):
+            data = {"contents": [data]}
+        self.assertEqual(list(pytc._find_ids("playlistId", data)), ["PL1"])
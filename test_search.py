@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+from unittest import TestCase, mock
+from pytube.exceptions import AgeRestrictedError
+from cache import PersistentCache
+import search
+
+
+class FakeSearch:
+    """Stands in for pytube.Search, returning batches of fake videos"""
+    batches = []
+
+    def __init__(self, query):
+        self.query = query
+        self.continuations = []
+
+    def fetch_and_parse(self, continuation=None):
+        self.continuations.append(continuation)
+        number = 0 if continuation is None else int(continuation)
+        videos = [SimpleNamespace(title=f"v{number}{i}", author="a",
+                                  length=60, thumbnail_url=f"t{number}{i}",
+                                  watch_url=f"w{number}{i}")
+                  for i in range(self.batches[number])]
+        if number + 1 < len(self.batches):
+            return videos, str(number + 1)
+        return videos, None
+
+
+class TestSearchResults(TestCase):
+    def setUp(self):
+        FakeSearch.batches = [4, 4, 2]
+        patcher = mock.patch("pytube.Search", FakeSearch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.results = search.SearchResults("query", page_size=3)
+
+    def test_page_count(self):
+        """Test a short last page is counted until more results
+        arrive"""
+        self.results.fetch_next()
+        self.assertEqual(self.results.page_count(), 2)
+        self.assertEqual(self.results[3].watch_url, "w03")
+
+    def test_batches_follow_continuations(self):
+        """Test each fetch uses the continuation of the one before and
+        fetching stops once there is none"""
+        self.assertEqual([self.results.fetch_next() for _ in range(4)],
+                         [4, 4, 2, 0])
+        self.assertEqual(self.results._search.continuations,
+                         [None, "1", "2"])
+        self.assertTrue(self.results.exhausted)
+        self.assertEqual(len(self.results), 10)
+
+    def test_wants_more_near_the_end(self):
+        """Test more results are wanted only close to the last page"""
+        self.assertTrue(self.results.wants_more(0))
+        self.results.fetch_next()
+        self.results.fetch_next()
+        self.assertFalse(self.results.wants_more(0))
+        self.assertTrue(self.results.wants_more(1))
+        self.results.fetch_next()
+        self.assertFalse(self.results.wants_more(3))
+
+    def test_failed_fetch_can_be_retried(self):
+        """Test a batch that failed is fetched again with the same
+        continuation"""
+        self.results.fetch_next()
+        with mock.patch.object(FakeSearch, "fetch_and_parse",
+                               side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.results.fetch_next()
+        self.assertEqual(self.results.fetch_next(), 4)
+        self.assertEqual(len(self.results), 8)
+
+    def test_result_that_fails_is_skipped(self):
+        """Test a result whose details raise is left out of its batch
+        and the others are kept"""
+        class Restricted:
+            watch_url = "w00"
+
+            @property
+            def length(self):
+                raise AgeRestrictedError("w00")
+
+        fetch_and_parse = FakeSearch.fetch_and_parse
+
+        def first_restricted(fake, continuation=None):
+            videos, continuation = fetch_and_parse(fake, continuation)
+            return [Restricted()] + videos[1:], continuation
+
+        with mock.patch.object(FakeSearch, "fetch_and_parse",
+                               first_restricted):
+            self.assertEqual(self.results.fetch_next(), 3)
+        self.assertEqual([result.watch_url for result in self.results],
+                         ["w01", "w02", "w03"])
+        self.assertEqual(self.results.fetch_next(), 4)
+
+    def test_cached_search_starts_where_it_stopped(self):
+        """Test the same search, typed differently, starts from the
+        cached results and continues from the cached continuation"""
+        cache = PersistentCache(":memory:")
+        first = search.SearchResults("Cat  Videos", cache=cache)
+        first.fetch_next()
+        with mock.patch("pytube.Search") as pytube_search:
+            again = search.SearchResults(" cat videos", cache=cache)
+            self.assertTrue(again.cached)
+            self.assertEqual(again[3], first[3])
+            self.assertEqual(len(again), 4)
+            pytube_search.assert_not_called()
+        again.fetch_next()
+        self.assertEqual(again._search.continuations, ["1"])
+        self.assertEqual(len(search.SearchResults("cat videos",
+                                                  cache=cache)), 8)
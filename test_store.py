@@ -0,0 +1,51 @@
+import errno
+import os
+import tempfile
+from unittest import TestCase, mock
+import store
+
+
+class TestVideoStore(TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = store.VideoStore(os.path.join(self.folder.name,
+                                                   ".store"))
+        self.file_path = os.path.join(self.folder.name, "Author", "V.mp4")
+        os.makedirs(os.path.dirname(self.file_path))
+        with open(self.file_path, "wb") as f_hand:
+            f_hand.write(b"video")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_add_and_link(self):
+        """Test a video is kept once and shows up in each view as a link
+        to the same file"""
+        self.store.add("T5KBMhw87n8", self.file_path)
+        self.assertTrue(self.store.has("T5KBMhw87n8", 5))
+        self.assertFalse(self.store.has("T5KBMhw87n8", 6))
+        view = os.path.join(self.folder.name, "Playlists", "P", "V.mp4")
+        self.store.link("T5KBMhw87n8", view)
+        self.store.link("T5KBMhw87n8", view)
+        self.assertTrue(os.path.samefile(view, self.file_path))
+        self.assertEqual(os.stat(self.file_path).st_nlink, 3)
+
+    def test_link_replaces_other_file(self):
+        """Test a different file at the view is replaced by the stored
+        video"""
+        self.store.add("T5KBMhw87n8", self.file_path)
+        view = os.path.join(self.folder.name, "Other.mp4")
+        with open(view, "wb") as f_hand:
+            f_hand.write(b"old")
+        self.store.link("T5KBMhw87n8", view)
+        self.assertTrue(os.path.samefile(view, self.file_path))
+
+    def test_copy_without_links(self):
+        """Test the file is copied where links are not supported"""
+        view = os.path.join(self.folder.name, "Copy.mp4")
+        with mock.patch("os.link",
+                        side_effect=OSError(errno.EXDEV, "cross device")):
+            store.link_file(self.file_path, view)
+        self.assertFalse(os.path.samefile(view, self.file_path))
+        with open(view, "rb") as f_hand:
+            self.assertEqual(f_hand.read(), b"video")
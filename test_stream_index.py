@@ -0,0 +1,62 @@
+from unittest import TestCase
+import stream_index
+from stream_index import StreamIndex
+
+
+def record(itag, resolution, bitrate, filesize, progressive=True,
+           subtype="mp4"):
+    return {"itag": itag, "resolution": resolution, "subtype": subtype,
+            "progressive": progressive, "bitrate": bitrate,
+            "filesize": filesize}
+
+
+RECORDS = [
+    record(22, "720p", 2000, 50 * 1024 * 1024),
+    record(18, "360p", 500, 12 * 1024 * 1024),
+    record(17, "144p", 100, 2 * 1024 * 1024, subtype="3gpp"),
+    record(160, "144p", 80, 1024 * 1024, progressive=False),
+    record(140, None, 128, 3 * 1024 * 1024),
+    record(59, "480p", 900, 25 * 1024 * 1024),
+    record(60, "480p", 700, 20 * 1024 * 1024),
+]
+
+
+class TestStreamIndex(TestCase):
+    def setUp(self):
+        self.index = StreamIndex(RECORDS)
+
+    def test_only_progressive_mp4_indexed(self):
+        """Test streams are filtered and sorted by resolution then bitrate"""
+        self.assertEqual([r["itag"] for r in self.index.records],
+                         [18, 60, 59, 22])
+
+    def test_best_under_resolution(self):
+        """Test the best stream at or below the cap is picked"""
+        self.assertEqual(self.index.select(
+            stream_index.best_under_resolution(720))["itag"], 22)
+        self.assertEqual(self.index.select(
+            stream_index.best_under_resolution(480))["itag"], 59)
+        # Falls back to the lowest stream like before
+        self.assertEqual(self.index.select(
+            stream_index.best_under_resolution(144))["itag"], 18)
+
+    def test_smallest_over_resolution(self):
+        """Test the smallest stream at or above the floor is picked"""
+        self.assertEqual(self.index.select(
+            stream_index.smallest_over_resolution(400))["itag"], 60)
+        self.assertEqual(self.index.select(
+            stream_index.smallest_over_resolution(1080))["itag"], 22)
+
+    def test_best_under_size(self):
+        """Test the best stream that fits in a size budget is picked"""
+        self.assertEqual(self.index.select(
+            stream_index.best_under_size(30))["itag"], 59)
+        self.assertEqual(self.index.select(
+            stream_index.best_under_size(21))["itag"], 60)
+        self.assertEqual(self.index.select(
+            stream_index.best_under_size(1))["itag"], 18)
+
+    def test_empty_index(self):
+        """Test an index with no usable streams selects nothing"""
+        self.assertIsNone(StreamIndex([]).select(
+            stream_index.best_under_resolution(720)))
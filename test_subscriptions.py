@@ -0,0 +1,126 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+import subscriptions
+from jobs import JobQueue, DONE, FAILED
+from library import Library
+from subscriptions import SubscriptionStore
+
+
+class TestSubscriptions(TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.file_path = os.path.join(self.folder.name, "programInfo.txt")
+        self.store = SubscriptionStore(":memory:")
+
+    def write(self, text):
+        with open(self.file_path, "w", encoding="utf-8") as f_hand:
+            f_hand.write(text)
+
+    def test_add_and_kind(self):
+        """Test a url is subscribed once and its kind worked out"""
+        self.assertTrue(self.store.add("https://youtube.com/c/a "))
+        self.assertFalse(self.store.add("https://youtube.com/c/a"))
+        self.store.add("https://youtube.com/playlist?list=PLa")
+        self.assertEqual(
+            [(row["url"], row["kind"])
+             for row in self.store.subscriptions()],
+            [("https://youtube.com/c/a", subscriptions.CHANNEL),
+             ("https://youtube.com/playlist?list=PLa",
+              subscriptions.PLAYLIST)])
+
+    def test_update_date(self):
+        """Test updates are due until they are fetched today"""
+        self.assertTrue(subscriptions.updates_due(self.store))
+        subscriptions.update_date(self.store)
+        self.assertFalse(subscriptions.updates_due(self.store))
+
+    def test_migrate_file(self):
+        """Test the old text file is moved in once, keeping its date and
+        the order of its urls"""
+        self.write("Mon Jan  1 00:00:00 2024\n\nhttps://youtube.com/c/a\n"
+                   "https://youtube.com/c/b\n")
+        self.assertEqual(self.store.migrate_file(self.file_path), 2)
+        self.assertEqual(self.store.urls(), ["https://youtube.com/c/a",
+                                             "https://youtube.com/c/b"])
+        self.assertEqual(self.store.fetched_on(), "2024-01-01")
+        self.assertFalse(os.path.exists(self.file_path))
+
+        self.write("Mon Jan  1 00:00:00 2024\nhttps://youtube.com/c/c\n")
+        self.assertEqual(self.store.migrate_file(self.file_path), 0)
+        self.assertEqual(len(self.store.urls()), 2)
+
+    def test_stalest_first(self):
+        """Test subscriptions never synced come first, then the oldest
+        sync, and a failure keeps the last sync time"""
+        for name in "abc":
+            self.store.add("https://youtube.com/c/" + name)
+        with mock.patch("subscriptions.time.time", return_value=200):
+            self.store.record_sync("https://youtube.com/c/a", "v2")
+        with mock.patch("subscriptions.time.time", return_value=100):
+            self.store.record_sync("https://youtube.com/c/c", "v1")
+        self.store.record_sync("https://youtube.com/c/c", error="OSError")
+        self.assertEqual(self.store.urls(stalest_first=True),
+                         ["https://youtube.com/c/b", "https://youtube.com/c/c",
+                          "https://youtube.com/c/a"])
+        record = self.store.get("https://youtube.com/c/c")
+        self.assertEqual((record["last_video_id"], record["failures"],
+                          record["last_error"]), ("v1", 1, "OSError"))
+
+    def fetch_updates(self, links, messages):
+        """Run fetch_updates with sync_links finishing with the link
+        results given and return the library it recorded from"""
+        queue = JobQueue(":memory:")
+        for url, (state, result) in links.items():
+            queue.add("link:" + url, "link", url, state=state, result=result)
+        library = Library(":memory:")
+        library.set_watermark("https://youtube.com/c/a", "v9")
+        with mock.patch("sync.sync_links",
+                        return_value=messages) as sync_links, \
+                mock.patch("pytube_code.download_library",
+                           return_value=library):
+            results = subscriptions.fetch_updates(480, 2, self.store,
+                                                  queue=queue)
+        sync_links.assert_called_once_with(
+            self.store.urls(stalest_first=True), 480, 2, incremental=True,
+            cancel=None, progress=None, queue=queue, processes=1)
+        self.assertEqual(results, messages)
+
+    def test_fetch_updates(self):
+        """Test every subscription is synced incrementally through the
+        job queue, stalest first, and how each went is recorded"""
+        for name in "ab":
+            self.store.add("https://youtube.com/c/" + name)
+        self.store.record_sync("https://youtube.com/c/a", "v0")
+        self.assertEqual(self.store.urls(stalest_first=True),
+                         ["https://youtube.com/c/b",
+                          "https://youtube.com/c/a"])
+        self.fetch_updates(
+            {"https://youtube.com/c/a": (
+                DONE, {"message": "Valid Channel url", "newest": "v9",
+                       "channel_url": "https://youtube.com/c/a",
+                       "failed_videos": []}),
+             "https://youtube.com/c/b": (FAILED, None)},
+            [("https://youtube.com/c/b", "Sync failed: OSError"),
+             ("https://youtube.com/c/a", "Valid Channel url")])
+        self.assertEqual(
+            self.store.get("https://youtube.com/c/a")["last_video_id"], "v9")
+        self.assertEqual(
+            self.store.get("https://youtube.com/c/b")["failures"], 1)
+
+    def test_failed_videos_recorded(self):
+        """Test a link whose uploads failed keeps its last video, as the
+        library's watermark was held back, and counts a failure"""
+        self.store.add("https://youtube.com/c/a")
+        self.store.record_sync("https://youtube.com/c/a", "v0")
+        self.fetch_updates(
+            {"https://youtube.com/c/a": (
+                DONE, {"message": "Valid Channel url", "newest": "v10",
+                       "channel_url": "https://youtube.com/c/a",
+                       "failed_videos": ["v10"]})},
+            [("https://youtube.com/c/a", "Valid Channel url")])
+        record = self.store.get("https://youtube.com/c/a")
+        self.assertEqual((record["last_video_id"], record["failures"],
+                          record["last_error"]),
+                         ("v0", 1, "1 of its videos failed to download"))
@@ -0,0 +1,199 @@
+import itertools
+import os
+import tempfile
+import threading
+from unittest import TestCase, mock
+from pytube import extract
+import pytube_code as pytc
+import sync
+from jobs import JobQueue, DONE, FAILED
+from library import Library
+from metrics import MemorySink, configure_metrics
+
+
+def watch_url(video_id):
+    return "https://www.youtube.com/watch?v=" + video_id
+
+
+def ids(*numbers):
+    return [f"video{number:06d}" for number in numbers]
+
+
+CHANNEL = "https://www.youtube.com/@a"
+
+
+class FakeSite:
+    """Stands in for the pytube_code classes, with one channel whose
+    playlist shares videos with its uploads"""
+    def __init__(self):
+        self.uploads = ids(1, 2, 3)
+        self.playlists = {"PLmix": ("Mix", ids(2, 4))}
+        self.downloads = []
+        self.fail = set()
+        self.after_download = None
+        site = self
+
+        class Channel:
+            def __init__(self, url):
+                if url != CHANNEL:
+                    raise pytc.InvalidChannelException
+                self.channel_url = url
+                self.video_urls = [watch_url(i) for i in site.uploads]
+                self.playlist_urls = [
+                    "https://www.youtube.com/playlist?list=" + playlist_id
+                    for playlist_id in site.playlists]
+
+            def trimmed(self, video_id):
+                return itertools.takewhile(
+                    lambda url: extract.video_id(url) != video_id,
+                    self.video_urls)
+
+        class Playlist:
+            def __init__(self, url):
+                if "list=" not in url:
+                    raise pytc.InvalidPlaylistException
+                self.playlist_id = url.split("list=")[1]
+                self.clean_title, videos = site.playlists[self.playlist_id]
+                self.video_urls = [watch_url(i) for i in videos]
+
+        class Video:
+            def __init__(self, url):
+                self.video_id = extract.video_id(url)
+
+            def download_video(self, max_res):
+                if self.video_id in site.fail:
+                    raise OSError("connection reset")
+                site.downloads.append(self.video_id)
+                if site.after_download is not None:
+                    site.after_download()
+                return "A/" + self.video_id + ".mp4"
+
+        self.classes = {"YDChannel": Channel, "YDPlaylist": Playlist,
+                        "YDVideo": Video}
+
+
+class TestSync(TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.site = FakeSite()
+        self.library = Library(":memory:")
+        self.queue = JobQueue(":memory:", max_attempts=2)
+        patches = [mock.patch.object(pytc, name, cls)
+                   for name, cls in self.site.classes.items()]
+        patches.append(mock.patch.object(pytc, "download_library",
+                                         return_value=self.library))
+        patches.append(mock.patch.object(
+            pytc, "PLAYLISTS_PATH", self.folder.name + "/Playlists/"))
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sync(self, **kwargs):
+        return sync.sync_links([CHANNEL], 720, queue=self.queue, **kwargs)
+
+    def test_each_video_downloaded_once(self):
+        """Test a video in the uploads and a playlist is downloaded once
+        and the playlist keeps its order"""
+        results = self.sync(max_workers=3)
+        self.assertEqual(results, [(CHANNEL, "Valid Channel url: " +
+                                    CHANNEL)])
+        self.assertEqual(sorted(self.site.downloads), ids(1, 2, 3, 4))
+        self.assertEqual(self.library.playlist_entries("PLmix"),
+                         ["A/video000002.mp4", "A/video000004.mp4"])
+        self.assertTrue(os.path.isfile(self.folder.name +
+                                       "/Playlists/Mix.txt"))
+        self.assertEqual(self.library.get_watermark(CHANNEL),
+                         "video000001")
+
+    def test_join_uses_started_settings(self):
+        """Test a joined worker downloads at the resolution the sync was
+        started with, and leaves a queue no sync was started on alone"""
+        queue = JobQueue(":memory:")
+        with mock.patch.object(sync, "run_jobs") as run_jobs:
+            self.assertEqual(sync.join_sync(2, queue=queue), {})
+            run_jobs.assert_not_called()
+            queue.set_settings({"max_res": 360, "incremental": False})
+            sync.join_sync(2, queue=queue)
+        run_jobs.assert_called_once_with(queue, 360, 2, False, None)
+
+    def test_interrupted_sync_resumes(self):
+        """Test a sync stopped partway carries on with only the jobs it
+        had not finished"""
+        cancel = threading.Event()
+        self.site.after_download = cancel.set
+        with self.assertRaises(pytc.DownloadCancelled):
+            self.sync(cancel=cancel)
+        self.assertEqual(self.site.downloads, ids(1))
+        self.assertIsNone(self.library.get_watermark(CHANNEL))
+
+        self.site.after_download = None
+        sink = MemorySink()
+        configure_metrics(sinks=[sink])
+        self.addCleanup(configure_metrics)
+        self.sync()
+        self.assertEqual(self.site.downloads, ids(1, 2, 3, 4))
+        self.assertTrue(any(record.get("name") == "sync.resumed"
+                            for record in sink.records))
+
+    def test_failed_video_holds_watermark(self):
+        """Test a video that keeps failing is tried max_attempts times
+        and the channel is checked again next sync"""
+        self.site.fail.add("video000003")
+        self.sync()
+        job = self.queue.get(sync.video_key("video000003"))
+        self.assertEqual((job["state"], job["attempts"]), (FAILED, 2))
+        self.assertIsNone(self.library.get_watermark(CHANNEL))
+        self.assertEqual(
+            self.queue.get(sync.link_key(CHANNEL))["result"]["failed_videos"],
+            ["video000003"])
+
+    def test_upload_queued_elsewhere_holds_watermark(self):
+        """Test an upload first queued by another link still holds the
+        channel's watermark back when it fails"""
+        self.queue.add(sync.video_key("video000003"), "video",
+                       watch_url("video000003"), parent="playlist:PLother")
+        self.site.fail.add("video000003")
+        self.sync()
+        self.assertEqual(
+            self.queue.get(sync.video_key("video000003"))["parent"],
+            "playlist:PLother")
+        self.assertIsNone(self.library.get_watermark(CHANNEL))
+
+    def test_progress(self):
+        """Test progress counts finished jobs out of every job queued"""
+        seen = []
+        self.sync(progress=lambda index, total, url: seen.append(
+            (index, total)))
+        self.assertEqual(seen[0], (0, 1))
+        self.assertEqual(seen[-1][1], 6)
+
+    def test_joined_worker_shares_jobs(self):
+        """Test a worker joining a sync from its own queue connection
+        takes some of the jobs and every video is still downloaded once"""
+        file_path = os.path.join(self.folder.name, "jobs.db")
+        started = JobQueue(file_path)
+        started.add(sync.link_key(CHANNEL), "link", CHANNEL)
+        started.set_settings({"max_res": 720, "incremental": True})
+        # The first two downloads wait for each other, so each worker
+        # must be running one
+        meeting = threading.Barrier(2, timeout=10)
+        self.site.after_download = lambda: (
+            len(self.site.downloads) <= 2 and meeting.wait())
+        patcher = mock.patch.object(sync, "POLL_SECONDS", 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        joined = threading.Thread(target=sync.join_sync,
+                                  args=(1, None, JobQueue(file_path)))
+        joined.start()
+        queue = JobQueue(file_path)
+        results = sync.sync_links([CHANNEL], 720, queue=queue)
+        joined.join()
+        self.assertEqual(results, [(CHANNEL, "Valid Channel url: " +
+                                    CHANNEL)])
+        self.assertEqual(sorted(self.site.downloads), ids(1, 2, 3, 4))
+        owners = {job["owner"] for job in queue.jobs(state=DONE)
+                  if job["owner"]}
+        self.assertEqual(len(owners), 2)
+        self.assertEqual(self.library.get_watermark(CHANNEL),
+                         "video000001")
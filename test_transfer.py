@@ -0,0 +1,289 @@
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+import transfer
+from metrics import MemorySink, configure_metrics
+
+VIDEO = bytes(range(256)) * 4000
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves VIDEO with Range support, cutting off the first response"""
+    requests_seen = []
+    cut_after = None
+    ranges_supported = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        start, end = 0, len(VIDEO) - 1
+        if "Range" in self.headers and RangeHandler.ranges_supported:
+            first, last = self.headers["Range"].split("=")[1].split("-")
+            start = int(first)
+            end = int(last) if last else end
+        RangeHandler.requests_seen.append(start)
+        body = VIDEO[start:end + 1]
+        self.send_response(206 if "Range" in self.headers and
+                           RangeHandler.ranges_supported else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if RangeHandler.cut_after is not None:
+            cut, RangeHandler.cut_after = RangeHandler.cut_after, None
+            self.wfile.write(body[:cut])
+            self.wfile.flush()
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownloadStream(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/video"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        RangeHandler.requests_seen = []
+        RangeHandler.ranges_supported = True
+        transfer.RETRY_DELAY = 0
+        self.folder = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.folder.name, "video.mp4")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_resumes_after_dropped_connection(self):
+        """Test a cut off transfer continues from the last byte written"""
+        RangeHandler.cut_after = 300000
+        transfer.download_stream(self.url, self.file_path, len(VIDEO),
+                                 max_segments=1)
+        with open(self.file_path, "rb") as f_hand:
+            self.assertEqual(f_hand.read(), VIDEO)
+        self.assertEqual(RangeHandler.requests_seen[0], 0)
+        self.assertGreater(RangeHandler.requests_seen[-1], 0)
+        self.assertFalse(os.path.exists(self.file_path + ".part"))
+
+    def test_retries_and_bytes_counted(self):
+        """Test a resumed transfer counts its retry and every byte"""
+        RangeHandler.cut_after = 300000
+        recorder = configure_metrics(sinks=[MemorySink()])
+        try:
+            transfer.download_stream(self.url, self.file_path, len(VIDEO),
+                                     max_segments=1)
+            counters = recorder.counters()
+        finally:
+            configure_metrics()
+        self.assertEqual(counters["transfer.retries"], 1)
+        self.assertEqual(counters["transfer.bytes"], len(VIDEO))
+
+    def test_resumes_existing_part_file(self):
+        """Test a .part file from an earlier run is continued"""
+        with open(self.file_path + ".part", "wb") as part:
+            part.write(VIDEO[:5000])
+        transfer._write_part_info(self.file_path + ".part.json", len(VIDEO))
+        transfer.download_stream(self.url, self.file_path, len(VIDEO))
+        self.assertEqual(RangeHandler.requests_seen, [5000])
+        with open(self.file_path, "rb") as f_hand:
+            self.assertEqual(f_hand.read(), VIDEO)
+
+    def test_part_file_of_other_stream_restarted(self):
+        """Test a .part file expecting a different size is thrown away"""
+        with open(self.file_path + ".part", "wb") as part:
+            part.write(b"x" * 5000)
+        transfer._write_part_info(self.file_path + ".part.json", 123)
+        transfer.download_stream(self.url, self.file_path, len(VIDEO),
+                                 max_segments=1)
+        self.assertEqual(RangeHandler.requests_seen, [0])
+        with open(self.file_path, "rb") as f_hand:
+            self.assertEqual(f_hand.read(), VIDEO)
+
+    def test_oversized_part_file_restarted(self):
+        """Test a .part file longer than the stream is thrown away instead
+        of failing every later attempt"""
+        with open(self.file_path + ".part", "wb") as part:
+            part.write(VIDEO + VIDEO[:5000])
+        transfer._write_part_info(self.file_path + ".part.json", len(VIDEO))
+        transfer.download_stream(self.url, self.file_path, len(VIDEO),
+                                 max_segments=1)
+        self.assertEqual(RangeHandler.requests_seen, [0])
+        with open(self.file_path, "rb") as f_hand:
+            self.assertEqual(f_hand.read(), VIDEO)
+
+    def test_same_file_downloaded_once_at_a_time(self):
+        """Test two downloads of one file at once both end with the whole
+        stream, the second finding it complete"""
+        errors = []
+
+        def download():
+            try:
+                transfer.download_stream(self.url, self.file_path,
+                                         len(VIDEO))
+            except transfer.TransferError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=download) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        with open(self.file_path, "rb") as f_hand:
+            self.assertEqual(f_hand.read(), VIDEO)
+        self.assertFalse(os.path.exists(self.file_path + ".part"))
+        self.assertEqual(transfer._TARGET_LOCKS, {})
+
+    def test_cancelled_between_chunks(self):
+        """Test a cancelled transfer stops partway, keeping its .part file,
+        and the next attempt resumes it"""
+        class CancelAfter:
+            """Reports being set once it has been checked enough times"""
+            checks = 0
+
+            def is_set(self):
+                self.checks += 1
+                return self.checks > 3
+
+        with self.assertRaises(transfer.TransferCancelled):
+            transfer.download_stream(self.url, self.file_path, len(VIDEO),
+                                     max_segments=1, cancel=CancelAfter())
+        self.assertFalse(os.path.exists(self.file_path))
+        self.assertGreater(os.path.getsize(self.file_path + ".part"), 0)
+        transfer.download_stream(self.url, self.file_path, len(VIDEO),
+                                 max_segments=1)
+        self.assertGreater(RangeHandler.requests_seen[-1], 0)
+        with open(self.file_path, "rb") as f_hand:
+            self.assertEqual(f_hand.read(), VIDEO)
+
+    def test_complete_file_skipped(self):
+        """Test nothing is fetched when the file is already complete"""
+        with open(self.file_path, "wb") as f_hand:
+            f_hand.write(VIDEO)
+        transfer.download_stream(self.url, self.file_path, len(VIDEO))
+        self.assertEqual(RangeHandler.requests_seen, [])
+
+
+class TestSegmentedDownload(TestDownloadStream):
+    def setUp(self):
+        super().setUp()
+        self.min_segment_size = transfer.MIN_SEGMENT_SIZE
+        transfer.MIN_SEGMENT_SIZE = len(VIDEO) // 4
+
+    def tearDown(self):
+        transfer.MIN_SEGMENT_SIZE = self.min_segment_size
+        super().tearDown()
+
+    def test_segment_count(self):
+        """Test the number of segments follows the stream size"""
+        self.assertEqual(transfer.segment_count(0), 1)
+        self.assertEqual(transfer.segment_count(len(VIDEO) // 2), 2)
+        self.assertEqual(transfer.segment_count(len(VIDEO) * 100), 8)
+
+    def test_segments_fetched_in_parallel(self):
+        """Test each segment is fetched with its own range request"""
+        transfer.download_stream(self.url, self.file_path, len(VIDEO))
+        with open(self.file_path, "rb") as f_hand:
+            self.assertEqual(f_hand.read(), VIDEO)
+        self.assertEqual(sorted(RangeHandler.requests_seen),
+                         [len(VIDEO) * i // 4 for i in range(4)])
+
+    def test_segmented_resume(self):
+        """Test only the unfinished part of each segment is fetched"""
+        with open(self.file_path + ".part", "wb") as part:
+            part.write(VIDEO[:100])
+            part.truncate(len(VIDEO))
+        half = len(VIDEO) // 2
+        transfer._write_part_info(self.file_path + ".part.json", len(VIDEO),
+                                  [[0, half - 1, 100],
+                                   [half, len(VIDEO) - 1, 0]])
+        transfer.download_stream(self.url, self.file_path, len(VIDEO))
+        self.assertEqual(sorted(RangeHandler.requests_seen), [100, half])
+        with open(self.file_path, "rb") as f_hand:
+            self.assertEqual(f_hand.read(), VIDEO)
+
+    def test_falls_back_without_range_support(self):
+        """Test a server that ignores ranges gets one plain request"""
+        RangeHandler.ranges_supported = False
+        transfer.download_stream(self.url, self.file_path, len(VIDEO))
+        with open(self.file_path, "rb") as f_hand:
+            self.assertEqual(f_hand.read(), VIDEO)
+
+
+class TestTransferScheduler(TestCase):
+    def test_rate_limit(self):
+        """Test transfers are held to the bytes per second budget"""
+        shared = transfer.TransferScheduler(bytes_per_second=100000)
+        start = time.monotonic()
+        for _ in range(30):
+            shared.consume("job", 10000)
+        # 100000 bytes come from the full bucket, the rest at the rate
+        self.assertGreater(time.monotonic() - start, 1.5)
+
+    def test_jobs_share_fairly(self):
+        """Test a job with many connections does not starve another"""
+        shared = transfer.TransferScheduler(bytes_per_second=200000)
+        shared.consume("warmup", 200000)
+        sent = {"big": 0, "small": 0}
+        stop = time.monotonic() + 1
+
+        def run(job):
+            while time.monotonic() < stop:
+                shared.consume(job, 5000)
+                sent[job] += 5000
+
+        threads = [threading.Thread(target=run, args=("big",))
+                   for _ in range(4)]
+        threads.append(threading.Thread(target=run, args=("small",)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLess(abs(sent["big"] - sent["small"]),
+                        0.3 * (sent["big"] + sent["small"]))
+
+    def test_limits_from_environment(self):
+        """Test the shared scheduler's limits can be set from outside"""
+        self.assertEqual(transfer.parse_rate("500k"), 500 * 1024)
+        self.assertEqual(transfer.parse_rate("1.5M"), 1536 * 1024)
+        self.assertIsNone(transfer.parse_rate("0"))
+        self.assertRaises(ValueError, transfer.parse_rate, "fast")
+        shared = transfer.scheduler_from_environment({
+            transfer.MAX_RATE_VARIABLE: "2M",
+            transfer.CONNECTIONS_VARIABLE: "3"})
+        self.assertEqual((shared.bytes_per_second,
+                          shared.connections_per_host), (2 * 1024 ** 2, 3))
+        shared = transfer.scheduler_from_environment({})
+        self.assertEqual((shared.bytes_per_second,
+                          shared.connections_per_host),
+                         (None, transfer.CONNECTIONS_PER_HOST))
+
+    def test_connections_per_host(self):
+        """Test no more than the cap are open to one host at once"""
+        shared = transfer.TransferScheduler(connections_per_host=2)
+        open_now = []
+        most = []
+        lock = threading.Lock()
+
+        def run():
+            with shared.connection("https://host.example/video"):
+                with lock:
+                    open_now.append(1)
+                    most.append(len(open_now))
+                time.sleep(0.05)
+                with lock:
+                    open_now.pop()
+
+        threads = [threading.Thread(target=run) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(most), 2)
@@ -0,0 +1,485 @@
+"""This module is where video streams are transferred to disk"""
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import requests
+
+import http_client
+from metrics import metrics
+
+# Bytes read from the connection at a time
+CHUNK_SIZE = 64 * 1024
+
+# Attempts made in a row without any progress before giving up
+MAX_RETRIES = 5
+
+# Seconds to wait for the server before retrying
+TIMEOUT = 30
+
+# Seconds waited after the first attempt that made no progress
+RETRY_DELAY = 0.5
+
+# Most connections used to download one stream
+MAX_SEGMENTS = 8
+
+# Smallest byte range given its own connection
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+
+# Chunks written between saves of a segmented download's progress
+SAVE_EVERY = 16
+
+# Most connections open to one host at once across every transfer
+CONNECTIONS_PER_HOST = 8
+
+# Environment variables read for the shared scheduler's limits, so the
+# window and the command line can be kept to a budget, such as
+# YOUTUBE_DOWNLOADS_MAX_RATE=2M during working hours
+MAX_RATE_VARIABLE = "YOUTUBE_DOWNLOADS_MAX_RATE"
+CONNECTIONS_VARIABLE = "YOUTUBE_DOWNLOADS_CONNECTIONS_PER_HOST"
+
+_RATE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+class TransferError(Exception):
+    """Raised when a stream could not be fully downloaded"""
+
+
+class TransferCancelled(Exception):
+    """Raised when a transfer is stopped by its cancel event, leaving the
+    .part file to resume from"""
+
+
+class TransferScheduler:
+    """Shares bandwidth and connections between every running transfer.
+
+    A token bucket holds all transfers to one bytes per second budget.
+    Waiting transfers are served in order of a virtual finish time, so
+    each active job gets an equal share however many connections it
+    has open. Connections to one host are capped with a semaphore.
+
+    Keyword arguments:
+    bytes_per_second -- total budget, None for no limit
+    connections_per_host -- most connections open to one host at once
+    """
+    def __init__(self, bytes_per_second=None,
+                 connections_per_host=CONNECTIONS_PER_HOST):
+        """Create a scheduler with a full token bucket."""
+        self.bytes_per_second = bytes_per_second
+        self.connections_per_host = connections_per_host
+        self._condition = threading.Condition()
+        self._tokens = bytes_per_second or 0
+        self._refilled_at = time.monotonic()
+        self._virtual_time = 0
+        self._job_tags = {}
+        self._waiting = []
+        self._order = itertools.count()
+        self._host_lock = threading.Lock()
+        self._host_slots = {}
+
+    @contextmanager
+    def connection(self, url):
+        """Hold one of the connection slots for url's host"""
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            slots = self._host_slots.get(host)
+            if slots is None:
+                slots = threading.BoundedSemaphore(self.connections_per_host)
+                self._host_slots[host] = slots
+        with slots:
+            yield
+
+    def consume(self, job, nbytes):
+        """Wait until nbytes may be transferred for job"""
+        if not self.bytes_per_second:
+            return
+        with self._condition:
+            tag = max(self._virtual_time,
+                      self._job_tags.get(job, 0)) + nbytes
+            self._job_tags[job] = tag
+            entry = (tag, next(self._order))
+            heapq.heappush(self._waiting, entry)
+            while True:
+                self._refill()
+                if self._waiting[0] == entry and self._tokens > 0:
+                    # Tokens may go negative so chunks of any size pass
+                    self._tokens -= nbytes
+                    heapq.heappop(self._waiting)
+                    self._virtual_time = tag
+                    self._condition.notify_all()
+                    return
+                wait = 0.05
+                if self._tokens <= 0:
+                    wait = -self._tokens / self.bytes_per_second + 0.001
+                self._condition.wait(wait)
+
+    def finish(self, job):
+        """Forget a job that will not transfer anything else"""
+        with self._condition:
+            self._job_tags.pop(job, None)
+
+    def _refill(self):
+        """Add the tokens earned since the last refill, up to one second"""
+        now = time.monotonic()
+        self._tokens = min(self.bytes_per_second, self._tokens + (
+            now - self._refilled_at) * self.bytes_per_second)
+        self._refilled_at = now
+
+
+def parse_rate(text):
+    """Return the bytes per second of a rate such as "500K" or "2M", or
+    None for "0", which means no limit
+
+    Raises ValueError if text is not a rate.
+    """
+    text = text.strip().upper()
+    unit = _RATE_UNITS.get(text[-1:], 1)
+    if unit != 1:
+        text = text[:-1]
+    rate = float(text) * unit
+    if rate < 0:
+        raise ValueError("rate cannot be negative: " + text)
+    return int(rate) or None
+
+
+def scheduler_from_environment(environ=None):
+    """Return a scheduler using the limits set in the environment, or
+    the defaults for those not set
+
+    Keyword arguments:
+    environ -- mapping to read the variables from, os.environ if None
+    """
+    if environ is None:
+        environ = os.environ
+    rate = environ.get(MAX_RATE_VARIABLE)
+    connections = environ.get(CONNECTIONS_VARIABLE)
+    return TransferScheduler(
+        parse_rate(rate) if rate else None,
+        int(connections) if connections else CONNECTIONS_PER_HOST)
+
+
+_SCHEDULER = scheduler_from_environment()
+
+
+def scheduler():
+    """Return the scheduler shared by every transfer"""
+    return _SCHEDULER
+
+
+def configure_scheduler(bytes_per_second=None,
+                        connections_per_host=CONNECTIONS_PER_HOST):
+    """Replace the shared scheduler with one using these limits"""
+    global _SCHEDULER
+    _SCHEDULER = TransferScheduler(bytes_per_second, connections_per_host)
+    return _SCHEDULER
+
+
+def fetch(url, job=None, timeout=TIMEOUT):
+    """Return the body of a small file such as a thumbnail, fetched
+    through the shared scheduler"""
+    shared = scheduler()
+    with shared.connection(url):
+        response = http_client.client().get(url, timeout=timeout)
+        response.raise_for_status()
+        shared.consume(job or url, len(response.content))
+    shared.finish(job or url)
+    return response.content
+
+
+def _read_part_info(info_path):
+    """Return what was recorded about a partial file, or None"""
+    try:
+        with open(info_path, "r", encoding="utf-8") as f_hand:
+            return json.load(f_hand)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_part_info(info_path, expected_size, segments=None):
+    """Record the size a partial file will have once it is complete and,
+    for segmented downloads, how far each segment has got"""
+    info = {"expected_size": expected_size}
+    if segments is not None:
+        info["segments"] = segments
+    with open(info_path + ".tmp", "w", encoding="utf-8") as f_hand:
+        json.dump(info, f_hand)
+    os.replace(info_path + ".tmp", info_path)
+
+
+def segment_count(expected_size, max_segments=MAX_SEGMENTS):
+    """Pick how many connections to split a stream of this size over"""
+    if not expected_size:
+        return 1
+    return max(1, min(max_segments, expected_size // MIN_SEGMENT_SIZE))
+
+
+class _RangeNotSupported(Exception):
+    """Raised when a server answers a Range request with the whole file"""
+
+
+# Lock and number of users of each file being downloaded, by absolute path
+_TARGET_LOCKS = {}
+_TARGET_LOCKS_LOCK = threading.Lock()
+
+
+@contextmanager
+def _target_lock(file_path):
+    """Hold the lock of one download target, so two downloads of the
+    same video never append to the same .part file"""
+    key = os.path.abspath(file_path)
+    with _TARGET_LOCKS_LOCK:
+        entry = _TARGET_LOCKS.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _TARGET_LOCKS_LOCK:
+            entry[1] -= 1
+            if not entry[1]:
+                del _TARGET_LOCKS[key]
+
+
+def download_stream(url, file_path, expected_size, max_retries=MAX_RETRIES,
+                    max_segments=MAX_SEGMENTS, job=None, cancel=None):
+    """Download url to file_path, resuming an earlier partial transfer.
+
+    Bytes are written to file_path + ".part" and the finished file is
+    renamed into place, so file_path only ever holds a complete video.
+    A dropped connection continues with an HTTP Range request from the
+    last byte written instead of starting again. Large streams of a
+    known size are split into byte ranges fetched over several
+    connections at once.
+
+    Keyword arguments:
+    url -- string of the stream url
+    file_path -- string of where the finished file is saved
+    expected_size -- int of the stream's size in bytes, 0 if unknown
+    max_retries -- attempts in a row without progress before failing
+    max_segments -- most connections used for one stream, 1 for one
+    job -- key the scheduler shares bandwidth by, defaults to file_path
+    cancel -- threading.Event that stops the transfer between chunks once
+        set, raising TransferCancelled
+    """
+    # A second download of the same file waits, then finds it complete
+    with _target_lock(file_path):
+        return _download_stream(url, file_path, expected_size, max_retries,
+                                max_segments, job, cancel)
+
+
+def _download_stream(url, file_path, expected_size, max_retries,
+                     max_segments, job, cancel):
+    part_path = file_path + ".part"
+    info_path = part_path + ".json"
+
+    if os.path.isfile(file_path) and (
+            not expected_size or os.path.getsize(file_path) == expected_size):
+        return file_path
+
+    folder = os.path.dirname(file_path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+
+    # A partial file from a different stream cannot be continued, nor
+    # one already past the end of this stream
+    info = _read_part_info(info_path) if os.path.isfile(part_path) else None
+    if (info is None or info.get("expected_size") != expected_size or
+            expected_size and os.path.getsize(part_path) > expected_size):
+        info = None
+        if os.path.isfile(part_path):
+            os.remove(part_path)
+
+    job = job or file_path
+    count = segment_count(expected_size, max_segments)
+    try:
+        if (info is None and count > 1 or
+                info is not None and "segments" in info):
+            try:
+                _download_segments(url, part_path, info_path, expected_size,
+                                   count, max_retries, info, job, cancel)
+            except _RangeNotSupported:
+                os.remove(part_path)
+                _write_part_info(info_path, expected_size)
+                _download_sequential(url, file_path, expected_size,
+                                     max_retries, job, cancel)
+        else:
+            if info is None:
+                _write_part_info(info_path, expected_size)
+            _download_sequential(url, file_path, expected_size, max_retries,
+                                 job, cancel)
+    finally:
+        scheduler().finish(job)
+
+    written = os.path.getsize(part_path)
+    if expected_size and written != expected_size:
+        raise TransferError(f"{file_path} is {written} bytes, "
+                            f"expected {expected_size}")
+    os.replace(part_path, file_path)
+    os.remove(info_path)
+    return file_path
+
+
+def _check_cancelled(cancel):
+    """Raise TransferCancelled if cancel has been set"""
+    if cancel is not None and cancel.is_set():
+        raise TransferCancelled
+
+
+def _download_sequential(url, file_path, expected_size, max_retries, job,
+                         cancel):
+    """Fetch a stream over one connection into its .part file"""
+    part_path = file_path + ".part"
+    failures = 0
+    while True:
+        offset = os.path.getsize(part_path) if os.path.isfile(
+            part_path) else 0
+        if expected_size and offset >= expected_size:
+            break
+        error = None
+        try:
+            if _transfer_range(url, part_path, offset, expected_size, job,
+                               cancel):
+                break
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            error = e
+
+        written = os.path.getsize(part_path) if os.path.isfile(
+            part_path) else 0
+        failures = 0 if written > offset else failures + 1
+        if failures > max_retries:
+            raise TransferError(
+                f"Gave up on {file_path} at byte {written}") from error
+        metrics().count("transfer.retries")
+        if failures:
+            time.sleep(min(RETRY_DELAY * 2 ** failures, 30))
+
+
+def _download_segments(url, part_path, info_path, expected_size, count,
+                       max_retries, info, job, cancel):
+    """Fetch byte ranges of a stream in parallel, writing each in place
+    in a preallocated .part file"""
+    if info is not None:
+        segments = info["segments"]
+    else:
+        bounds = [expected_size * i // count for i in range(count + 1)]
+        # [first byte, last byte, bytes written so far]
+        segments = [[bounds[i], bounds[i + 1] - 1, 0] for i in range(count)]
+        with open(part_path, "wb") as part:
+            part.truncate(expected_size)
+        _write_part_info(info_path, expected_size, segments)
+
+    lock = threading.Lock()
+
+    def save_progress():
+        with lock:
+            _write_part_info(info_path, expected_size, segments)
+
+    def fetch(segment):
+        failures = 0
+        while segment[0] + segment[2] <= segment[1]:
+            done = segment[2]
+            error = None
+            try:
+                _transfer_segment(url, part_path, segment, save_progress,
+                                  job, cancel)
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+            failures = 0 if segment[2] > done else failures + 1
+            if failures > max_retries:
+                raise TransferError(
+                    f"Gave up on {part_path} at byte "
+                    f"{segment[0] + segment[2]}") from error
+            if segment[0] + segment[2] <= segment[1]:
+                metrics().count("transfer.retries")
+            if failures:
+                time.sleep(min(RETRY_DELAY * 2 ** failures, 30))
+
+    pending = [segment for segment in segments
+               if segment[0] + segment[2] <= segment[1]]
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            list(executor.map(fetch, pending))
+    save_progress()
+
+
+def _transfer_segment(url, part_path, segment, save_progress, job,
+                      cancel):
+    """Write the rest of one segment into its place in the .part file"""
+    start = segment[0] + segment[2]
+    headers = {"Range": f"bytes={start}-{segment[1]}"}
+    shared = scheduler()
+    with shared.connection(url), http_client.client().get(
+            url, headers=headers, stream=True,
+            timeout=TIMEOUT) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise _RangeNotSupported
+        remaining = segment[1] + 1 - start
+        unsaved = 0
+        with open(part_path, "r+b") as part:
+            part.seek(start)
+            try:
+                for i, chunk in enumerate(
+                        response.iter_content(CHUNK_SIZE)):
+                    _check_cancelled(cancel)
+                    # Never write past the end of this segment
+                    chunk = chunk[:remaining]
+                    shared.consume(job, len(chunk))
+                    part.write(chunk)
+                    remaining -= len(chunk)
+                    unsaved += len(chunk)
+                    # Progress is only recorded for bytes already flushed
+                    if i % SAVE_EVERY == SAVE_EVERY - 1 or not remaining:
+                        part.flush()
+                        segment[2] += unsaved
+                        unsaved = 0
+                        save_progress()
+                    if not remaining:
+                        break
+                part.flush()
+                segment[2] += unsaved
+            finally:
+                metrics().count("transfer.bytes",
+                                segment[1] + 1 - start - remaining)
+    save_progress()
+
+
+def _transfer_range(url, part_path, offset, expected_size, job, cancel):
+    """Append the stream from offset to the partial file.
+
+    Returns True once the server has sent everything it has.
+    """
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    shared = scheduler()
+    with shared.connection(url), http_client.client().get(
+            url, headers=headers, stream=True,
+            timeout=TIMEOUT) as response:
+        if response.status_code == 416:
+            # Nothing left past offset
+            return True
+        response.raise_for_status()
+        mode = "ab"
+        if offset and response.status_code != 206:
+            # The server ignored the range and is sending the whole file
+            mode = "wb"
+        received = 0
+        with open(part_path, mode) as part:
+            try:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    _check_cancelled(cancel)
+                    shared.consume(job, len(chunk))
+                    part.write(chunk)
+                    received += len(chunk)
+            finally:
+                metrics().count("transfer.bytes", received)
+    if not expected_size:
+        return True
+    return os.path.getsize(part_path) >= expected_size